@@ -1,33 +1,100 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+import logging
 import os
+from typing import AsyncIterator, Dict, List
+from llm_cache import Masker, default_llm_cache, normalized_key
+from llm_executor import estimate_tokens
+from metrics import LLM_REQUESTS, record_tokens, stage
 
-def analyze_deprecated_apis(pluto_data: list) -> str:
-    # Check if OpenAI API key is set
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        return "⚠️ OpenAI API key not found. Please set OPENAI_API_KEY environment variable to get AI suggestions."
-    
-    # Handle empty results
-    if not pluto_data or len(pluto_data) == 0:
-        return "✅ No deprecated Kubernetes APIs found! Your manifests are up to date."
-    
+logger = logging.getLogger(__name__)
+
+MISSING_KEY_MESSAGE = "⚠️ OpenAI API key not found. Please set OPENAI_API_KEY environment variable to get AI suggestions."
+NO_FINDINGS_MESSAGE = "✅ No deprecated Kubernetes APIs found! Your manifests are up to date."
+
+MODEL = "gpt-3.5-turbo"
+# Bump when build_prompt changes so cached plans are not replayed for the new prompt
+PROMPT_VERSION = "2"
+
+# Files listed per API in the prompt table
+MAX_FILES_PER_API = 5
+# Reports with more distinct APIs than this get full detail for the most urgent ones only
+DETAIL_APIS = 8
+
+def _extract_items(pluto_data) -> list:
+    """Return the list of findings from pluto output (dict with 'items', list or single item)."""
+    if not pluto_data:
+        return []
     # Check if pluto_data has the expected structure
     if isinstance(pluto_data, dict) and 'items' in pluto_data:
-        items = pluto_data['items']
+        return pluto_data['items']
     elif isinstance(pluto_data, list):
-        items = pluto_data
-    else:
-        items = [pluto_data]
-    
-    if not items:
-        return "✅ No deprecated Kubernetes APIs found! Your manifests are up to date."
-    
+        return pluto_data
+    return [pluto_data]
+
+def _target_version(pluto_data) -> str:
+    if isinstance(pluto_data, dict):
+        return (pluto_data.get('target-versions') or {}).get('k8s') or ""
+    return ""
+
+def summarize_findings(items: list) -> List[Dict]:
+    """
+    Group findings by (apiVersion, kind, replacement) with a count and the files they
+    occur in, most urgent first (already removed, then most frequent).
+    """
+    groups = {}
+    for item in items:
+        api = (item.get('api') or {}) if isinstance(item, dict) else {}
+        key = (api.get('version', ""), api.get('kind', ""), api.get('replacement-api', ""))
+        group = groups.setdefault(key, {
+            "apiVersion": key[0], "kind": key[1], "replacement": key[2],
+            "deprecatedIn": api.get('deprecated-in', ""), "removedIn": api.get('removed-in', ""),
+            "removed": False, "count": 0, "files": []
+        })
+        group["count"] += 1
+        if isinstance(item, dict):
+            group["removed"] = group["removed"] or bool(item.get('removed'))
+            if item.get('filePath') and item['filePath'] not in group["files"]:
+                group["files"].append(item['filePath'])
+    return sorted(groups.values(), key=lambda group: (not group["removed"], -group["count"], group["kind"]))
+
+def _format_files(files: List[str]) -> str:
+    shown = ", ".join(files[:MAX_FILES_PER_API])
+    if len(files) > MAX_FILES_PER_API:
+        shown += f" (+{len(files) - MAX_FILES_PER_API} more)"
+    return shown or "-"
+
+def format_findings(items: list, target_version: str = "") -> str:
+    """Render findings as a compact table, one row per deprecated API instead of one per resource."""
+    groups = summarize_findings(items)
+    lines = [f"{len(items)} resource(s) using {len(groups)} deprecated API(s)"
+             + (f", target Kubernetes version {target_version}" if target_version else "") + ":", ""]
+    lines.append("| # | API | Kind | Replacement | Deprecated in | Removed in | Removed at target | Count | Files |")
+    lines.append("|---|---|---|---|---|---|---|---|---|")
+    for number, group in enumerate(groups[:DETAIL_APIS], 1):
+        lines.append(
+            f"| {number} | {group['apiVersion'] or '?'} | {group['kind'] or '?'} | {group['replacement'] or 'none'} "
+            f"| {group['deprecatedIn'] or '-'} | {group['removedIn'] or '-'} | {'yes' if group['removed'] else 'no'} "
+            f"| {group['count']} | {_format_files(group['files'])} |"
+        )
+    rest = groups[DETAIL_APIS:]
+    if rest:
+        # Summarize-then-detail: the long tail is listed briefly and only summarized in the plan
+        lines.append("")
+        lines.append(f"Also found ({len(rest)} more API(s), summarize these in one line each):")
+        lines.extend(
+            f"- {group['kind']} {group['apiVersion']} -> {group['replacement'] or 'none'} "
+            f"({group['count']} resource(s), removed in {group['removedIn'] or '-'})"
+            for group in rest
+        )
+    return "\n".join(lines)
+
+def build_prompt(items: list, target_version: str = "") -> str:
     # Create a detailed, customized prompt for Kubernetes API migration
-    prompt = f"""
+    return f"""
 You are a senior Kubernetes DevOps engineer with 10+ years of experience in cluster migrations and API upgrades. Your task is to provide expert guidance for migrating deprecated Kubernetes APIs.
 
 **DEPRECATED APIS DETECTED:**
-{items}
+{format_findings(items, target_version)}
 
 **REQUIRED OUTPUT FORMAT:**
 
@@ -108,16 +175,150 @@ kubectl api-resources --api-group=extensions
 
 Make this migration plan as practical and actionable as possible. Focus on immediate steps that can be executed right away.
 """
+
+def _completion_args(prompt: str) -> dict:
+    return {
+        "model": MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.1,  # Lower temperature for more consistent output
+        "max_tokens": 2500
+    }
+
+def _masked_request(items: list, target_version: str = ""):
+    """
+    Mask resource names, namespaces and file paths in the findings, so that plans for
+    findings of the same shape are served from the LLM response cache.
+    Returns (masker, cache key, prompt).
+    """
+    with stage("prompt"):
+        masker = Masker()
+        prompt = build_prompt(masker.mask_findings(items), target_version)
+        return masker, normalized_key(prompt, "analysis", MODEL, PROMPT_VERSION), prompt
+
+def _record_usage(response, prompt: str, plan: str) -> None:
+    """Count the tokens of a completed call, estimated when the response carries no usage."""
+    LLM_REQUESTS.inc(outcome="ok")
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        record_tokens(usage.prompt_tokens, usage.completion_tokens)
+    else:
+        record_tokens(estimate_tokens(prompt), estimate_tokens(plan))
+
+def _record_failure(e: Exception) -> str:
+    LLM_REQUESTS.inc(outcome="error")
+    logger.warning("OpenAI call failed: %s", e)
+    return f"⚠️ Error calling OpenAI API: {str(e)}"
+
+def prompt_tokens(pluto_data) -> int:
+    """Estimated prompt tokens of the analysis request for these findings (0 if no request is made)."""
+    items = _extract_items(pluto_data)
+    if not items:
+        return 0
+    return estimate_tokens(_masked_request(items, _target_version(pluto_data))[2])
+
+def analyze_deprecated_apis(pluto_data: list) -> str:
+    # Check if OpenAI API key is set
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return MISSING_KEY_MESSAGE
+    
+    items = _extract_items(pluto_data)
+    if not items:
+        return NO_FINDINGS_MESSAGE
+    
+    masker, key, prompt = _masked_request(items, _target_version(pluto_data))
+    cache = default_llm_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return masker.unmask_text(cached)
     
     try:
         client = OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,  # Lower temperature for more consistent output
-            max_tokens=2500
-        )
-        return response.choices[0].message.content
+        with stage("llm"):
+            response = client.chat.completions.create(**_completion_args(prompt))
+        plan = response.choices[0].message.content
+        _record_usage(response, prompt, plan)
+        cache.set(key, plan)
+        return masker.unmask_text(plan)
     except Exception as e:
-        return f"⚠️ Error calling OpenAI API: {str(e)}"
+        return _record_failure(e)
+
+_async_client = None
 
+def _get_async_client(api_key: str) -> AsyncOpenAI:
+    # Share one client (and its connection pool) across requests
+    global _async_client
+    if _async_client is None or _async_client.api_key != api_key:
+        _async_client = AsyncOpenAI(api_key=api_key)
+    return _async_client
+
+async def analyze_deprecated_apis_async(pluto_data: list) -> str:
+    """Non-blocking variant of analyze_deprecated_apis for use inside the event loop."""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return MISSING_KEY_MESSAGE
+    
+    items = _extract_items(pluto_data)
+    if not items:
+        return NO_FINDINGS_MESSAGE
+    
+    masker, key, prompt = _masked_request(items, _target_version(pluto_data))
+    
+    async def complete() -> str:
+        response = await _get_async_client(api_key).chat.completions.create(**_completion_args(prompt))
+        plan = response.choices[0].message.content
+        _record_usage(response, prompt, plan)
+        return plan
+    
+    try:
+        # Cache hits are timed too, so the llm stage shows how much the cache saves
+        with stage("llm"):
+            plan = await default_llm_cache().fetch(key, complete)
+        return masker.unmask_text(plan)
+    except Exception as e:
+        return _record_failure(e)
+
+async def stream_deprecated_apis(pluto_data: list) -> AsyncIterator[str]:
+    """
+    Streaming variant of analyze_deprecated_apis_async: yields the plan in pieces as the
+    model generates it. Errors are yielded as a final piece starting with "⚠️".
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        yield MISSING_KEY_MESSAGE
+        return
+    
+    items = _extract_items(pluto_data)
+    if not items:
+        yield NO_FINDINGS_MESSAGE
+        return
+    
+    masker, key, prompt = _masked_request(items, _target_version(pluto_data))
+    cache = default_llm_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        yield masker.unmask_text(cached)
+        return
+    
+    plan = []
+    
+    async def deltas() -> AsyncIterator[str]:
+        stream = await _get_async_client(api_key).chat.completions.create(**_completion_args(prompt), stream=True)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                plan.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+    
+    try:
+        with stage("llm"):
+            async for piece in masker.unmask_stream(deltas()):
+                yield piece
+    except Exception as e:
+        # Keep the warning apart from a partially streamed plan
+        separator = "\n\n" if plan else ""
+        yield separator + _record_failure(e)
+        return
+    # Streamed responses carry no usage, so both sides are estimated
+    _record_usage(None, prompt, "".join(plan))
+    # Only complete plans are cached
+    cache.set(key, "".join(plan))
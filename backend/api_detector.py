@@ -0,0 +1,154 @@
+import logging
+import yaml_backend
+import manifest_scanner
+import manifest_renderer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from api_rules import default_rules
+
+logger = logging.getLogger(__name__)
+
+YAML_SUFFIXES = (".yaml", ".yml")
+
+
+def normalize_version(version: Optional[str]) -> Optional[str]:
+    """Normalize a Kubernetes version such as '1.25' or 'v1.25.0' to 'v1.25.0'."""
+    if not version:
+        return None
+    version = version.strip().lstrip("vV")
+    parts = version.split(".")
+    while len(parts) < 3:
+        parts.append("0")
+    return "v" + ".".join(parts[:3])
+
+
+def _version_tuple(version: str) -> Tuple[int, ...]:
+    try:
+        return tuple(int(part) for part in version.lstrip("v").split("."))
+    except ValueError:
+        return (0,)
+
+
+def _version_reached(target: Optional[str], version: str) -> bool:
+    # Without a target version every known deprecation/removal applies
+    if not version:
+        return False
+    if target is None:
+        return True
+    return _version_tuple(target) >= _version_tuple(version)
+
+
+def _iter_yaml_files(path: Path) -> Iterator[Path]:
+    if path.is_file():
+        yield path
+        return
+    for candidate in sorted(path.rglob("*")):
+        if candidate.suffix in YAML_SUFFIXES and candidate.is_file():
+            yield candidate
+
+
+def _iter_resources(doc) -> Iterator[Dict]:
+    """Yield Kubernetes objects from a document, unwrapping `kind: List` containers."""
+    if not isinstance(doc, dict):
+        return
+    if doc.get("kind", "").endswith("List") and isinstance(doc.get("items"), list):
+        for item in doc["items"]:
+            yield from _iter_resources(item)
+        return
+    yield doc
+
+
+def check_resource(doc: Dict, file_path: str, target_version: Optional[str] = None) -> Optional[Dict]:
+    """Return a pluto-style item for a deprecated resource, or None if it is current."""
+    api_version = doc.get("apiVersion", "")
+    kind = doc.get("kind", "")
+    rule = default_rules().lookup(api_version, kind)
+    if rule is None:
+        return None
+
+    deprecated = _version_reached(target_version, rule.deprecated_in)
+    removed = _version_reached(target_version, rule.removed_in)
+    # Like pluto, only report APIs that are deprecated or removed in the target
+    if not deprecated and not removed:
+        return None
+
+    metadata = doc.get("metadata") or {}
+    return {
+        "name": metadata.get("name", ""),
+        "filePath": file_path,
+        "namespace": metadata.get("namespace", ""),
+        "api": {
+            "version": api_version,
+            "kind": kind,
+            "deprecated-in": rule.deprecated_in,
+            "removed-in": rule.removed_in,
+            "replacement-api": rule.replacement,
+            "replacement-available-in": rule.replacement_available_in,
+            "component": "k8s"
+        },
+        "deprecated": deprecated,
+        "removed": removed,
+        "replacementAvailable": _version_reached(target_version, rule.replacement_available_in)
+    }
+
+
+def detect_documents(documents, file_path: str, target_version: Optional[str] = None) -> List[Dict]:
+    """Check already parsed YAML documents and return pluto-style items."""
+    target = normalize_version(target_version)
+    items = []
+    for doc in documents:
+        for resource in _iter_resources(doc):
+            item = check_resource(resource, file_path, target)
+            if item:
+                items.append(item)
+    return items
+
+
+def _detect_stream(documents, file_path: str, target: Optional[str]) -> List[Dict]:
+    index = default_rules().keys
+    items = []
+    # Only documents whose headers match a deprecated API reach the YAML parser
+    for document in documents:
+        if not document.needs_parse(index):
+            continue
+        try:
+            parsed = yaml_backend.safe_load_all(document.text)
+            items.extend(detect_documents(parsed, file_path, target))
+        except yaml_backend.YAMLError as e:
+            # pluto skips documents it cannot parse, do the same
+            logger.warning("Skipping document in %s: %s", file_path, e)
+    return items
+
+
+def detect_files(path: str, target_version: Optional[str] = None, render: bool = True) -> Dict:
+    """
+    Scan a file or directory for deprecated Kubernetes APIs in-process.
+
+    With `render`, Helm charts and Kustomize overlays in a directory are rendered first
+    and their output is scanned instead of the raw templates and resources; findings
+    point at the template or resource file the object came from.
+
+    Returns the same structure as `pluto detect-files -o json`.
+    """
+    target = normalize_version(target_version)
+    root = Path(path)
+    rendered = manifest_renderer.render_tree(root, target) if render and root.is_dir() \
+        else manifest_renderer.RenderResult()
+    items = []
+    for yaml_file in _iter_yaml_files(root):
+        if rendered.replaces(yaml_file):
+            continue
+        try:
+            items.extend(_detect_stream(manifest_scanner.scan_file(yaml_file), str(yaml_file), target))
+        except (UnicodeDecodeError, OSError) as e:
+            logger.warning("Skipping %s: %s", yaml_file, e)
+    for manifest in rendered.manifests:
+        documents = manifest_scanner.scan_documents(manifest.text.splitlines(keepends=True))
+        items.extend(_detect_stream(documents, str(manifest.path), target))
+    for error in rendered.errors:
+        logger.warning("Render warning: %s", error)
+
+    result = {"items": items, "target-versions": {"k8s": target or ""}}
+    if rendered.sources:
+        result["rendered"] = rendered.summary()
+    return result
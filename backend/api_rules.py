@@ -0,0 +1,162 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, Iterator, Optional, Tuple
+import yaml_backend
+
+DEFAULT_RULES_FILE = Path(__file__).resolve().parent / "api_rules.yaml"
+
+
+class UnsupportedShape(ValueError):
+    """Raised by a transform hook for a document it cannot migrate safely; the document is left untouched."""
+
+
+def _ingress_backend_v1(backend: Dict) -> Dict:
+    """Convert an extensions/v1beta1 Ingress backend to the networking.k8s.io/v1 format."""
+    if 'serviceName' not in backend:
+        if 'service' in backend or 'resource' in backend:
+            return backend
+        raise UnsupportedShape(f"unrecognized Ingress backend: {sorted(backend)}")
+
+    port = backend.get('servicePort', 80)
+    # Named ports move to port.name, numeric ports to port.number
+    port_key = 'name' if isinstance(port, str) and not port.isdigit() else 'number'
+    return {
+        'service': {
+            'name': backend['serviceName'],
+            'port': {
+                port_key: int(port) if port_key == 'number' else port
+            }
+        }
+    }
+
+
+def migrate_ingress_v1(ingress: Dict) -> Dict:
+    """Handle special migration for Ingress v1 (adds required pathType, converts backends)."""
+    spec = ingress.get('spec') or {}
+    paths = [
+        path
+        for rule in spec.get('rules') or []
+        if 'http' in rule and 'paths' in rule['http']
+        for path in rule['http']['paths']
+    ]
+
+    # Convert everything before mutating so an unsupported shape leaves the document untouched
+    default_backend = _ingress_backend_v1(spec['backend']) if 'backend' in spec else None
+    backends = [_ingress_backend_v1(path['backend']) if 'backend' in path else None for path in paths]
+
+    for path, backend in zip(paths, backends):
+        # Add pathType if not present (required in v1)
+        if 'pathType' not in path:
+            path['pathType'] = 'Prefix'
+        if backend is not None:
+            path['backend'] = backend
+
+    # spec.backend was renamed to spec.defaultBackend
+    if default_backend is not None:
+        del spec['backend']
+        spec['defaultBackend'] = default_backend
+
+    return ingress
+
+
+# Structural migration hooks, referenced by name from the rules file
+TRANSFORMS: Dict[str, Callable[[Dict], Dict]] = {
+    "ingress_v1": migrate_ingress_v1
+}
+
+
+@dataclass(frozen=True)
+class Rule:
+    """Migration rule for one deprecated (apiVersion, kind)."""
+    api_version: str
+    kind: str
+    replacement: str
+    deprecated_in: str
+    removed_in: str
+    replacement_available_in: str
+    transform: Optional[str] = None
+    notes: Tuple[str, ...] = ()
+    # The replacement needs structural changes the rule engine does not make
+    complex: bool = False
+
+    def apply(self, doc: Dict) -> Dict:
+        """
+        Rewrite a document to the replacement API, running the transform hook if any.
+        Raises UnsupportedShape (with the document unchanged) if the hook cannot handle it.
+        """
+        if self.transform:
+            doc = TRANSFORMS[self.transform](doc)
+        doc['apiVersion'] = self.replacement
+        return doc
+
+
+class RuleIndex:
+    """Read-only (apiVersion, kind) -> Rule index compiled from a rules file."""
+
+    def __init__(self, rules, version: str = "0"):
+        self.version = str(version)
+        self._rules = {(rule.api_version, rule.kind): rule for rule in rules}
+        self.keys: FrozenSet[Tuple[str, str]] = frozenset(self._rules)
+        self.deprecated_api_versions: FrozenSet[str] = frozenset(api_version for api_version, _ in self._rules)
+
+    def __iter__(self) -> Iterator[Rule]:
+        return iter(self._rules.values())
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def lookup(self, api_version: str, kind: str) -> Optional[Rule]:
+        return self._rules.get((api_version, kind))
+
+    def migration_table(self) -> Dict[str, Dict[str, str]]:
+        """Rules as {deprecated apiVersion: {kind: replacement}}."""
+        table = {}
+        for rule in self:
+            table.setdefault(rule.api_version, {})[rule.kind] = rule.replacement
+        return table
+
+    def lifecycle_table(self) -> Dict[str, Dict[str, Tuple[str, str, str]]]:
+        """Rules as {deprecated apiVersion: {kind: (deprecated-in, removed-in, replacement-available-in)}}."""
+        table = {}
+        for rule in self:
+            table.setdefault(rule.api_version, {})[rule.kind] = (
+                rule.deprecated_in, rule.removed_in, rule.replacement_available_in
+            )
+        return table
+
+
+def load_rules(path: Optional[str] = None) -> RuleIndex:
+    """Load and validate a rules file, raising ValueError on malformed entries."""
+    path = Path(path) if path else DEFAULT_RULES_FILE
+    with open(path, 'r') as f:
+        data = yaml_backend.safe_load(f) or {}
+
+    rules = []
+    for position, entry in enumerate(data.get("rules") or []):
+        try:
+            rule = Rule(
+                api_version=entry["apiVersion"],
+                kind=entry["kind"],
+                replacement=entry["replacement"],
+                deprecated_in=entry.get("deprecatedIn", ""),
+                removed_in=entry.get("removedIn", ""),
+                replacement_available_in=entry.get("replacementAvailableIn", ""),
+                transform=entry.get("transform"),
+                notes=tuple(str(note) for note in entry.get("notes") or ()),
+                complex=bool(entry.get("complex", False))
+            )
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid rule #{position} in {path}: missing {str(e)}")
+        if rule.transform and rule.transform not in TRANSFORMS:
+            raise ValueError(f"Unknown transform '{rule.transform}' for {rule.kind} in {path}")
+        rules.append(rule)
+
+    return RuleIndex(rules, data.get("version", "0"))
+
+
+@lru_cache(maxsize=None)
+def default_rules() -> RuleIndex:
+    """Rules shared by the detector and migrators (K8S_API_RULES_FILE overrides the bundled file)."""
+    return load_rules(os.getenv("K8S_API_RULES_FILE"))
@@ -0,0 +1,110 @@
+import gzip
+import os
+import tarfile
+import zipfile
+import zlib
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Optional
+from api_detector import YAML_SUFFIXES
+
+# Limits on what one batch request may unpack (guards against archive bombs)
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "10000"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(200 * 1024 * 1024)))
+
+_COPY_BLOCK = 1024 * 1024
+ARCHIVE_SUFFIXES = (".tar", ".tgz", ".gz", ".bz2", ".xz", ".zip")
+# Helm helper templates (_helpers.tpl) are needed to render the charts in a batch
+CHART_SUFFIXES = (".tpl",)
+
+
+class UnsafeUpload(ValueError):
+    """Raised for uploads that are malformed, escape the workspace or exceed the batch limits."""
+
+
+def _manifest_path(name: str) -> Optional[PurePosixPath]:
+    """
+    Validate an archive member or upload name as a relative path inside the workspace.
+    Returns None for files that are neither YAML manifests nor chart templates (they are skipped).
+    """
+    path = PurePosixPath(name.replace("\\", "/"))
+    if path.is_absolute() or ".." in path.parts or (path.parts and path.parts[0].endswith(":")):
+        raise UnsafeUpload(f"Refusing path outside the workspace: {name}")
+    parts = [part for part in path.parts if part not in ("", ".")]
+    if not parts or path.suffix not in YAML_SUFFIXES + CHART_SUFFIXES:
+        return None
+    return PurePosixPath(*parts)
+
+
+class ManifestWorkspace:
+    """
+    Directory that collects the manifests of one batch request, from archives or
+    individual uploads. Only regular YAML files are written; links, devices and
+    other files are skipped, and the file count and total size are capped.
+    """
+
+    def __init__(self, root, max_files: int = BATCH_MAX_FILES, max_bytes: int = BATCH_MAX_BYTES):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.files = 0
+        self.bytes = 0
+
+    def _target(self, relative: PurePosixPath) -> Path:
+        target = self.root.joinpath(*relative.parts)
+        # Two uploads with the same name (e.g. from different directories) are both kept
+        counter = 1
+        while target.exists():
+            target = target.with_name(f"{relative.stem}-{counter}{relative.suffix}")
+            counter += 1
+        return target
+
+    def add(self, name: str, source: BinaryIO) -> Optional[Path]:
+        """Copy one manifest into the workspace; returns its path, or None if it was skipped."""
+        relative = _manifest_path(name)
+        if relative is None:
+            return None
+        if self.files >= self.max_files:
+            raise UnsafeUpload(f"Batch exceeds {self.max_files} files")
+
+        target = self._target(relative)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(target, "wb") as f:
+            # Count actual bytes: sizes declared in archive headers can't be trusted
+            for block in iter(lambda: source.read(_COPY_BLOCK), b""):
+                self.bytes += len(block)
+                if self.bytes > self.max_bytes:
+                    raise UnsafeUpload(f"Batch exceeds {self.max_bytes} bytes uncompressed")
+                f.write(block)
+        self.files += 1
+        return target
+
+    def add_archive(self, source: BinaryIO) -> None:
+        """Unpack the manifests of a tar (optionally compressed) or zip archive."""
+        try:
+            if zipfile.is_zipfile(source):
+                source.seek(0)
+                with zipfile.ZipFile(source) as archive:
+                    for member in archive.infolist():
+                        if not member.is_dir():
+                            with archive.open(member) as data:
+                                self.add(member.filename, data)
+                return
+
+            source.seek(0)
+            with tarfile.open(fileobj=source, mode="r:*") as archive:
+                for member in archive:
+                    # Symlinks, hard links and devices are never extracted
+                    if member.isfile():
+                        self.add(member.name, archive.extractfile(member))
+        except (tarfile.TarError, zipfile.BadZipFile, gzip.BadGzipFile, zlib.error, EOFError) as e:
+            raise UnsafeUpload(f"Not a valid tar or zip archive: {str(e)}")
+
+    def add_stream(self, source: BinaryIO, name: str) -> Optional[Path]:
+        """Add an upload that is a single manifest, an archive or neither (skipped), judged by its name."""
+        suffix = Path(name or "").suffix
+        if suffix in YAML_SUFFIXES + CHART_SUFFIXES:
+            return self.add(name, source)
+        if not name or suffix in ARCHIVE_SUFFIXES:
+            self.add_archive(source)
+        return None
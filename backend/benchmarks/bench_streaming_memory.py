@@ -0,0 +1,70 @@
+"""
+Check that KubernetesAPIMigrator.migrate_yaml_file memory stays bounded on huge streams.
+
+Writes a synthetic multi-document stream (like `kubectl get all -A -o yaml` split
+into documents) of the requested size, migrates it and reports peak RSS.
+Exits non-zero if peak RSS exceeds --max-rss-mb.
+
+Usage: python benchmarks/bench_streaming_memory.py [--size-mb 1024] [--max-rss-mb 200]
+"""
+import argparse
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from yaml_migrator import KubernetesAPIMigrator  # noqa: E402
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_stream(path: Path, size_mb: int) -> int:
+    """Write sample documents to `path` until it reaches `size_mb`; return the document count."""
+    samples = [(BACKEND_DIR / name).read_text().strip() for name in ("sample-deprecated.yaml", "sample-mixed-apis.yaml")]
+    chunk = "\n---\n".join(samples) + "\n---\n"
+    chunk_docs = chunk.count("\n---\n")
+    target = size_mb * 1024 * 1024
+    written = documents = 0
+    with open(path, 'w') as f:
+        while written < target:
+            f.write(chunk)
+            written += len(chunk)
+            documents += chunk_docs
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure peak memory of streaming YAML migration")
+    parser.add_argument("--size-mb", type=int, default=1024, help="Size of the synthetic stream (default: 1024)")
+    parser.add_argument("--max-rss-mb", type=float, default=200, help="Fail if peak RSS exceeds this (default: 200)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        stream = Path(workdir) / "cluster-export.yaml"
+        documents = write_stream(stream, args.size_mb)
+        baseline = peak_rss_mb()
+        print(f"Stream: {args.size_mb} MB, {documents} documents, baseline RSS {baseline:.1f} MB")
+
+        migrator = KubernetesAPIMigrator(str(Path(workdir) / "output"))
+        start = time.perf_counter()
+        success, message = migrator.migrate_yaml_file(str(stream))
+        elapsed = time.perf_counter() - start
+
+        peak = peak_rss_mb()
+        print(f"Migrated in {elapsed:.1f}s ({args.size_mb / elapsed:.1f} MB/s): {message}")
+        print(f"Peak RSS {peak:.1f} MB (limit {args.max_rss_mb:.0f} MB)")
+
+    if not success:
+        return 1
+    return 0 if peak <= args.max_rss_mb else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,366 @@
+"""
+Benchmark detection, migration and the analysis endpoint on a synthetic corpus.
+
+Every stage runs in its own child process, so its peak RSS is its own, and reports
+throughput, p50/p99 latency per item (file or request) and peak RSS. The AI paths
+(/analyze/ and the LLM migrator) talk to devtools/fake_openai_server.py with caching
+disabled, so they measure the request path rather than the cache. Results are written
+as JSON; --compare prints the change against an earlier results file.
+
+Usage:
+    python benchmarks/bench_suite.py --files 500 --docs-per-file 4 --deprecated-ratio 0.3
+    python benchmarks/bench_suite.py --stages detect_file,migrate_file --compare benchmarks/results/previous.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(BACKEND_DIR / "devtools"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import yaml_backend  # noqa: E402
+from corpus import MANIFEST_FILE, generate_corpus  # noqa: E402
+
+RESULTS_FORMAT = 1
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+# Child processes print their result on a line with this prefix (the code under test may print too)
+RESULT_MARKER = "BENCH_RESULT "
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def corpus_files(corpus: str, limit: int = 0) -> List[Path]:
+    files = sorted(Path(corpus).rglob("*.yaml"))
+    return files[:limit] if limit else files
+
+
+def timed(items, func: Callable) -> List[float]:
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def timed_concurrently(items, func, concurrency: int) -> List[float]:
+    slots = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(item) -> float:
+        async with slots:
+            start = time.perf_counter()
+            await func(item)
+            return time.perf_counter() - start
+
+    return list(await asyncio.gather(*(run(item) for item in items)))
+
+
+# Stages: run in the child process, return {"items", "unit", "latencies" (seconds, optional)}
+# and optionally "wall_seconds" (the sum of latencies otherwise) or "skipped" with a reason.
+
+def stage_detect_file(corpus: str, options: Dict) -> Dict:
+    from api_detector import detect_files
+    files = corpus_files(corpus, options["limit"])
+    return {"items": len(files), "unit": "files",
+            "latencies": timed(files, lambda path: detect_files(str(path), options["version"]))}
+
+
+def stage_detect_tree(corpus: str, options: Dict) -> Dict:
+    from pluto_analysis import detect_deprecated_apis
+    start = time.perf_counter()
+    detect_deprecated_apis(corpus, options["version"], backend="native")
+    return {"items": len(corpus_files(corpus)), "unit": "files", "wall_seconds": time.perf_counter() - start}
+
+
+def stage_pluto_tree(corpus: str, options: Dict) -> Dict:
+    if not shutil.which("pluto"):
+        return {"skipped": "pluto binary not found"}
+    from pluto_analysis import run_pluto
+    start = time.perf_counter()
+    run_pluto(corpus, options["version"])
+    return {"items": len(corpus_files(corpus)), "unit": "files", "wall_seconds": time.perf_counter() - start}
+
+
+def stage_migrate_file(corpus: str, options: Dict) -> Dict:
+    from yaml_migrator import KubernetesAPIMigrator
+    files = corpus_files(corpus, options["limit"])
+    with tempfile.TemporaryDirectory() as output:
+        migrator = KubernetesAPIMigrator(output, mode=options["mode"])
+        latencies = timed(files, lambda path: migrator.migrate_yaml_file(
+            str(path), str(Path(output) / f"{path.parent.name}-{migrator.output_name(path)}")))
+    return {"items": len(files), "unit": "files", "latencies": latencies}
+
+
+def stage_migrate_directory(corpus: str, options: Dict) -> Dict:
+    from yaml_migrator import KubernetesAPIMigrator
+    with tempfile.TemporaryDirectory() as output:
+        migrator = KubernetesAPIMigrator(output, mode="diff" if options["mode"] == "in-place" else options["mode"])
+        start = time.perf_counter()
+        migrator.migrate_directory(corpus, recursive=True, workers=options["workers"])
+        wall = time.perf_counter() - start
+    return {"items": len(corpus_files(corpus)), "unit": "files", "wall_seconds": wall}
+
+
+def stage_analyze(corpus: str, options: Dict) -> Dict:
+    import httpx
+    import main
+
+    files = corpus_files(corpus, options["llm_files"])
+
+    async def run() -> List[float]:
+        # Same app and lifespan (detection pool) as under uvicorn, without the network hop
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                async def analyze(path: Path):
+                    response = await client.post("/analyze/", data={"version": options["version"]},
+                                                 files={"file": (path.name, path.read_bytes())})
+                    result = response.json()
+                    if response.status_code != 200 or "error" in result or result["ai_response"].startswith("⚠️"):
+                        raise RuntimeError(f"/analyze/ failed for {path}: {str(result)[:200]}")
+
+                return await timed_concurrently(files, analyze, options["concurrency"])
+
+    start = time.perf_counter()
+    latencies = asyncio.run(run())
+    return {"items": len(files), "unit": "requests", "latencies": latencies, "wall_seconds": time.perf_counter() - start}
+
+
+def stage_llm_migrate(corpus: str, options: Dict) -> Dict:
+    from llm_yaml_migrator import LLMYAMLMigrator
+    files = corpus_files(corpus, options["llm_files"])
+    with tempfile.TemporaryDirectory() as output:
+        migrator = LLMYAMLMigrator(output, api_key="fake", base_url=os.environ["OPENAI_BASE_URL"], use_cache=False,
+                                   concurrency=options["concurrency"])
+
+        async def migrate(path: Path):
+            success, message = await migrator.amigrate_yaml_file(str(path))
+            if not success:
+                raise RuntimeError(message)
+
+        async def run():
+            try:
+                return await timed_concurrently(files, migrate, options["concurrency"])
+            finally:
+                await migrator.aclose()
+
+        start = time.perf_counter()
+        latencies = asyncio.run(run())
+        wall = time.perf_counter() - start
+    return {"items": len(files), "unit": "files", "latencies": latencies, "wall_seconds": wall}
+
+
+STAGES = {
+    "detect_file": stage_detect_file,
+    "detect_tree": stage_detect_tree,
+    "pluto_tree": stage_pluto_tree,
+    "migrate_file": stage_migrate_file,
+    "migrate_directory": stage_migrate_directory,
+    "analyze": stage_analyze,
+    "llm_migrate": stage_llm_migrate,
+}
+
+
+def run_stage_here(name: str, corpus: str, options: Dict) -> Dict:
+    """Child process side: run one stage and add the memory figures."""
+    baseline = peak_rss_mb()
+    raw = STAGES[name](corpus, options)
+    if "skipped" in raw:
+        return {"status": "skipped", "reason": raw["skipped"]}
+
+    latencies = raw.get("latencies") or []
+    wall = raw.get("wall_seconds", sum(latencies))
+    documents = round(raw["items"] * options["docs_per_file"]) if raw["unit"] == "files" else None
+    result = {
+        "status": "ok",
+        "unit": raw["unit"],
+        "items": raw["items"],
+        "wall_seconds": round(wall, 4),
+        "throughput_per_second": round(raw["items"] / wall, 2) if wall else None,
+        "documents_per_second": round(documents / wall, 2) if wall and documents else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "max": round(max(latencies) * 1000, 3),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3),
+        } if latencies else None,
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    children = peak_rss_mb(resource.RUSAGE_CHILDREN)
+    if children:
+        # Process pool workers (migrate_directory, the detection pool) report separately
+        result["children_peak_rss_mb"] = round(children, 1)
+    return result
+
+
+def run_stage(name: str, corpus: str, options: Dict, env: Dict[str, str], timeout: float) -> Dict:
+    """Parent side: run a stage in a fresh interpreter and collect its result."""
+    command = [sys.executable, str(Path(__file__).resolve()), "--run-stage", name, "--corpus", corpus,
+               "--stage-options", json.dumps(options)]
+    try:
+        process = subprocess.run(command, capture_output=True, text=True, env=env, timeout=timeout,
+                                 cwd=str(BACKEND_DIR))
+    except subprocess.TimeoutExpired:
+        return {"status": "failed", "reason": f"timed out after {timeout:g}s"}
+    for line in reversed(process.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    lines = [line for line in process.stderr.strip().splitlines() if line.strip()]
+    return {"status": "failed", "reason": lines[-1] if lines else f"exited with {process.returncode}"}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=str(BACKEND_DIR), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+
+def _change(old: Optional[float], new: Optional[float]) -> str:
+    if old is None or new is None:
+        return "-"
+    delta = f" ({(new - old) / old * 100:+.0f}%)" if old else ""
+    return f"{old:g} → {new:g}{delta}"
+
+
+def print_comparison(previous: Dict, current: Dict) -> None:
+    from rich.console import Console
+    from rich.table import Table
+
+    table = Table("Stage", "Throughput/s", "p99 ms", "Peak RSS MB",
+                  title=f"{previous.get('git_commit') or previous.get('started_at')} → "
+                        f"{current.get('git_commit') or current.get('started_at')}")
+    for name, stage in current["stages"].items():
+        old = previous.get("stages", {}).get(name, {})
+        table.add_row(name, _change(old.get("throughput_per_second"), stage.get("throughput_per_second")),
+                      _change((old.get("latency_ms") or {}).get("p99"), (stage.get("latency_ms") or {}).get("p99")),
+                      _change(old.get("peak_rss_mb"), stage.get("peak_rss_mb")))
+    Console().print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detection, migration and analysis")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated stages (default: all of "
+                                                                   f"{', '.join(STAGES)})")
+    parser.add_argument("--corpus", help="Existing corpus directory (default: generate one in a temp directory)")
+    parser.add_argument("--files", type=int, default=200, help="Generated manifest files (default: 200)")
+    parser.add_argument("--docs-per-file", type=int, default=4, help="Documents per generated file (default: 4)")
+    parser.add_argument("--deprecated-ratio", type=float, default=0.3, help="Share of deprecated documents (default: 0.3)")
+    parser.add_argument("--seed", type=int, default=1, help="Corpus seed (default: 1)")
+    parser.add_argument("--version", default="1.25", help="Target Kubernetes version (default: 1.25)")
+    parser.add_argument("--mode", default="rewrite", choices=["rewrite", "in-place", "diff"],
+                        help="Migration mode; in-place is measured as diff to keep the corpus intact (default: rewrite)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Process pool size for migrate_directory (default: CPU count)")
+    parser.add_argument("--limit", type=int, default=0, help="Files for the per-file stages (default: all)")
+    parser.add_argument("--llm-files", type=int, default=50, help="Files for the AI stages (default: 50)")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake LLM response delay in seconds (default: 0.05)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent requests in the AI stages (default: 8)")
+    parser.add_argument("--stage-timeout", type=float, default=3600, help="Seconds before a stage is aborted (default: 3600)")
+    parser.add_argument("--output", "-o", help="Results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--run-stage", help=argparse.SUPPRESS)
+    parser.add_argument("--stage-options", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        print(RESULT_MARKER + json.dumps(run_stage_here(args.run_stage, args.corpus, json.loads(args.stage_options))))
+        return 0
+
+    stages = [name.strip() for name in args.stages.split(",") if name.strip()]
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+
+    import fake_openai_server
+
+    with tempfile.TemporaryDirectory(prefix="k8s-bench-") as workdir:
+        corpus = args.corpus
+        if corpus and (Path(corpus) / MANIFEST_FILE).is_file():
+            with open(Path(corpus) / MANIFEST_FILE, 'r') as f:
+                description = json.load(f)
+        else:
+            corpus = corpus or str(Path(workdir) / "corpus")
+            description = generate_corpus(corpus, args.files, args.docs_per_file, args.deprecated_ratio, args.seed)
+        print(f"Corpus: {description['files']} files, {description['documents']} documents "
+              f"({description['deprecated_documents']} deprecated) in {corpus}")
+
+        server = fake_openai_server.serve(port=0, latency=args.llm_latency)
+        env = dict(os.environ, OPENAI_API_KEY="fake",
+                   OPENAI_BASE_URL=f"http://127.0.0.1:{server.server_port}/v1",
+                   # Measure the work, not the caches; no job workers next to the measured app
+                   ANALYSIS_CACHE_SIZE="0", LLM_CACHE_SIZE="0", JOB_WORKERS="0",
+                   JOB_DB=str(Path(workdir) / "jobs.sqlite3"))
+        options = {"version": args.version, "mode": args.mode, "workers": args.workers, "limit": args.limit,
+                   "llm_files": args.llm_files, "concurrency": args.concurrency,
+                   "docs_per_file": description["documents"] / max(1, description["files"])}
+
+        results = {
+            "format": RESULTS_FORMAT,
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "yaml_backend": yaml_backend.BACKEND,
+            "corpus": description,
+            "options": {key: value for key, value in options.items() if key != "docs_per_file"},
+            "llm_latency": args.llm_latency,
+            "stages": {},
+        }
+        try:
+            for name in stages:
+                print(f"Running {name}...", flush=True)
+                stage = run_stage(name, corpus, options, env, args.stage_timeout)
+                results["stages"][name] = stage
+                if stage["status"] == "ok":
+                    latency = stage["latency_ms"]
+                    print(f"  {stage['throughput_per_second']} {stage['unit']}/s"
+                          + (f", p50 {latency['p50']} ms, p99 {latency['p99']} ms" if latency else "")
+                          + f", peak RSS {stage['peak_rss_mb']} MB")
+                else:
+                    print(f"  {stage['status']}: {stage['reason']}")
+        finally:
+            server.shutdown()
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            print_comparison(json.load(f), results)
+    return 1 if any(stage["status"] == "failed" for stage in results["stages"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Compare the pure-Python and LibYAML YAML backends on the bundled sample manifests.
+
+Usage: python benchmarks/bench_yaml_backend.py [--scale 2000] [--repeat 3]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import yaml
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SAMPLES = ["sample-deprecated.yaml", "sample-mixed-apis.yaml"]
+
+BACKENDS = {"python": (yaml.SafeLoader, yaml.SafeDumper)}
+if getattr(yaml, "__with_libyaml__", False):
+    BACKENDS["libyaml"] = (yaml.CSafeLoader, yaml.CSafeDumper)
+
+
+def build_corpus(scale: int) -> str:
+    """Concatenate the sample manifests `scale` times into one multi-document stream."""
+    samples = [(BACKEND_DIR / name).read_text().strip() for name in SAMPLES]
+    return "\n---\n".join(samples * scale) + "\n"
+
+
+def best_of(repeat: int, func) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark YAML load/dump backends")
+    parser.add_argument("--scale", type=int, default=2000, help="Times to repeat the sample files (default: 2000)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, best is reported (default: 3)")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.scale)
+    documents = list(yaml.load_all(corpus, Loader=yaml.SafeLoader))
+    print(f"Corpus: {len(documents)} documents, {len(corpus) / 1e6:.1f} MB")
+    if "libyaml" not in BACKENDS:
+        print("LibYAML bindings not available, only the pure-Python backend is measured.")
+
+    results = {}
+    for name, (loader, dumper) in BACKENDS.items():
+        load = best_of(args.repeat, lambda: list(yaml.load_all(corpus, Loader=loader)))
+        dump = best_of(args.repeat, lambda: yaml.dump_all(documents, Dumper=dumper, default_flow_style=False, sort_keys=False))
+        results[name] = (load, dump)
+        print(f"{name:8s} load {load:7.3f}s  dump {dump:7.3f}s")
+
+    if "libyaml" in results:
+        python_load, python_dump = results["python"]
+        c_load, c_dump = results["libyaml"]
+        print(f"Speedup  load {python_load / c_load:6.1f}x  dump {python_dump / c_dump:6.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Generate a synthetic manifest corpus for benchmarks.
+
+Documents are drawn from sample-deprecated.yaml and sample-mixed-apis.yaml: deprecated
+ones as they are, current ones as they are or migrated by the rule engine. Names,
+namespaces, labels and replica counts vary per document so that caches keyed on content
+don't turn the corpus into repeats of a few files. With --all-rules, a minimal object
+for every (apiVersion, kind) in the rule table joins the deprecated pool.
+
+Usage: python benchmarks/corpus.py /tmp/corpus --files 1000 --docs-per-file 4 --deprecated-ratio 0.3
+"""
+import argparse
+import copy
+import json
+import random
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+import yaml_backend  # noqa: E402
+from api_rules import UnsupportedShape, default_rules  # noqa: E402
+
+SAMPLES = ["sample-deprecated.yaml", "sample-mixed-apis.yaml"]
+MANIFEST_FILE = "corpus.json"
+
+
+def seed_documents(all_rules: bool = False) -> Tuple[List[Dict], List[Dict]]:
+    """(deprecated, current) seed documents from the sample manifests."""
+    rules = default_rules()
+    deprecated, current = [], []
+    for name in SAMPLES:
+        with open(BACKEND_DIR / name, 'r') as f:
+            for doc in yaml_backend.safe_load_all(f):
+                if not isinstance(doc, dict):
+                    continue
+                rule = rules.lookup(doc.get("apiVersion", ""), doc.get("kind", ""))
+                if rule is None:
+                    current.append(doc)
+                    continue
+                deprecated.append(doc)
+                try:
+                    current.append(rule.apply(copy.deepcopy(doc)))
+                except UnsupportedShape:
+                    pass
+    if all_rules:
+        seen = {(doc["apiVersion"], doc["kind"]) for doc in deprecated}
+        for rule in rules:
+            if (rule.api_version, rule.kind) not in seen:
+                deprecated.append({"apiVersion": rule.api_version, "kind": rule.kind,
+                                   "metadata": {"name": rule.kind.lower()}})
+    return deprecated, current
+
+
+def _vary(doc: Dict, number: int, rng: random.Random) -> Dict:
+    doc = copy.deepcopy(doc)
+    metadata = doc.setdefault("metadata", {})
+    metadata["name"] = f"{metadata.get('name', doc.get('kind', 'object').lower())}-{number}"
+    metadata["namespace"] = f"team-{rng.randrange(20)}"
+    metadata.setdefault("labels", {})["bench/generation"] = str(number)
+    spec = doc.get("spec")
+    if isinstance(spec, dict) and "replicas" in spec:
+        spec["replicas"] = rng.randint(1, 10)
+    return doc
+
+
+def generate_corpus(root, files: int = 200, docs_per_file: int = 4, deprecated_ratio: float = 0.3,
+                    seed: int = 1, directories: int = 10, all_rules: bool = False) -> Dict:
+    """
+    Write `files` manifests of `docs_per_file` documents each, spread over `directories`
+    subdirectories of `root`, and a corpus.json describing the corpus. Returns that description.
+    """
+    rng = random.Random(seed)
+    deprecated, current = seed_documents(all_rules)
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    counts = {"documents": 0, "deprecated_documents": 0, "bytes": 0}
+    kinds: Dict[str, int] = {}
+    for index in range(files):
+        documents = []
+        for position in range(docs_per_file):
+            is_deprecated = rng.random() < deprecated_ratio
+            doc = _vary(rng.choice(deprecated if is_deprecated else current), index * docs_per_file + position, rng)
+            documents.append(doc)
+            counts["deprecated_documents"] += is_deprecated
+            key = f"{doc['apiVersion']}/{doc['kind']}"
+            kinds[key] = kinds.get(key, 0) + 1
+        path = root / f"dir-{index % max(1, directories):03d}" / f"manifest-{index:05d}.yaml"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        text = yaml_backend.dump_all(documents)
+        path.write_text(text)
+        counts["documents"] += len(documents)
+        counts["bytes"] += len(text.encode())
+
+    description = {
+        "files": files, "docs_per_file": docs_per_file, "deprecated_ratio": deprecated_ratio, "seed": seed,
+        "directories": directories, "all_rules": all_rules, **counts, "kinds": dict(sorted(kinds.items()))
+    }
+    with open(root / MANIFEST_FILE, 'w') as f:
+        json.dump(description, f, indent=2)
+    return description
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Kubernetes manifest corpus")
+    parser.add_argument("output", help="Directory to write the corpus to")
+    parser.add_argument("--files", type=int, default=200, help="Manifest files (default: 200)")
+    parser.add_argument("--docs-per-file", type=int, default=4, help="Documents per file (default: 4)")
+    parser.add_argument("--deprecated-ratio", type=float, default=0.3,
+                        help="Share of documents using a deprecated API (default: 0.3)")
+    parser.add_argument("--directories", type=int, default=10, help="Subdirectories to spread files over (default: 10)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed, same seed gives the same corpus (default: 1)")
+    parser.add_argument("--all-rules", action="store_true",
+                        help="Also use a minimal object for every deprecated API in the rule table")
+    args = parser.parse_args()
+
+    description = generate_corpus(args.output, args.files, args.docs_per_file, args.deprecated_ratio, args.seed,
+                                  args.directories, args.all_rules)
+    print(f"Wrote {description['files']} files, {description['documents']} documents "
+          f"({description['deprecated_documents']} deprecated), {description['bytes'] / 1e6:.1f} MB to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""
+Migrate deprecated Kubernetes APIs across many repositories and push one branch per repository.
+
+    python bulk_migrate.py repos.txt --token $GIT_TOKEN --jobs 8 --push-concurrency 4
+
+`repos.txt` lists one repository URL per line, optionally followed by its base branch
+(default main); blank lines and `#` comments are ignored. Every run pushes to its own
+branch (kube-api-upgrade-<run id>) and records progress in a state file: re-running with
+the same state file continues the interrupted run, skipping repositories already pushed.
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from git import GitCommandError
+from rich.console import Console
+from rich.live import Live
+from rich.table import Table
+import yaml_backend
+from git_ops import DEFAULT_BRANCH, WorkspacePool, create_merge_request, default_pool
+from manifest_renderer import chart_templates
+from yaml_migrator import KubernetesAPIMigrator
+
+logger = logging.getLogger(__name__)
+
+STATE_FORMAT = 1
+DEFAULT_STATE_FILE = ".bulk-migrate-state.json"
+
+# Repository states; DONE ones are skipped when a run is resumed
+PENDING, MIGRATING, PUSHING = "pending", "migrating", "pushing"
+PUSHED, NO_CHANGES, PLANNED, FAILED = "pushed", "no changes", "planned", "failed"
+DONE = (PUSHED, NO_CHANGES)
+
+_STATUS_STYLES = {PUSHED: "green", NO_CHANGES: "dim", PLANNED: "cyan", FAILED: "red", MIGRATING: "yellow",
+                  PUSHING: "yellow"}
+
+
+@dataclass(frozen=True)
+class RepoSpec:
+    url: str
+    base: str = "main"
+
+
+def load_repo_list(path: str) -> List[RepoSpec]:
+    """Read `url [base-branch]` lines, ignoring blank lines, comments and duplicates."""
+    repos: Dict[str, RepoSpec] = {}
+    with open(path, 'r') as f:
+        for line in f:
+            fields = line.split("#", 1)[0].split()
+            if fields:
+                repos.setdefault(fields[0], RepoSpec(fields[0], fields[1] if len(fields) > 1 else "main"))
+    return list(repos.values())
+
+
+class FanoutState:
+    """
+    Run id, branch and per-repository status of a fan-out run, saved after every change
+    so an interrupted run can be resumed. Writes are atomic (temp file + rename).
+    """
+
+    def __init__(self, path: str, branch_prefix: str = DEFAULT_BRANCH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        data = {}
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            pass
+        if data.get("format") != STATE_FORMAT:
+            data = {}
+        self.run_id: str = data.get("run_id") or f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        # Unique per run, so a new run never collides with branches (or open PRs) of earlier runs
+        self.branch: str = data.get("branch") or f"{branch_prefix}-{self.run_id}"
+        self.repos: Dict[str, Dict] = data.get("repos", {})
+
+    def status(self, url: str) -> str:
+        with self._lock:
+            return self.repos.get(url, {}).get("status", PENDING)
+
+    def update(self, url: str, status: str, message: str = "", files: Optional[List[str]] = None,
+               skipped: Optional[Dict[str, str]] = None) -> None:
+        with self._lock:
+            entry = self.repos.setdefault(url, {})
+            entry.update(status=status, message=message, updated_at=time.time())
+            if files is not None:
+                entry["files"] = files
+            if skipped is not None:
+                entry["skipped"] = skipped
+            self._save()
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"format": STATE_FORMAT, "run_id": self.run_id, "branch": self.branch, "repos": self.repos},
+                      f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for entry in self.repos.values():
+                counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+            return counts
+
+
+def migrate_repository(repo: RepoSpec, migrator: KubernetesAPIMigrator, pool: WorkspacePool,
+                       token: Optional[str] = None) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Migrated content ({path: content}) for every manifest of the repository that changes,
+    and the manifests that could not be parsed ({path: error}). Helm chart templates are
+    not plain YAML and are left alone, as in migrate_directory.
+    """
+    files = dict(pool.read_files(repo.url, repo.base, token=token))
+    templates = chart_templates(files)
+    changes, skipped = {}, {}
+    for path, content in files.items():
+        if path in templates:
+            continue
+        try:
+            text = content.decode()
+        except UnicodeDecodeError:
+            continue
+        try:
+            migrated = migrator.migrate_text(text)
+        except yaml_backend.YAMLError as e:
+            # One broken manifest must not cost the repository its merge request
+            logger.warning("Skipping %s in %s: %s", path, repo.url, e)
+            skipped[path] = str(e).splitlines()[0] if str(e) else type(e).__name__
+            continue
+        if migrated is not None:
+            changes[path] = migrated
+    return changes, skipped
+
+
+def _error_summary(error: Exception) -> str:
+    """One line for the status table; git errors are reduced to git's own message."""
+    if isinstance(error, GitCommandError):
+        lines = [line.strip() for line in str(error.stderr or "").strip().strip("'").splitlines() if line.strip()]
+        fatal = [line for line in lines if line.startswith(("fatal:", "error:"))]
+        return (fatal or lines or [f"git exited with {error.status}"])[0]
+    return str(error) or type(error).__name__
+
+
+def fan_out(repos: List[RepoSpec], state: FanoutState, token: Optional[str] = None, jobs: int = 8,
+            push_concurrency: int = 4, dry_run: bool = False, pool: Optional[WorkspacePool] = None,
+            on_update: Optional[Callable[[], None]] = None) -> FanoutState:
+    """
+    Migrate every repository and push the changes to `state.branch`. Repositories are
+    processed by `jobs` threads; at most `push_concurrency` of them push at a time.
+    A failure is recorded for its repository and does not stop the others.
+    """
+    pool = pool or default_pool()
+    push_slots = threading.Semaphore(max(1, push_concurrency))
+    notify = on_update or (lambda: None)
+
+    def process(repo: RepoSpec) -> None:
+        if state.status(repo.url) in DONE:
+            return
+        try:
+            # The push may have gone through just before an interruption, before its state was saved
+            if not dry_run and pool.remote_branch_exists(repo.url, state.branch, token):
+                state.update(repo.url, PUSHED, "branch already on remote")
+                return
+            state.update(repo.url, MIGRATING)
+            notify()
+            # One migrator per repository: the migration log is per instance
+            # Patch mode keeps the diff to the migrated lines, so the pushed commits are reviewable
+            migrator = KubernetesAPIMigrator(output_dir=str(pool.root / "bulk-output"), mode="in-place")
+            changes, skipped = migrate_repository(repo, migrator, pool, token)
+            if not changes:
+                state.update(repo.url, NO_CHANGES, files=[], skipped=skipped)
+                return
+            if dry_run:
+                state.update(repo.url, PLANNED, "dry run, not pushed", sorted(changes), skipped)
+                return
+
+            state.update(repo.url, PUSHING, files=sorted(changes), skipped=skipped)
+            notify()
+            with push_slots:
+                message = create_merge_request(repo.url, changes, token, branch=state.branch, base=repo.base,
+                                               pool=pool)
+            state.update(repo.url, PUSHED, message)
+        except Exception as e:
+            state.update(repo.url, FAILED, _error_summary(e))
+        finally:
+            notify()
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix="fanout") as executor:
+        list(executor.map(process, repos))
+    return state
+
+
+def status_table(repos: List[RepoSpec], state: FanoutState, active_only: bool = False) -> Table:
+    """Per-repository status; `active_only` keeps the live view short for long repository lists."""
+    table = Table("Repository", "Status", "Files", "Details", title=f"Branch {state.branch}",
+                  caption=", ".join(f"{status}: {count}" for status, count in sorted(state.counts().items())))
+    for repo in repos:
+        entry = state.repos.get(repo.url, {})
+        status = entry.get("status", PENDING)
+        if active_only and status not in (MIGRATING, PUSHING, FAILED):
+            continue
+        style = _STATUS_STYLES.get(status, "")
+        files = entry.get("files")
+        details = entry.get("message", "")
+        if entry.get("skipped"):
+            details = "; ".join(filter(None, [details, f"{len(entry['skipped'])} unparsable file(s) skipped"]))
+        table.add_row(repo.url, f"[{style}]{status}[/{style}]" if style else status,
+                      str(len(files)) if files is not None else "", details)
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate deprecated Kubernetes APIs across many repositories")
+    parser.add_argument("repos", help="File with one repository URL (and optional base branch) per line")
+    parser.add_argument("--token", default=os.getenv("GIT_TOKEN"), help="Git token for https remotes (default: GIT_TOKEN)")
+    parser.add_argument("--jobs", "-j", type=int, default=8, help="Repositories processed concurrently (default: 8)")
+    parser.add_argument("--push-concurrency", type=int, default=4, help="Concurrent pushes (default: 4)")
+    parser.add_argument("--state", default=DEFAULT_STATE_FILE,
+                        help=f"State file; an existing one resumes its run (default: {DEFAULT_STATE_FILE})")
+    parser.add_argument("--branch-prefix", default=DEFAULT_BRANCH, help=f"Branch name prefix (default: {DEFAULT_BRANCH})")
+    parser.add_argument("--dry-run", "-n", action="store_true", help="Report the files that would change without pushing")
+    args = parser.parse_args()
+
+    console = Console()
+    try:
+        repos = load_repo_list(args.repos)
+    except OSError as e:
+        console.print(f"[bold red]Error:[/bold red] {str(e)}")
+        return 1
+    state = FanoutState(args.state, args.branch_prefix)
+    resumed = sum(state.status(repo.url) in DONE for repo in repos)
+    if resumed:
+        console.print(f"[blue]Resuming run {state.run_id}: {resumed} of {len(repos)} repositories already done[/blue]")
+
+    with Live(status_table(repos, state, active_only=True), console=console, refresh_per_second=4,
+              transient=True) as live:
+        lock = threading.Lock()
+
+        def refresh():
+            with lock:
+                live.update(status_table(repos, state, active_only=True))
+
+        fan_out(repos, state, args.token, args.jobs, args.push_concurrency, args.dry_run, on_update=refresh)
+
+    console.print(status_table(repos, state))
+    counts = state.counts()
+    return 1 if counts.get(FAILED) else 0
+
+
+if __name__ == "__main__":
+    exit(main())
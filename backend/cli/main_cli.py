@@ -1,49 +1,329 @@
 import argparse
+import json
+import os
+import sys
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
 import requests
+from requests.adapters import HTTPAdapter
 from rich.console import Console
+from rich.progress import BarColumn, MofNCompleteColumn, Progress, TextColumn, TimeElapsedColumn, TimeRemainingColumn
+from rich.table import Table
 from pathlib import Path
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
 
 console = Console()
 
-API_URL = "http://localhost:8000/analyze/"  # Adjust if deployed elsewhere
+# Backend base URL, overridden by --api-url
+API_URL = os.getenv("K8S_HELPER_API_URL", "http://localhost:8000")
+YAML_SUFFIXES = (".yaml", ".yml")
+# Helm helper templates, so the server can render uploaded charts
+CHART_SUFFIXES = (".tpl",)
+# Statuses worth retrying: rate limiting (/analyze/ async queue) and a restarting or overloaded backend
+RETRY_STATUSES = (429, 502, 503, 504)
 
-def analyze(file_path: str, version: str):
+class ApiClient:
+    """
+    Backend client over one requests.Session: connections are kept alive and pooled
+    (up to `pool_size`, one per concurrent upload), and failed connections and retryable
+    statuses are retried with exponential backoff, honouring Retry-After.
+    """
+
+    def __init__(self, base_url: str = API_URL, connect_timeout: float = 5, read_timeout: float = 300,
+                 retries: int = 3, backoff: float = 0.5, pool_size: int = 10):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        # No retry after a read timeout: the backend is still working on it and a resend only doubles the work
+        retry = Retry(total=retries, connect=retries, read=0, status=retries, backoff_factor=backoff,
+                      status_forcelist=RETRY_STATUSES, respect_retry_after_header=True, raise_on_status=False,
+                      # Analyses are idempotent (and cached server-side), so POSTs are safe to retry;
+                      # urllib3 rewinds file bodies before resending them
+                      allowed_methods=frozenset({"GET", "POST"}))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.session.post(f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+
+    def close(self) -> None:
+        self.session.close()
+
+def _request_error(e: requests.RequestException) -> str:
+    # Read timeouts surface as a ConnectionError wrapping urllib3's ReadTimeoutError
+    reason = getattr(e.args[0], "reason", None) if e.args else None
+    if isinstance(e, requests.exceptions.ReadTimeout) or isinstance(reason, ReadTimeoutError):
+        return "Timed out waiting for the backend (raise --timeout for slow AI responses)"
+    if isinstance(e, requests.exceptions.ConnectionError):
+        return "Cannot connect to backend. Is the FastAPI server running?"
+    return f"Request failed: {e}"
+
+def _post_file(client: ApiClient, path: str, file_path: Path, version: str, **kwargs) -> requests.Response:
+    # Read up front so a retry resends the same bytes
+    return client.post(path, files={"file": (file_path.name, file_path.read_bytes())}, data={"version": version},
+                       **kwargs)
+
+def analyze(file_path: str, version: str, client: Optional[ApiClient] = None) -> bool:
     """
     Analyze Kubernetes YAML for deprecated APIs and suggest upgrades using AI.
     """
+    client = client or ApiClient()
     file_path_obj = Path(file_path)
     if not file_path_obj.exists():
         console.print(f"[bold red]Error:[/bold red] File '{file_path}' not found.")
-        return
+        return False
 
-    with file_path_obj.open("rb") as f:
-        files = {"file": (file_path_obj.name, f)}
-        data = {"version": version}
-        try:
-            console.print(f"[blue]Uploading and analyzing file '{file_path_obj.name}' for version {version}...[/blue]")
-            response = requests.post(API_URL, files=files, data=data)
-        except requests.exceptions.ConnectionError:
-            console.print("[red]Cannot connect to backend. Is the FastAPI server running?[/red]")
-            return
+    try:
+        console.print(f"[blue]Uploading and analyzing file '{file_path_obj.name}' for version {version}...[/blue]")
+        response = _post_file(client, "/analyze/", file_path_obj, version)
+    except requests.RequestException as e:
+        console.print(f"[red]{_request_error(e)}[/red]")
+        return False
 
     if response.status_code != 200:
         console.print(f"[red]Error from server:[/red] {response.text}")
-        return
+        return False
 
     result = response.json()
+    if "error" in result:
+        console.print(f"[red]Error from server:[/red] {result['error']}")
+        return False
     console.rule("[bold green]🧪 Pluto Output[/bold green]")
     console.print(result["pluto_output"], style="cyan")
 
     console.rule("[bold green]🤖 AI Suggestions[/bold green]")
     console.print(result["ai_response"], style="magenta")
+    if result.get("prompt_tokens"):
+        console.print(f"[dim]AI prompt: ~{result['prompt_tokens']} tokens[/dim]")
+    return True
+
+def _sse_events(response):
+    """Yield (event, data) pairs from a Server-Sent Events response as they arrive."""
+    event, data = "message", []
+    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+        if line:
+            field, _, value = line.partition(":")
+            if field == "event":
+                event = value.strip()
+            elif field == "data":
+                data.append(value[1:] if value.startswith(" ") else value)
+            continue
+        if data:
+            yield event, json.loads("\n".join(data))
+        event, data = "message", []
+
+def analyze_stream(file_path: str, version: str, client: Optional[ApiClient] = None) -> bool:
+    """
+    Like analyze, but renders the streamed response: pluto results as soon as detection
+    finishes, then the AI suggestions as they are generated.
+    """
+    client = client or ApiClient()
+    file_path_obj = Path(file_path)
+    if not file_path_obj.exists():
+        console.print(f"[bold red]Error:[/bold red] File '{file_path}' not found.")
+        return False
+
+    try:
+        console.print(f"[blue]Uploading and analyzing file '{file_path_obj.name}' for version {version}...[/blue]")
+        response = _post_file(client, "/analyze/stream", file_path_obj, version, stream=True)
+    except requests.RequestException as e:
+        console.print(f"[red]{_request_error(e)}[/red]")
+        return False
+
+    if response.status_code != 200:
+        console.print(f"[red]Error from server:[/red] {response.text}")
+        return False
+
+    failed = False
+    with response:
+        for event, payload in _sse_events(response):
+            if event == "pluto":
+                console.rule("[bold green]🧪 Pluto Output[/bold green]")
+                console.print(payload, style="cyan")
+                console.rule("[bold green]🤖 AI Suggestions[/bold green]")
+            elif event == "token":
+                console.print(payload, style="magenta", end="", markup=False, highlight=False, soft_wrap=True)
+            elif event == "error":
+                console.print(f"\n[red]Error from server:[/red] {payload.get('error')}")
+                failed = True
+            elif event == "done":
+                console.print()
+                if payload.get("prompt_tokens"):
+                    console.print(f"[dim]AI prompt: ~{payload['prompt_tokens']} tokens[/dim]")
+    return not failed
+
+def _findings(result: Dict) -> list:
+    output = result.get("pluto_output")
+    items = output.get("items") if isinstance(output, dict) else output
+    return items or []
+
+def _analyze_one(client: ApiClient, file_path: Path, version: str) -> Dict:
+    """One upload of the concurrent mode; errors are returned rather than raised."""
+    start = time.perf_counter()
+    try:
+        response = _post_file(client, "/analyze/", file_path, version)
+        if response.status_code == 200:
+            result = response.json()
+        else:
+            result = {"error": f"HTTP {response.status_code}: {response.text[:200]}"}
+    except requests.RequestException as e:
+        result = {"error": _request_error(e)}
+    except ValueError:
+        result = {"error": "Invalid JSON in response"}
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+def analyze_many(file_paths: List[Path], version: str, client: ApiClient, concurrency: int,
+                 output: Optional[str] = None) -> bool:
+    """
+    Analyze each file with its own /analyze/ request, `concurrency` at a time over the
+    client's keep-alive connections, showing progress. Prints a table of the files using
+    deprecated APIs or failing; `output` receives every result (AI plans included) as JSON.
+    """
+    file_paths = list(dict.fromkeys(file_paths))
+    results: Dict[str, Dict] = {}
+    start = time.perf_counter()
+    progress = Progress(TextColumn("[blue]Analyzing"), BarColumn(), MofNCompleteColumn(),
+                        TextColumn("{task.fields[status]}"), TimeElapsedColumn(), TimeRemainingColumn(), console=console)
+    with progress, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        task = progress.add_task("analyze", total=len(file_paths), status="")
+        futures = {pool.submit(_analyze_one, client, path, version): path for path in file_paths}
+        failures = 0
+        for future in as_completed(futures):
+            result = results[str(futures[future])] = future.result()
+            failures += "error" in result
+            progress.update(task, advance=1, status=f"[red]{failures} failed[/red]" if failures else "")
+    elapsed = time.perf_counter() - start
+
+    table = Table("File", "Deprecated APIs", "Removed", "Seconds", "Error")
+    table.columns[0].overflow = "fold"
+    for name, result in sorted(results.items()):
+        findings = _findings(result)
+        if findings or "error" in result:
+            table.add_row(name, str(len(findings)), str(sum(1 for item in findings if item.get("removed"))),
+                          f"{result['seconds']:.2f}", result.get("error", ""))
+    if table.row_count:
+        console.print(table)
+    with_findings = sum(1 for result in results.values() if _findings(result))
+    failed = sum(1 for result in results.values() if "error" in result)
+    console.print(f"{len(results)} file(s) analyzed in {elapsed:.1f}s ({len(results) / elapsed:.1f} files/s): "
+                  f"{with_findings} use deprecated APIs, {failed} failed")
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        console.print(f"[dim]Results written to {output}[/dim]")
+    return not failed
+
+def _manifest_files(directory: Path) -> List[Path]:
+    return sorted(path for path in directory.rglob("*") if path.suffix in YAML_SUFFIXES and path.is_file())
+
+def _pack_directory(directory: Path, archive) -> int:
+    """Write the YAML manifests (and chart templates) under `directory` into a gzipped tar; returns the number of files."""
+    count = 0
+    with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+        for path in sorted(directory.rglob("*")):
+            if path.suffix in YAML_SUFFIXES + CHART_SUFFIXES and path.is_file() and not path.is_symlink():
+                tar.add(path, arcname=str(path.relative_to(directory)))
+                count += 1
+    return count
+
+def analyze_directory(directory: str, version: str, client: Optional[ApiClient] = None) -> bool:
+    """
+    Analyze every manifest under a directory in one request: the manifests are packed
+    into a compressed tarball that is streamed to the batch endpoint.
+    """
+    client = client or ApiClient()
+    dir_path = Path(directory)
+    if not dir_path.is_dir():
+        console.print(f"[bold red]Error:[/bold red] Directory '{directory}' not found.")
+        return False
+
+    with tempfile.TemporaryFile() as archive:
+        count = _pack_directory(dir_path, archive)
+        if not count:
+            console.print(f"[yellow]No YAML manifests found in '{directory}'.[/yellow]")
+            return True
+        archive.seek(0)
+        try:
+            console.print(f"[blue]Uploading {count} manifest(s) from '{directory}' for version {version}...[/blue]")
+            # A file object body is streamed rather than read into memory
+            response = client.post("/analyze/batch", params={"version": version}, data=archive,
+                                   headers={"Content-Type": "application/gzip"})
+        except requests.RequestException as e:
+            console.print(f"[red]{_request_error(e)}[/red]")
+            return False
+
+    if response.status_code != 200:
+        console.print(f"[red]Error from server:[/red] {response.text}")
+        return False
+
+    result = response.json()
+    if "error" in result:
+        console.print(f"[red]Error from server:[/red] {result['error']}")
+        return False
+
+    console.rule("[bold green]🧪 Deprecated APIs by File[/bold green]")
+    table = Table("File", "Kind", "Name", "API", "Replacement", "Removed")
+    for file_name, items in sorted(result["files"].items()):
+        for item in items:
+            api = item.get("api", {})
+            table.add_row(file_name, api.get("kind", ""), item.get("name", ""), api.get("version", ""),
+                          api.get("replacement-api", ""), "yes" if item.get("removed") else "no")
+    console.print(table)
+    console.print(f"{len(result['files'])} of {result['files_scanned']} file(s) use deprecated APIs")
+
+    console.rule("[bold green]🤖 AI Suggestions[/bold green]")
+    console.print(result["ai_response"], style="magenta")
+    if result.get("prompt_tokens"):
+        console.print(f"[dim]AI prompt: ~{result['prompt_tokens']} tokens[/dim]")
+    return True
 
 def main():
     parser = argparse.ArgumentParser(description="Analyze Kubernetes YAML for deprecated APIs and suggest upgrades using AI.")
-    parser.add_argument("file", help="Path to kubeconfig or YAML file")
+    parser.add_argument("files", nargs="*", help="Paths to YAML files (several are analyzed concurrently)")
+    parser.add_argument("--dir", "-d", help="Analyze all YAML files under this directory in one request")
+    parser.add_argument("--per-file", action="store_true", help="With --dir, analyze each file separately and concurrently")
     parser.add_argument("--version", "-v", required=True, help="Target Kubernetes version")
+    parser.add_argument("--stream", "-s", action="store_true", help="Show results as they are produced instead of waiting for the full response")
+    parser.add_argument("--api-url", default=API_URL, help=f"Backend URL (default: $K8S_HELPER_API_URL or {API_URL})")
+    parser.add_argument("--concurrency", "-c", type=int, default=8, help="Parallel requests when analyzing several files (default: 8)")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for a response (default: 300)")
+    parser.add_argument("--connect-timeout", type=float, default=5, help="Seconds to wait for a connection (default: 5)")
+    parser.add_argument("--retries", type=int, default=3, help="Retries for connection errors and 429/502/503/504 (default: 3)")
+    parser.add_argument("--backoff", type=float, default=0.5, help="Backoff factor between retries, doubled each time (default: 0.5)")
+    parser.add_argument("--output", "-o", help="With several files, write every result (AI plans included) to this JSON file")
     
     args = parser.parse_args()
-    analyze(args.file, args.version)
+    concurrency = max(1, args.concurrency)
+    client = ApiClient(args.api_url, args.connect_timeout, args.timeout, args.retries, args.backoff, pool_size=concurrency)
+    with client.session:
+        if args.dir and args.per_file:
+            files = _manifest_files(Path(args.dir))
+            if not files:
+                console.print(f"[yellow]No YAML manifests found in '{args.dir}'.[/yellow]")
+                return 0
+            ok = analyze_many(files, args.version, client, concurrency, args.output)
+        elif args.dir:
+            ok = analyze_directory(args.dir, args.version, client)
+        elif not args.files:
+            parser.error("a file or --dir is required")
+        elif len(args.files) > 1:
+            missing = [name for name in args.files if not Path(name).is_file()]
+            if missing:
+                console.print(f"[bold red]Error:[/bold red] File(s) not found: {', '.join(missing)}")
+                return 1
+            ok = analyze_many([Path(name) for name in args.files], args.version, client, concurrency, args.output)
+        elif args.stream:
+            ok = analyze_stream(args.files[0], args.version, client)
+        else:
+            ok = analyze(args.files[0], args.version, client)
+    return 0 if ok else 1
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
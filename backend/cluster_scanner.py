@@ -0,0 +1,525 @@
+import asyncio
+import base64
+import gzip
+import ipaddress
+import json
+import os
+import re
+import socket
+import ssl
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import httpx
+import yaml_backend
+from api_detector import check_resource, normalize_version
+from api_rules import default_rules
+from result_cache import content_key
+
+# Concurrent API requests per scan; namespaces are scanned by this many workers
+CLUSTER_SCAN_CONCURRENCY = int(os.getenv("CLUSTER_SCAN_CONCURRENCY", "8"))
+# Objects requested per list call (the API server pages with limit/continue)
+CLUSTER_PAGE_SIZE = int(os.getenv("CLUSTER_PAGE_SIZE", "500"))
+CLUSTER_TIMEOUT = float(os.getenv("CLUSTER_TIMEOUT", "30"))
+
+LAST_APPLIED = "kubectl.kubernetes.io/last-applied-configuration"
+# Helm 3 stores each release revision in a secret; only the deployed one is current
+HELM_RELEASE_SELECTOR = "owner=helm,status=deployed"
+# Namespaces are DNS labels; checked before a name is put into an API path
+NAMESPACE_RE = re.compile(r"^[a-z0-9]([-a-z0-9]{0,61}[a-z0-9])?$")
+_SERVICE_ACCOUNT_DIR = Path("/var/run/secrets/kubernetes.io/serviceaccount")
+# API servers an uploaded kubeconfig may point at, comma separated (".example.com" matches subdomains);
+# unset allows any host that doesn't resolve to a loopback, link-local or metadata address
+CLUSTER_SERVER_HOSTS = {host.strip().lower() for host in os.getenv("CLUSTER_SERVER_HOSTS", "").split(",") if host.strip()}
+# Cloud metadata endpoints outside the link-local ranges (AWS IPv6, Alibaba Cloud)
+_METADATA_ADDRESSES = {ipaddress.ip_address("fd00:ec2::254"), ipaddress.ip_address("100.100.100.200")}
+
+
+class KubeConfigError(ValueError):
+    """Raised for kubeconfigs that are malformed or use an unsupported authentication method."""
+
+
+class ClusterError(Exception):
+    """Raised when the API server cannot be reached or answers a request with an error."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _allowed_host(host: str) -> bool:
+    return any(host == allowed or (allowed.startswith(".") and host.endswith(allowed)) for allowed in CLUSTER_SERVER_HOSTS)
+
+
+def validate_server_url(url: str) -> str:
+    """
+    Check the API server of an uploaded kubeconfig, so an upload cannot make the server
+    call its own loopback services or cloud metadata endpoints. Hosts in CLUSTER_SERVER_HOSTS
+    are always allowed (plain http only for those); other hosts must use https and resolve to
+    addresses that are not loopback, link-local, multicast, reserved or metadata addresses.
+    Raises KubeConfigError.
+    """
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    if parsed.scheme not in ("http", "https") or not host:
+        raise KubeConfigError("Cluster server must be an http(s) URL")
+    if _allowed_host(host):
+        return url
+    if CLUSTER_SERVER_HOSTS:
+        raise KubeConfigError(f"Cluster server {host} is not in CLUSTER_SERVER_HOSTS")
+    if parsed.scheme != "https":
+        raise KubeConfigError("Cluster server must use https")
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parsed.port or 443)}
+    except socket.gaierror:
+        raise KubeConfigError(f"Cannot resolve cluster server: {host}")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0])
+        if ip.is_loopback or ip.is_link_local or ip.is_multicast or ip.is_reserved or ip.is_unspecified \
+                or ip in _METADATA_ADDRESSES:
+            raise KubeConfigError(f"Cluster server {host} resolves to a disallowed address")
+    return url
+
+
+def _named(entries, name: str, section: str) -> Dict:
+    for entry in entries or []:
+        if isinstance(entry, dict) and entry.get("name") == name:
+            return entry.get(section) or {}
+    raise KubeConfigError(f"Kubeconfig has no {section} named '{name}'")
+
+
+def _file_or_data(settings: Dict, key: str, base_dir: Optional[Path]) -> Optional[bytes]:
+    """Read `<key>-data` (base64) or the file referenced by `<key>`."""
+    if settings.get(f"{key}-data"):
+        try:
+            return base64.b64decode(settings[f"{key}-data"])
+        except ValueError:
+            raise KubeConfigError(f"Invalid base64 in {key}-data")
+    if settings.get(key):
+        if base_dir is None:
+            # An uploaded kubeconfig must not make the server read (and send) its own files
+            raise KubeConfigError(f"File references ({key}) are not allowed in an uploaded kubeconfig; embed the credentials instead")
+        path = Path(settings[key])
+        if not path.is_absolute():
+            path = base_dir / path
+        try:
+            return path.read_bytes()
+        except OSError as e:
+            raise KubeConfigError(f"Cannot read {key}: {str(e)}")
+    return None
+
+
+@dataclass(frozen=True)
+class ClusterConfig:
+    """Connection settings for one cluster, taken from a kubeconfig context."""
+    name: str
+    server: str
+    token: Optional[str] = None
+    username: Optional[str] = None
+    password: Optional[str] = field(default=None, repr=False)
+    ca_data: Optional[bytes] = field(default=None, repr=False)
+    client_cert_data: Optional[bytes] = field(default=None, repr=False)
+    client_key_data: Optional[bytes] = field(default=None, repr=False)
+    insecure: bool = False
+
+    @classmethod
+    def from_kubeconfig(cls, text: str, context: Optional[str] = None,
+                        base_dir: Optional[Path] = None) -> "ClusterConfig":
+        """
+        Build the config of `context` (default: current-context) from kubeconfig YAML.
+        Files referenced by the kubeconfig are resolved against `base_dir`; without one
+        (uploaded kubeconfigs) only embedded `*-data` credentials are accepted and the
+        server must pass validate_server_url.
+        """
+        try:
+            data = yaml_backend.safe_load(text)
+        except yaml_backend.YAMLError as e:
+            raise KubeConfigError(f"Kubeconfig is not valid YAML: {str(e)}")
+        if not isinstance(data, dict) or not data.get("clusters"):
+            raise KubeConfigError("Not a kubeconfig: no clusters defined")
+
+        context_name = context or data.get("current-context")
+        if not context_name:
+            raise KubeConfigError("Kubeconfig has no current-context; pick a context")
+        context_settings = _named(data.get("contexts"), context_name, "context")
+        cluster = _named(data.get("clusters"), context_settings.get("cluster"), "cluster")
+        user = _named(data.get("users"), context_settings["user"], "user") if context_settings.get("user") else {}
+
+        if user.get("exec") or user.get("auth-provider"):
+            # Credential plugins run arbitrary local commands, which an upload must not trigger
+            raise KubeConfigError("Credential plugins (exec/auth-provider) are not supported; use a token or client certificate")
+        if not cluster.get("server"):
+            raise KubeConfigError(f"Cluster of context '{context_name}' has no server")
+        if base_dir is None:
+            validate_server_url(cluster["server"])
+
+        token = user.get("token")
+        if not token and user.get("tokenFile"):
+            token = (_file_or_data(user, "tokenFile", base_dir) or b"").decode().strip()
+        return cls(
+            name=context_name,
+            server=cluster["server"].rstrip("/"),
+            token=token or None,
+            username=user.get("username"),
+            password=user.get("password"),
+            ca_data=_file_or_data(cluster, "certificate-authority", base_dir),
+            client_cert_data=_file_or_data(user, "client-certificate", base_dir),
+            client_key_data=_file_or_data(user, "client-key", base_dir),
+            insecure=bool(cluster.get("insecure-skip-tls-verify", False))
+        )
+
+    @property
+    def identity(self) -> str:
+        """Stable key for this cluster and user, used to cache scan results."""
+        return content_key(self.server.encode(), self.token or "", self.username or "", self.password or "",
+                           (self.client_cert_data or b"").decode(errors="replace"))
+
+    def ssl_context(self) -> ssl.SSLContext:
+        try:
+            return self._ssl_context()
+        except (ssl.SSLError, ValueError) as e:
+            raise KubeConfigError(f"Invalid TLS settings in kubeconfig: {str(e)}")
+
+    def _ssl_context(self) -> ssl.SSLContext:
+        if self.insecure:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        elif self.ca_data:
+            context = ssl.create_default_context(cadata=self.ca_data.decode())
+        else:
+            context = ssl.create_default_context()
+        if self.client_cert_data and self.client_key_data:
+            # ssl only loads certificates from files; keep them on disk just long enough to load
+            with tempfile.TemporaryDirectory(prefix="k8s-client-cert-") as tmp:
+                cert_path, key_path = Path(tmp) / "client.crt", Path(tmp) / "client.key"
+                cert_path.write_bytes(self.client_cert_data)
+                key_path.write_bytes(self.client_key_data)
+                os.chmod(key_path, 0o600)
+                context.load_cert_chain(str(cert_path), str(key_path))
+        return context
+
+
+def load_default_config(context: Optional[str] = None) -> Optional[ClusterConfig]:
+    """
+    Config from KUBECONFIG (first file) or ~/.kube/config, falling back to the pod's
+    service account when running in a cluster. Returns None if none is available.
+    """
+    kubeconfig = os.getenv("KUBECONFIG", "").split(os.pathsep)[0] or str(Path.home() / ".kube" / "config")
+    path = Path(kubeconfig)
+    if path.is_file():
+        return ClusterConfig.from_kubeconfig(path.read_text(), context, base_dir=path.parent)
+
+    host, port = os.getenv("KUBERNETES_SERVICE_HOST"), os.getenv("KUBERNETES_SERVICE_PORT", "443")
+    if host and (_SERVICE_ACCOUNT_DIR / "token").is_file():
+        return ClusterConfig(
+            name="in-cluster",
+            server=f"https://{host}:{port}",
+            token=(_SERVICE_ACCOUNT_DIR / "token").read_text().strip(),
+            ca_data=(_SERVICE_ACCOUNT_DIR / "ca.crt").read_bytes() if (_SERVICE_ACCOUNT_DIR / "ca.crt").is_file() else None
+        )
+    return None
+
+
+@dataclass(frozen=True)
+class ResourceType:
+    """A listable resource found through API discovery."""
+    group_version: str
+    resource: str
+    kind: str
+    namespaced: bool
+
+    def path(self, namespace: Optional[str] = None) -> str:
+        base = "/api/v1" if self.group_version == "v1" else f"/apis/{self.group_version}"
+        if namespace:
+            return f"{base}/namespaces/{namespace}/{self.resource}"
+        return f"{base}/{self.resource}"
+
+
+@dataclass
+class ClusterScan:
+    """Findings of one scan, grouped by namespace (None holds cluster-scoped objects)."""
+    target_version: Optional[str]
+    items: Dict[Optional[str], List[Dict]] = field(default_factory=dict)
+    errors: List[str] = field(default_factory=list)
+    requests: int = 0
+
+    def report(self, namespaces: Optional[List[Optional[str]]] = None) -> Dict[str, Any]:
+        """Frontend response for the given namespaces (all scanned ones by default)."""
+        scopes = list(self.items) if namespaces is None else namespaces
+        items = [item for scope in scopes for item in self.items.get(scope, [])]
+        return {
+            "items": items,
+            "target-versions": {"k8s": self.target_version or ""},
+            "namespaces": len([scope for scope in scopes if scope is not None]),
+            "errors": self.errors,
+            "scanned_at": time.time()
+        }
+
+
+def cluster_item(finding: Dict, kind: str, source: str, release: Optional[str] = None) -> Dict:
+    """
+    Convert a pluto-style finding into the item the cluster UI renders. APIs already removed
+    in the target version are DEPRECATED (must migrate now), deprecated-only ones are WARNING.
+    """
+    api = finding["api"]
+    item = {
+        "object": {"namespace": finding["namespace"], "kind": kind, "name": finding["name"]},
+        "deprecatedVersion": api["version"],
+        "replacementVersion": api["replacement-api"],
+        "deprecatedIn": api["deprecated-in"],
+        "removedIn": api["removed-in"],
+        "status": "DEPRECATED" if finding["removed"] else "WARNING",
+        "source": source
+    }
+    if release:
+        item["release"] = release
+    return item
+
+
+def _decode_release(secret: Dict) -> Optional[Dict]:
+    """Helm 3 release secret: base64 (secret encoding) of base64 of gzipped release JSON."""
+    try:
+        payload = base64.b64decode(base64.b64decode((secret.get("data") or {})["release"]))
+        if payload[:2] == b"\x1f\x8b":
+            payload = gzip.decompress(payload)
+        return json.loads(payload)
+    except (KeyError, ValueError, OSError, EOFError):
+        return None
+
+
+class ClusterScanner:
+    """
+    Finds deprecated APIs in a live cluster. Objects are read back as they were applied
+    (the last-applied-configuration annotation), since the API server converts stored
+    objects to whatever version is requested. Helm release manifests are checked too.
+
+    Lists are paginated with limit/continue; namespaces are scanned by a bounded pool of
+    workers and every API request takes a slot from the same semaphore.
+
+    Use as an async context manager:
+        async with ClusterScanner(config) as scanner:
+            scan = await scanner.scan()
+    """
+
+    def __init__(self, config: ClusterConfig, concurrency: int = CLUSTER_SCAN_CONCURRENCY,
+                 page_size: int = CLUSTER_PAGE_SIZE, timeout: float = CLUSTER_TIMEOUT,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.config = config
+        self.concurrency = max(1, concurrency)
+        self.page_size = page_size
+        self.timeout = timeout
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._requests = 0
+
+    async def __aenter__(self) -> "ClusterScanner":
+        headers = {"Accept": "application/json"}
+        if self.config.token:
+            headers["Authorization"] = f"Bearer {self.config.token}"
+        auth = (self.config.username, self.config.password or "") if self.config.username and not self.config.token else None
+        verify = self.config.ssl_context() if self.config.server.startswith("https") else True
+        self._client = httpx.AsyncClient(
+            base_url=self.config.server, headers=headers, auth=auth, verify=verify, transport=self._transport,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        )
+        self._slots = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._client.aclose()
+
+    async def _get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Dict:
+        async with self._slots:
+            self._requests += 1
+            try:
+                response = await self._client.get(path, params=params)
+            except httpx.HTTPError as e:
+                raise ClusterError(f"Cannot reach {self.config.server}: {str(e) or type(e).__name__}")
+        if response.status_code != 200:
+            # The body is not passed on: the server must not relay what an arbitrary host answers
+            raise ClusterError(f"GET {path}: {response.status_code}", response.status_code)
+        return response.json()
+
+    async def list_pages(self, path: str, params: Optional[Dict[str, Any]] = None) -> AsyncIterator[List[Dict]]:
+        """Yield the items of a list call page by page, following the continue token."""
+        params = dict(params or {}, limit=self.page_size)
+        token, restarted = None, False
+        while True:
+            try:
+                page = await self._get(path, dict(params, **({"continue": token} if token else {})))
+            except ClusterError as e:
+                # 410 Gone: the continue token expired (etcd compaction); start over once
+                if e.status_code != 410 or restarted or token is None:
+                    raise
+                token, restarted = None, True
+                continue
+            yield page.get("items") or []
+            token = (page.get("metadata") or {}).get("continue")
+            if not token:
+                return
+
+    async def _list(self, path: str, params: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        return [item async for page in self.list_pages(path, params) for item in page]
+
+    async def discover(self) -> List[ResourceType]:
+        """
+        Resources whose kinds have deprecation rules, one listable resource per kind.
+        Each object is served under every version of its kind, so listing one suffices;
+        the replacement API is preferred because it is served by newer clusters.
+        """
+        rules = list(default_rules())
+        kinds = {rule.kind for rule in rules}
+        preferred_groups = [rule.replacement.rpartition("/")[0] for rule in rules]
+        groups = list(dict.fromkeys(preferred_groups + [rule.api_version.rpartition("/")[0] for rule in rules]))
+
+        served = (await self._get("/apis")).get("groups") or []
+        versions = {
+            group["name"]: [version["groupVersion"] for version in group.get("versions") or []]
+            for group in served
+        }
+        group_versions = [gv for group in groups for gv in versions.get(group, [])]
+        resource_lists = await asyncio.gather(
+            *(self._get(f"/apis/{gv}") for gv in group_versions), return_exceptions=True
+        )
+
+        found: Dict[str, ResourceType] = {}
+        for group_version, resource_list in zip(group_versions, resource_lists):
+            if isinstance(resource_list, Exception):
+                continue
+            for resource in resource_list.get("resources") or []:
+                if (resource.get("kind") in kinds and resource["kind"] not in found and "/" not in resource["name"]
+                        and "list" in (resource.get("verbs") or ["list"])):
+                    found[resource["kind"]] = ResourceType(group_version, resource["name"], resource["kind"],
+                                                           bool(resource.get("namespaced")))
+        return list(found.values())
+
+    def _check(self, doc: Any, target: Optional[str], source: str, release: Optional[str] = None,
+               namespace: str = "") -> Optional[Dict]:
+        if not isinstance(doc, dict):
+            return None
+        finding = check_resource(doc, source, target)
+        if finding is None:
+            return None
+        finding["namespace"] = finding["namespace"] or namespace
+        return cluster_item(finding, doc.get("kind", ""), source, release)
+
+    async def _scan_resource(self, resource: ResourceType, namespace: Optional[str], target: Optional[str],
+                             scan: ClusterScan) -> List[Dict]:
+        items = []
+        try:
+            async for page in self.list_pages(resource.path(namespace)):
+                for obj in page:
+                    annotation = ((obj.get("metadata") or {}).get("annotations") or {}).get(LAST_APPLIED)
+                    if not annotation:
+                        continue
+                    try:
+                        applied = json.loads(annotation)
+                    except ValueError:
+                        continue
+                    item = self._check(applied, target, "last-applied", namespace=namespace or "")
+                    if item:
+                        items.append(item)
+        except ClusterError as e:
+            # Missing permissions for one resource shouldn't fail the whole scan
+            if e.status_code not in (401, 403, 404):
+                raise
+            scan.errors.append(str(e))
+        return items
+
+    async def _scan_helm(self, namespace: str, target: Optional[str], scan: ClusterScan) -> List[Dict]:
+        items = []
+        try:
+            secrets = await self._list(f"/api/v1/namespaces/{namespace}/secrets",
+                                       {"labelSelector": HELM_RELEASE_SELECTOR})
+        except ClusterError as e:
+            if e.status_code not in (401, 403, 404):
+                raise
+            scan.errors.append(str(e))
+            return items
+
+        for secret in secrets:
+            release = _decode_release(secret)
+            if not release or not release.get("manifest"):
+                continue
+            try:
+                documents = list(yaml_backend.safe_load_all(release["manifest"]))
+            except yaml_backend.YAMLError:
+                scan.errors.append(f"Cannot parse manifest of Helm release {namespace}/{release.get('name')}")
+                continue
+            for doc in documents:
+                item = self._check(doc, target, "helm", release.get("name"), namespace)
+                if item:
+                    items.append(item)
+        return items
+
+    async def _scan_namespace(self, namespace: str, resources: List[ResourceType], target: Optional[str],
+                              scan: ClusterScan) -> None:
+        results = await asyncio.gather(
+            *(self._scan_resource(resource, namespace, target, scan) for resource in resources if resource.namespaced),
+            self._scan_helm(namespace, target, scan)
+        )
+        scan.items[namespace] = [item for result in results for item in result]
+
+    async def namespaces(self) -> List[str]:
+        return [namespace["metadata"]["name"] for namespace in await self._list("/api/v1/namespaces")]
+
+    async def scan(self, namespaces: Optional[List[str]] = None, target_version: Optional[str] = None) -> ClusterScan:
+        """
+        Scan the given namespaces, or every namespace plus cluster-scoped resources if None.
+        Raises ClusterError if the API server is unreachable or refuses discovery.
+        """
+        target = normalize_version(target_version)
+        scan = ClusterScan(target)
+        resources = await self.discover()
+        cluster_wide = namespaces is None
+        if cluster_wide:
+            namespaces = await self.namespaces()
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for namespace in namespaces:
+            queue.put_nowait(namespace)
+
+        async def worker():
+            # A fixed number of workers keeps thousands of namespaces from becoming thousands of tasks
+            while not queue.empty():
+                await self._scan_namespace(queue.get_nowait(), resources, target, scan)
+
+        async def cluster_scoped():
+            results = await asyncio.gather(
+                *(self._scan_resource(resource, None, target, scan) for resource in resources if not resource.namespaced)
+            )
+            scan.items[None] = [item for result in results for item in result]
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(namespaces)))),
+                             *([cluster_scoped()] if cluster_wide else []))
+        scan.requests = self._requests
+        return scan
+
+
+async def scan_cluster(config: ClusterConfig, namespaces: Optional[List[str]] = None,
+                       target_version: Optional[str] = None, **kwargs) -> ClusterScan:
+    async with ClusterScanner(config, **kwargs) as scanner:
+        return await scanner.scan(namespaces, target_version)
+
+
+def cache_keys(config: ClusterConfig, scan: ClusterScan, cluster_wide: bool) -> List[Tuple[str, List]]:
+    """
+    (cache key, scopes) pairs a finished scan can answer: a cluster scan also answers
+    every single-namespace request, so following a cluster scan with one namespace is free.
+    """
+    target = scan.target_version or ""
+    keys = [(scan_key(config, namespace, target), [namespace]) for namespace in scan.items if namespace is not None]
+    if cluster_wide:
+        keys.append((scan_key(config, None, target), list(scan.items)))
+    return keys
+
+
+def scan_key(config: ClusterConfig, namespace: Optional[str], target_version: Optional[str]) -> str:
+    return content_key(config.identity.encode(), "namespace" if namespace else "cluster", namespace or "",
+                       normalize_version(target_version) or "")
@@ -0,0 +1,229 @@
+"""
+Minimal Kubernetes API server for exercising the live-cluster scanner locally.
+
+Serves discovery, namespaces, a few namespaced and cluster-scoped resources and Helm
+release secrets, with limit/continue pagination. Every third workload was applied with
+a deprecated apiVersion (visible in its last-applied-configuration annotation) and every
+namespace has a Helm release whose manifest uses extensions/v1beta1. Requests need the
+bearer token written to the generated kubeconfig.
+
+Usage:
+    python devtools/fake_kube_api_server.py --port 8090 --namespaces 50 --latency 0.02 \
+        --write-kubeconfig /tmp/fake-kubeconfig.yaml
+    KUBECONFIG=/tmp/fake-kubeconfig.yaml uvicorn main:app
+    curl localhost:8000/api/pluto/cluster
+"""
+import argparse
+import base64
+import gzip
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+TOKEN = "fake-token"
+
+# (groupVersion, resource, kind, namespaced, apiVersion the objects were applied with)
+RESOURCES = [
+    ("apps/v1", "deployments", "Deployment", True, "extensions/v1beta1"),
+    ("apps/v1", "daemonsets", "DaemonSet", True, "extensions/v1beta1"),
+    ("networking.k8s.io/v1", "ingresses", "Ingress", True, "extensions/v1beta1"),
+    ("rbac.authorization.k8s.io/v1", "roles", "Role", True, "rbac.authorization.k8s.io/v1beta1"),
+    ("rbac.authorization.k8s.io/v1", "clusterroles", "ClusterRole", False, "rbac.authorization.k8s.io/v1beta1"),
+    ("storage.k8s.io/v1", "storageclasses", "StorageClass", False, "storage.k8s.io/v1beta1"),
+]
+
+HELM_MANIFEST = """---
+apiVersion: v1
+kind: Service
+metadata:
+  name: {name}
+spec:
+  ports:
+  - port: 80
+---
+apiVersion: extensions/v1beta1
+kind: Ingress
+metadata:
+  name: {name}
+spec:
+  backend:
+    serviceName: {name}
+    servicePort: 80
+"""
+
+
+def _object(api_version: str, kind: str, name: str, namespace=None):
+    metadata = {"name": name, "namespace": namespace} if namespace else {"name": name}
+    applied = {"apiVersion": api_version, "kind": kind, "metadata": metadata}
+    return {"metadata": dict(metadata, annotations={
+        "kubectl.kubernetes.io/last-applied-configuration": json.dumps(applied)
+    })}
+
+
+def _helm_secret(release: str, namespace: str, revision: int, status: str):
+    payload = json.dumps({"name": release, "namespace": namespace, "version": revision,
+                          "info": {"status": status}, "manifest": HELM_MANIFEST.format(name=release)})
+    # Helm base64-encodes the gzipped release, and secret data is base64 again on the wire
+    release_data = base64.b64encode(gzip.compress(payload.encode()))
+    return {
+        "metadata": {"name": f"sh.helm.release.v1.{release}.v{revision}", "namespace": namespace,
+                     "labels": {"owner": "helm", "name": release, "status": status, "version": str(revision)}},
+        "type": "helm.sh/release.v1",
+        "data": {"release": base64.b64encode(release_data).decode()}
+    }
+
+
+def build_cluster(namespaces: int, objects: int):
+    """{list path: [objects]} for every list the server answers."""
+    lists = {"/api/v1/namespaces": [{"metadata": {"name": f"ns-{n}"}} for n in range(namespaces)]}
+    for group_version, resource, kind, namespaced, applied_version in RESOURCES:
+        base = f"/apis/{group_version}"
+        if not namespaced:
+            lists[f"{base}/{resource}"] = [
+                _object(applied_version if i % 3 == 0 else group_version, kind, f"{resource}-{i}")
+                for i in range(objects)
+            ]
+            continue
+        for n in range(namespaces):
+            namespace = f"ns-{n}"
+            lists[f"{base}/namespaces/{namespace}/{resource}"] = [
+                _object(applied_version if i % 3 == 0 else group_version, kind, f"{resource}-{i}", namespace)
+                for i in range(objects)
+            ]
+    for n in range(namespaces):
+        namespace = f"ns-{n}"
+        lists[f"/api/v1/namespaces/{namespace}/secrets"] = [
+            _helm_secret(f"app-{n}", namespace, 1, "superseded"),
+            _helm_secret(f"app-{n}", namespace, 2, "deployed"),
+        ]
+    return lists
+
+
+def _matches(obj, selector: str) -> bool:
+    labels = obj["metadata"].get("labels") or {}
+    for requirement in filter(None, selector.split(",")):
+        key, _, value = requirement.partition("=")
+        if labels.get(key) != value:
+            return False
+    return True
+
+
+class FakeKubeAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+    lists = {}
+    stats = {"requests": 0, "pages": 0, "in_flight": 0, "max_in_flight": 0}
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _status(self, code: int, reason: str, message: str):
+        self._send_json(code, {"kind": "Status", "apiVersion": "v1", "status": "Failure",
+                               "reason": reason, "message": message, "code": code})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            with self.lock:
+                return self._send_json(200, dict(self.stats))
+        if self.headers.get("Authorization") != f"Bearer {TOKEN}":
+            return self._status(401, "Unauthorized", "Unauthorized")
+
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+        try:
+            time.sleep(self.config.latency)
+            self._answer(url.path, parse_qs(url.query))
+        finally:
+            with self.lock:
+                self.stats["in_flight"] -= 1
+
+    def _answer(self, path: str, query):
+        if path == "/apis":
+            groups = {}
+            for group_version, *_ in RESOURCES:
+                group, version = group_version.split("/")
+                groups[group] = {"name": group, "versions": [{"groupVersion": group_version, "version": version}],
+                                 "preferredVersion": {"groupVersion": group_version, "version": version}}
+            return self._send_json(200, {"kind": "APIGroupList", "groups": list(groups.values())})
+
+        discovery = [entry for entry in RESOURCES if path == f"/apis/{entry[0]}"]
+        if discovery:
+            return self._send_json(200, {"kind": "APIResourceList", "groupVersion": discovery[0][0], "resources": [
+                {"name": resource, "kind": kind, "namespaced": namespaced, "verbs": ["get", "list", "watch"]}
+                for _, resource, kind, namespaced, _ in discovery
+            ]})
+
+        if path not in self.lists:
+            return self._status(404, "NotFound", f"the server could not find the requested resource ({path})")
+
+        items = [obj for obj in self.lists[path] if _matches(obj, query.get("labelSelector", [""])[0])]
+        start = int(query.get("continue", ["0"])[0] or 0)
+        limit = int(query.get("limit", ["0"])[0] or 0) or len(items)
+        page = items[start:start + limit]
+        metadata = {"resourceVersion": "1"}
+        if start + limit < len(items):
+            metadata["continue"] = str(start + limit)
+        with self.lock:
+            self.stats["pages"] += 1
+        self._send_json(200, {"kind": "List", "apiVersion": "v1", "metadata": metadata, "items": page})
+
+
+def kubeconfig(server: str) -> str:
+    return json.dumps({
+        "apiVersion": "v1", "kind": "Config", "current-context": "fake",
+        "clusters": [{"name": "fake", "cluster": {"server": server}}],
+        "users": [{"name": "fake", "user": {"token": TOKEN}}],
+        "contexts": [{"name": "fake", "context": {"cluster": "fake", "user": "fake"}}]
+    }, indent=2)
+
+
+def serve(host: str = "127.0.0.1", port: int = 8090, namespaces: int = 10, objects: int = 6,
+          latency: float = 0.0) -> ThreadingHTTPServer:
+    """Start the server on a background thread and return it (call .shutdown() to stop)."""
+    FakeKubeAPIHandler.config = argparse.Namespace(latency=latency)
+    FakeKubeAPIHandler.lists = build_cluster(namespaces, objects)
+    server = ThreadingHTTPServer((host, port), FakeKubeAPIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Kubernetes API server for cluster scans")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--namespaces", type=int, default=10)
+    parser.add_argument("--objects", type=int, default=6, help="Objects per resource and namespace")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--write-kubeconfig", metavar="PATH", help="Write a kubeconfig for this server")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.namespaces, args.objects, args.latency)
+    url = f"http://{args.host}:{server.server_port}"
+    if args.write_kubeconfig:
+        with open(args.write_kubeconfig, "w") as f:
+            f.write(kubeconfig(url))
+    print(f"Fake Kubernetes API on {url} (stats at /stats)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
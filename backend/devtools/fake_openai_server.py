@@ -0,0 +1,158 @@
+"""
+Minimal OpenAI-compatible chat completions server for exercising the LLM code paths locally.
+
+Migration prompts (with a ```yaml block) are answered by running the rule engine over
+the YAML, analysis prompts get the JSON structure they ask for, anything else gets a
+short canned plan. Errors and latency can be injected to exercise retries and limits.
+
+Usage:
+    python devtools/fake_openai_server.py --port 8089 --latency 0.2 --error-rate 0.1
+    OPENAI_API_KEY=fake OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python llm_yaml_migrator.py ...
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import yaml_backend  # noqa: E402
+from api_rules import default_rules  # noqa: E402
+
+# Only the manifest under INPUT YAML is migrated, not example blocks in plan prompts
+_YAML_BLOCK_RE = re.compile(r"\*\*INPUT YAML:\*\*\s*```yaml\n(.*?)\n```", re.S)
+CANNED_PLAN = "## 🔴 CRITICAL MIGRATION PLAN\n\nUpdate each deprecated apiVersion to its replacement.\n"
+
+
+def migrate_text(text: str) -> str:
+    documents = []
+    for doc in yaml_backend.safe_load_all(text):
+        if isinstance(doc, dict):
+            rule = default_rules().lookup(doc.get("apiVersion", ""), doc.get("kind", ""))
+            if rule:
+                doc = rule.apply(doc)
+        documents.append(doc)
+    return yaml_backend.dump_all(documents)
+
+
+def answer(prompt: str) -> str:
+    match = _YAML_BLOCK_RE.search(prompt)
+    if not match:
+        return CANNED_PLAN
+    migrated = migrate_text(match.group(1))
+    if '"migrated_yaml"' in prompt:
+        return json.dumps({"deprecated_apis": [], "migrated_yaml": migrated,
+                           "analysis": "Migrated by the fake server.", "warnings": []})
+    return migrated
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+    stats = {"requests": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.lock:
+                return self._send_json(200, dict(self.stats))
+        self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": "not found"}})
+
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+        try:
+            time.sleep(self.config.latency)
+            if random.random() < self.config.error_rate:
+                with self.lock:
+                    self.stats["errors"] += 1
+                status = random.choice([429, 500, 503])
+                return self._send_json(status, {"error": {"message": f"injected {status}", "type": "fake"}},
+                                       {"Retry-After": "0"} if status == 429 else None)
+
+            prompt = "\n".join(message.get("content", "") for message in request.get("messages", []))
+            content = answer(prompt)
+            if request.get("stream"):
+                return self._stream(request, content)
+            self._send_json(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                          "total_tokens": (len(prompt) + len(content)) // 4}
+            })
+        finally:
+            with self.lock:
+                self.stats["in_flight"] -= 1
+
+    def _stream(self, request, content: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        words = re.findall(r"\S+\s*|\s+", content)
+        for word in words + [None]:
+            delta = {"content": word} if word is not None else {}
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": request.get("model", "fake"),
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": None if word is not None else "stop"}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+def serve(host: str = "127.0.0.1", port: int = 8089, latency: float = 0.0, error_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Start the server on a background thread and return it (call .shutdown() to stop)."""
+    FakeOpenAIHandler.config = argparse.Namespace(latency=latency, error_rate=error_rate)
+    server = ThreadingHTTPServer((host, port), FakeOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429/5xx")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.latency, args.error_rate)
+    print(f"Fake OpenAI server on http://{args.host}:{server.server_port}/v1 (stats at /stats)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,171 @@
-from git import Repo
+import base64
+import fcntl
+import hashlib
+import io
 import os
+import shutil
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+from git import Blob, Git, Repo
+from git.index.typ import BaseIndexEntry
+from gitdb import IStream
 
-def create_merge_request(repo_url: str, file_changes: dict, token: str):
-    repo = Repo.clone_from(repo_url, "/tmp/kube-repo", branch="main")
-    new_branch = "kube-api-upgrade"
-    repo.git.checkout("-b", new_branch)
-    
-    for filepath, content in file_changes.items():
-        full_path = os.path.join("/tmp/kube-repo", filepath)
-        with open(full_path, "w") as f:
-            f.write(content)
-        repo.index.add([full_path])
-    
-    repo.index.commit("Automated upgrade of deprecated Kubernetes APIs")
-    repo.remote().push(refspec=f"{new_branch}:{new_branch}")
-    return f"MR pushed to branch: {new_branch}"
+# Cached mirrors and per-call checkouts live here
+GIT_WORKSPACE_ROOT = os.getenv("GIT_WORKSPACE_ROOT", str(Path(tempfile.gettempdir()) / "k8s-git"))
+DEFAULT_BRANCH = "kube-api-upgrade"
+COMMIT_MESSAGE = "Automated upgrade of deprecated Kubernetes APIs"
 
+
+def _auth_env(repo_url: str, token: Optional[str]) -> Dict[str, str]:
+    """
+    Git environment that sends `token` to an http(s) remote. The token goes into an
+    extra auth header passed through the environment, so it never shows up in command
+    lines, remote URLs or the .git/config of a checkout.
+    """
+    if not token or urlparse(repo_url).scheme not in ("http", "https"):
+        return {}
+    # GitHub and GitLab both accept a token as the password of HTTP basic auth
+    credentials = base64.b64encode(f"oauth2:{token}".encode()).decode()
+    return {
+        "GIT_CONFIG_COUNT": "1",
+        "GIT_CONFIG_KEY_0": "http.extraHeader",
+        "GIT_CONFIG_VALUE_0": f"Authorization: Basic {credentials}",
+        "GIT_TERMINAL_PROMPT": "0",
+    }
+
+
+def _repo_path(path: str) -> str:
+    """Normalize a repository-relative path, rejecting paths that leave the repository."""
+    normalized = PurePosixPath(path.replace("\\", "/"))
+    if normalized.is_absolute() or ".." in normalized.parts or str(normalized) == ".":
+        raise ValueError(f"Refusing path outside the repository: {path}")
+    return str(normalized)
+
+
+def _sparse_pattern(path: str) -> str:
+    """Anchored, non-cone sparse-checkout pattern matching exactly one file."""
+    path = _repo_path(path)
+    escaped = "".join("\\" + char if char in "*?[]\\!#" else char for char in path)
+    return "/" + escaped
+
+
+class WorkspacePool:
+    """
+    Checkouts for automated changes, built from a cached bare mirror per repository.
+
+    The mirror is fetched incrementally (only the base branch tip, `--depth=1`) under a
+    lock, then each caller gets its own shallow clone of it in a unique directory with a
+    sparse checkout of just the paths it will change. Concurrent calls never share a
+    working tree, and a multi-GB repository is downloaded once instead of per call.
+    """
+
+    def __init__(self, root: str = GIT_WORKSPACE_ROOT):
+        self.root = Path(root)
+        self.mirrors_dir = self.root / "mirrors"
+        self.checkouts_dir = self.root / "checkouts"
+        self.mirrors_dir.mkdir(parents=True, exist_ok=True)
+        self.checkouts_dir.mkdir(parents=True, exist_ok=True)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def _mirror_path(self, repo_url: str) -> Path:
+        parsed = urlparse(repo_url)
+        # Credentials embedded in the URL must not produce a separate mirror
+        key = parsed._replace(netloc=parsed.netloc.rpartition("@")[2]).geturl() if parsed.scheme else repo_url
+        return self.mirrors_dir / (hashlib.sha256(key.encode()).hexdigest()[:24] + ".git")
+
+    @contextmanager
+    def _mirror_lock(self, mirror: Path) -> Iterator[None]:
+        # Thread lock for this process, file lock for other processes sharing the root
+        with self._locks_guard:
+            lock = self._locks.setdefault(str(mirror), threading.Lock())
+        with lock, open(str(mirror) + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def update_mirror(self, repo_url: str, base: str = "main", token: Optional[str] = None) -> Path:
+        """Create the mirror on first use, then fetch only what changed on `base`."""
+        mirror = self._mirror_path(repo_url)
+        with self._mirror_lock(mirror):
+            repo = Repo(mirror) if (mirror / "HEAD").exists() else Repo.init(mirror, bare=True)
+            with repo.git.custom_environment(**_auth_env(repo_url, token)):
+                repo.git.fetch("--depth=1", "--no-tags", repo_url, f"+refs/heads/{base}:refs/heads/{base}")
+        return mirror
+
+    def read_files(self, repo_url: str, base: str = "main", suffixes: Tuple[str, ...] = (".yaml", ".yml"),
+                   token: Optional[str] = None) -> Iterator[Tuple[str, bytes]]:
+        """
+        Yield (path, content) for files of `base` with one of `suffixes`, read straight
+        from the mirror so a repository can be scanned without checking it out.
+        """
+        mirror = self.update_mirror(repo_url, base, token)
+        for item in Repo(mirror).tree(base).traverse():
+            if item.type == "blob" and PurePosixPath(item.path).suffix in suffixes:
+                yield item.path, item.data_stream.read()
+
+    @staticmethod
+    def remote_branch_exists(repo_url: str, branch: str, token: Optional[str] = None) -> bool:
+        git = Git()
+        with git.custom_environment(**_auth_env(repo_url, token)):
+            return bool(git.ls_remote("--heads", repo_url, f"refs/heads/{branch}").strip())
+
+    @contextmanager
+    def checkout(self, repo_url: str, paths: Iterable[str], base: str = "main",
+                 token: Optional[str] = None) -> Iterator[Repo]:
+        """
+        Yield a fresh shallow checkout of `base` containing only `paths`, with origin
+        pointing at `repo_url`. The checkout is deleted when the block exits.
+        """
+        mirror = self.update_mirror(repo_url, base, token)
+        workdir = self.checkouts_dir / uuid.uuid4().hex
+        try:
+            # file:// makes git honour --depth for a local clone instead of hardlinking everything
+            repo = Repo.clone_from(mirror.as_uri(), workdir, depth=1, branch=base, single_branch=True,
+                                   no_checkout=True)
+            repo.git.sparse_checkout("set", "--no-cone", *[_sparse_pattern(path) for path in paths])
+            repo.git.checkout(base)
+            repo.remote().set_url(repo_url)
+            yield repo
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+@lru_cache(maxsize=None)
+def default_pool() -> WorkspacePool:
+    """Pool under GIT_WORKSPACE_ROOT shared by all callers in this process."""
+    return WorkspacePool()
+
+
+def create_merge_request(repo_url: str, file_changes: dict, token: str, branch: str = DEFAULT_BRANCH,
+                         base: str = "main", message: str = COMMIT_MESSAGE,
+                         pool: Optional[WorkspacePool] = None) -> str:
+    """Commit `file_changes` ({path: content}) on a new branch from `base` and push it."""
+    pool = pool or default_pool()
+    with pool.checkout(repo_url, file_changes, base, token) as repo:
+        repo.git.checkout("-b", branch)
+
+        # Contents go straight into the object database and are staged with one index.add.
+        # Entries with a known SHA never touch the working tree, and unlike adding paths,
+        # GitPython doesn't chdir into it (the cwd is process-wide, shared by concurrent calls).
+        entries = []
+        for filepath, content in file_changes.items():
+            filepath = _repo_path(filepath)
+            data = content.encode()
+            blob = repo.odb.store(IStream(Blob.type, len(data), io.BytesIO(data)))
+            existing = repo.index.entries.get((filepath, 0))
+            entries.append(BaseIndexEntry((existing.mode if existing else Blob.file_mode, blob.binsha, 0, filepath)))
+        repo.index.add(entries)
+
+        repo.index.commit(message)
+        with repo.git.custom_environment(**_auth_env(repo_url, token)):
+            repo.git.push("origin", f"{branch}:{branch}")
+    return f"MR pushed to branch: {branch}"
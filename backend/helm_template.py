@@ -0,0 +1,614 @@
+"""
+Pure-Python renderer for simple Helm charts, used when the helm binary is not installed.
+
+It covers what charts typically use to choose and fill in API versions: values, variables,
+if/else/with/range blocks, define/include/template, `.Capabilities` checks and the common
+Sprig functions (default, quote, toYaml, nindent, semverCompare, ...). A template using
+anything else (tpl, .Files, lookup, ...) raises TemplateError and is reported
+instead of rendered; the chart's other templates are still rendered.
+"""
+import base64
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import yaml_backend
+from api_rules import default_rules
+
+# Kubernetes version templates see when no target version is given (helm uses its own default too)
+DEFAULT_KUBE_VERSION = "v1.29.0"
+
+_ACTION_RE = re.compile(r"\{\{(-\s+|\s*)(.*?)(\s+-|\s*)\}\}", re.S)
+_TOKEN_RE = re.compile(r"""\s*("(?:[^"\\]|\\.)*"|`[^`]*`|[()|]|[^\s()|"`]+)""")
+_ASSIGN_RE = re.compile(r"^(\$\w*)\s*(:?=)\s*(.*)$", re.S)
+_RANGE_VARIABLES_RE = re.compile(r"^(\$\w*)\s*(?:,\s*(\$\w*)\s*)?:=\s*(.*)$", re.S)
+_NUMBER_RE = re.compile(r"-?\d+(\.\d+)?$")
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_]\w*$")
+_CONSTRAINT_RE = re.compile(r"(<=|>=|!=|=|<|>|~|\^)?\s*v?(\d+(?:\.\d+){0,2})(?:-[\w.]+)?")
+_MAX_INCLUDE_DEPTH = 100
+# Stands for "no piped value" (None is a valid value)
+_NOTHING = object()
+
+
+class TemplateError(ValueError):
+    """A template needs an unsupported feature, or failed on purpose (`required`, `fail`)."""
+
+
+def _semver(version: Any) -> Tuple[int, int, int]:
+    match = re.match(r"v?(\d+)(?:\.(\d+))?(?:\.(\d+))?", str(version).strip())
+    if not match:
+        raise TemplateError(f"invalid version {version!r}")
+    return tuple(int(part or 0) for part in match.groups())
+
+
+def _satisfies(operator: str, bound: Tuple[int, int, int], version: Tuple[int, int, int]) -> bool:
+    if operator in ("", "="):
+        return version == bound
+    if operator == "~":
+        return bound <= version < (bound[0], bound[1] + 1, 0)
+    if operator == "^":
+        return bound <= version < (bound[0] + 1, 0, 0)
+    return {"!=": version != bound, "<": version < bound, "<=": version <= bound,
+            ">": version > bound, ">=": version >= bound}[operator]
+
+
+def semver_compare(constraint: str, version: Any) -> bool:
+    """Sprig's semverCompare for the usual constraints (`>=1.19-0`, `>=1.16-0, <1.19-0`, `a || b`)."""
+    current = _semver(version)
+    for alternative in str(constraint).split("||"):
+        checks = _CONSTRAINT_RE.findall(alternative)
+        if checks and all(_satisfies(operator, _semver(bound), current) for operator, bound in checks):
+            return True
+    return False
+
+
+def _truthy(value: Any) -> bool:
+    if value is None:
+        return False
+    if isinstance(value, (bool, int, float, str, list, dict, tuple)):
+        return bool(value)
+    return True
+
+
+def _text(value: Any) -> str:
+    """Value as Go templates print it (helm prints missing values as empty strings)."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    return str(value)
+
+
+def _quote(value: Any) -> str:
+    return '"' + _text(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+
+
+def _to_yaml(value: Any) -> str:
+    if value is None:
+        return "null"
+    text = yaml_backend.dump(value, sort_keys=True, width=4096)
+    # Scalars are dumped as a document with an explicit end marker
+    if text.endswith("\n...\n"):
+        text = text[:-4]
+    return text.rstrip("\n")
+
+
+def _indent(spaces: int, text: Any) -> str:
+    padding = " " * int(spaces)
+    return padding + _text(text).replace("\n", "\n" + padding)
+
+
+def _printf(format_string: str, *args) -> str:
+    values = iter(args)
+
+    def verb(match):
+        if match.group(1) == "%":
+            return "%"
+        value = next(values, None)
+        if match.group(1) == "q":
+            return _quote(value)
+        if match.group(1) == "d":
+            return str(int(value or 0))
+        return _text(value)
+
+    return re.sub(r"%[-+# 0-9.]*([a-z%])", verb, format_string)
+
+
+def _index(collection: Any, *keys) -> Any:
+    for key in keys:
+        if isinstance(collection, dict):
+            collection = collection.get(key)
+        elif isinstance(collection, list) and isinstance(key, int) and -len(collection) <= key < len(collection):
+            collection = collection[key]
+        else:
+            return None
+    return collection
+
+
+def _kind(value: Any) -> str:
+    for python_type, kind in ((bool, "bool"), (int, "int"), (float, "float64"), (str, "string"), (dict, "map"),
+                              (list, "slice")):
+        if isinstance(value, python_type):
+            return kind
+    return "invalid" if value is None else "struct"
+
+
+def _fail(message: Any):
+    raise TemplateError(f"fail: {_text(message)}")
+
+
+def _required(message: Any, value: Any = None) -> Any:
+    if value is None or value == "":
+        raise TemplateError(f"required: {_text(message)}")
+    return value
+
+
+def _first_falsy(*values):
+    return next((value for value in values if not _truthy(value)), values[-1])
+
+
+def _first_truthy(*values):
+    return next((value for value in values if _truthy(value)), values[-1])
+
+
+FUNCTIONS: Dict[str, Callable] = {
+    "default": lambda default, value=None: value if _truthy(value) else default,
+    "quote": lambda *values: " ".join(_quote(value) for value in values if value is not None),
+    "squote": lambda *values: " ".join("'" + _text(value) + "'" for value in values if value is not None),
+    "upper": lambda value: _text(value).upper(),
+    "lower": lambda value: _text(value).lower(),
+    "title": lambda value: _text(value).title(),
+    "trim": lambda value: _text(value).strip(),
+    "trimSuffix": lambda suffix, value: _text(value)[:-len(suffix)] if suffix and _text(value).endswith(suffix)
+    else _text(value),
+    "trimPrefix": lambda prefix, value: _text(value)[len(prefix):] if _text(value).startswith(prefix)
+    else _text(value),
+    "trunc": lambda length, value: _text(value)[:length] if length >= 0 else _text(value)[length:],
+    "replace": lambda old, new, value: _text(value).replace(old, new),
+    "contains": lambda part, value: part in _text(value),
+    "hasPrefix": lambda prefix, value: _text(value).startswith(prefix),
+    "hasSuffix": lambda suffix, value: _text(value).endswith(suffix),
+    "regexMatch": lambda pattern, value: re.search(pattern, _text(value)) is not None,
+    "splitList": lambda separator, value: _text(value).split(separator),
+    "join": lambda separator, values: separator.join(_text(value) for value in values or []),
+    "toString": _text,
+    "int": lambda value: int(float(value or 0)),
+    "toYaml": _to_yaml,
+    "toJson": lambda value: json.dumps(value, separators=(",", ":"), sort_keys=True),
+    "indent": _indent,
+    "nindent": lambda spaces, text: "\n" + _indent(spaces, text),
+    "printf": _printf,
+    "print": lambda *values: "".join(_text(value) for value in values),
+    "required": _required,
+    "fail": _fail,
+    "eq": lambda value, *others: any(value == other for other in others),
+    "ne": lambda value, other: value != other,
+    "lt": lambda value, other: value < other,
+    "le": lambda value, other: value <= other,
+    "gt": lambda value, other: value > other,
+    "ge": lambda value, other: value >= other,
+    "not": lambda value: not _truthy(value),
+    "and": _first_falsy,
+    "or": _first_truthy,
+    "empty": lambda value=None: not _truthy(value),
+    "coalesce": lambda *values: next((value for value in values if _truthy(value)), None),
+    "ternary": lambda if_true, if_false, condition: if_true if _truthy(condition) else if_false,
+    "hasKey": lambda mapping, key: isinstance(mapping, dict) and key in mapping,
+    "index": _index,
+    "get": lambda mapping, key: (mapping or {}).get(key, ""),
+    "len": lambda value: len(value or ()),
+    "list": lambda *values: list(values),
+    "dict": lambda *pairs: {_text(key): value for key, value in zip(pairs[::2], pairs[1::2])},
+    "kindIs": lambda kind, value: _kind(value) == kind,
+    "semverCompare": semver_compare,
+    "b64enc": lambda value: base64.b64encode(_text(value).encode()).decode(),
+    "sha256sum": lambda value: hashlib.sha256(_text(value).encode()).hexdigest(),
+}
+
+
+def _lex(text: str) -> List[Tuple[str, str]]:
+    """Split a template into ("text", ...) and ("action", ...) tokens, applying {{- and -}} trimming."""
+    tokens = []
+    position = 0
+    trim_next = False
+    for match in _ACTION_RE.finditer(text):
+        chunk = text[position:match.start()]
+        if trim_next:
+            chunk = chunk.lstrip()
+        if match.group(1).startswith("-"):
+            chunk = chunk.rstrip()
+        if chunk:
+            tokens.append(("text", chunk))
+        body = match.group(2).strip()
+        if not (body.startswith("/*") and body.endswith("*/")):
+            tokens.append(("action", body))
+        trim_next = match.group(3).endswith("-")
+        position = match.end()
+    tail = text[position:]
+    if trim_next:
+        tail = tail.lstrip()
+    if tail:
+        tokens.append(("text", tail))
+    return tokens
+
+
+def parse(text: str, defines: Dict[str, list]) -> list:
+    """
+    Parse a template into nodes: ("text", str), ("action", expression), ("assign", variable,
+    expression, declare) and block lists [keyword, [(condition, body), ...], else_body,
+    range variables]. `define` blocks go into `defines`.
+    """
+    nodes: list = []
+    body = nodes
+    stack = []
+    for kind, value in _lex(text):
+        if kind == "text":
+            body.append(("text", value))
+            continue
+        keyword, _, rest = value.partition(" ")
+        rest = rest.strip()
+        if keyword in ("if", "with", "range"):
+            variables = ()
+            match = _RANGE_VARIABLES_RE.match(rest) if keyword == "range" else None
+            if match:
+                # {{ range $value := ... }} or {{ range $key, $value := ... }}
+                variables = (match.group(1), match.group(2)) if match.group(2) else (None, match.group(1))
+                rest = match.group(3)
+            elif keyword != "range" and _ASSIGN_RE.match(rest):
+                raise TemplateError(f"variables in {{{{ {keyword} }}}} are not supported")
+            block = [keyword, [(rest, [])], None, variables]
+            body.append(block)
+            stack.append((block, body))
+            body = block[1][0][1]
+        elif keyword == "define":
+            block = ["define", _string_literal(rest), []]
+            stack.append((block, body))
+            body = block[2]
+        elif keyword == "else":
+            if not stack or stack[-1][0][0] == "define":
+                raise TemplateError("unexpected {{ else }}")
+            block = stack[-1][0]
+            chained, _, condition = rest.partition(" ")
+            if chained and chained == block[0] and chained != "range":
+                block[1].append((condition.strip(), []))
+                body = block[1][-1][1]
+            elif not rest:
+                block[2] = []
+                body = block[2]
+            else:
+                raise TemplateError(f"unsupported {{{{ else {rest} }}}}")
+        elif keyword == "end":
+            if not stack:
+                raise TemplateError("unexpected {{ end }}")
+            block, body = stack.pop()
+            if block[0] == "define":
+                defines[block[1]] = block[2]
+        elif keyword in ("block", "break", "continue"):
+            raise TemplateError(f"{{{{ {keyword} }}}} is not supported")
+        elif _ASSIGN_RE.match(value):
+            variable, operator, expression = _ASSIGN_RE.match(value).groups()
+            body.append(("assign", variable, expression, operator == ":="))
+        else:
+            body.append(("action", value))
+    if stack:
+        raise TemplateError(f"unclosed {{{{ {stack[-1][0][0]} }}}}")
+    return nodes
+
+
+def _string_literal(token: str) -> str:
+    token = token.strip()
+    if token.startswith("`") and token.endswith("`"):
+        return token[1:-1]
+    try:
+        value = json.loads(token)
+    except ValueError:
+        value = None
+    if not isinstance(value, str):
+        raise TemplateError(f"expected a string, got {token!r}")
+    return value
+
+
+def _tokens(expression: str) -> List[str]:
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = _TOKEN_RE.match(expression, position)
+        if not match:
+            raise TemplateError(f"can't parse {expression!r}")
+        tokens.append(match.group(1))
+        position = match.end()
+    return tokens
+
+
+def _pipeline(tokens: List[str], position: int = 0) -> Tuple[list, int]:
+    """Commands of a pipeline; a nested list in a command is a parenthesized pipeline."""
+    commands: list = [[]]
+    while position < len(tokens):
+        token = tokens[position]
+        position += 1
+        if token == "(":
+            inner, position = _pipeline(tokens, position)
+            commands[-1].append(inner)
+        elif token == ")":
+            return commands, position
+        elif token == "|":
+            commands.append([])
+        else:
+            commands[-1].append(token)
+    if any(not command for command in commands):
+        raise TemplateError(f"empty command in {' '.join(tokens)!r}")
+    return commands, position
+
+
+class _APIVersions:
+    """`.Capabilities.APIVersions`: deprecated APIs count as available until their removal release."""
+
+    def __init__(self, kube_version: str):
+        self.kube_version = _semver(kube_version)
+
+    def Has(self, api: str) -> bool:
+        group_version, _, kind = api.rpartition("/") if api.count("/") == 2 else (api, "", "")
+        for rule in default_rules():
+            if rule.api_version == group_version and kind in ("", rule.kind) and rule.removed_in \
+                    and self.kube_version >= _semver(rule.removed_in):
+                return False
+        return True
+
+
+class _Scope(dict):
+    """Template variables of one block; lookups fall through to the enclosing blocks."""
+
+    def __init__(self, parent: Optional["_Scope"] = None, **variables):
+        super().__init__(variables)
+        self.parent = parent
+
+    def find(self, name: str) -> "_Scope":
+        scope = self
+        while scope is not None:
+            if name in scope:
+                return scope
+            scope = scope.parent
+        raise TemplateError(f"undefined variable {name}")
+
+
+class TemplateRenderer:
+    """Evaluates parsed templates against a context; `include` looks names up in `defines`."""
+
+    def __init__(self, defines: Dict[str, list]):
+        self.defines = defines
+        self._pipelines: Dict[str, list] = {}
+        self._depth = 0
+        self.functions = dict(FUNCTIONS, include=self._include, template=self._include)
+
+    def render(self, nodes: list, dot: Any, scope: Optional[_Scope] = None) -> str:
+        # `$` is the data the template was executed (or included) with
+        scope = scope if scope is not None else _Scope(**{"$": dot})
+        output = []
+        for node in nodes:
+            if node[0] == "text":
+                output.append(node[1])
+            elif node[0] == "action":
+                output.append(_text(self.evaluate(node[1], dot, scope)))
+            elif node[0] == "assign":
+                _, variable, expression, declare = node
+                (scope if declare else scope.find(variable))[variable] = self.evaluate(expression, dot, scope)
+            else:
+                output.append(self._block(node, dot, scope))
+        return "".join(output)
+
+    def _block(self, block: list, dot: Any, scope: _Scope) -> str:
+        keyword, branches, else_body, variables = block
+        if keyword == "range":
+            value = self.evaluate(branches[0][0], dot, scope)
+            if isinstance(value, dict):
+                items = [(key, value[key]) for key in sorted(value)]
+            elif isinstance(value, int) and not isinstance(value, bool):
+                items = list(enumerate(range(value)))
+            else:
+                items = list(enumerate(value or []))
+            if not items:
+                return self.render(else_body or [], dot, _Scope(scope))
+            output = []
+            key_variable, value_variable = variables or (None, None)
+            for key, item in items:
+                inner = _Scope(scope)
+                if key_variable:
+                    inner[key_variable] = key
+                if value_variable:
+                    inner[value_variable] = item
+                output.append(self.render(branches[0][1], item, inner))
+            return "".join(output)
+        for condition, body in branches:
+            value = self.evaluate(condition, dot, scope)
+            if _truthy(value):
+                return self.render(body, value if keyword == "with" else dot, _Scope(scope))
+        return self.render(else_body or [], dot, _Scope(scope))
+
+    def _include(self, name: str, data: Any = None) -> str:
+        if name not in self.defines:
+            raise TemplateError(f'no template "{name}"')
+        if self._depth >= _MAX_INCLUDE_DEPTH:
+            raise TemplateError(f'include of "{name}" nested too deeply')
+        self._depth += 1
+        try:
+            return self.render(self.defines[name], data)
+        finally:
+            self._depth -= 1
+
+    def evaluate(self, expression: str, dot: Any, scope: _Scope) -> Any:
+        pipeline = self._pipelines.get(expression)
+        if pipeline is None:
+            pipeline = self._pipelines[expression] = _pipeline(_tokens(expression))[0]
+        return self._run(pipeline, dot, scope)
+
+    def _run(self, pipeline: list, dot: Any, scope: _Scope) -> Any:
+        value = _NOTHING
+        for command in pipeline:
+            value = self._command(command, dot, scope, value)
+        return value
+
+    def _command(self, command: list, dot: Any, scope: _Scope, piped: Any) -> Any:
+        head = command[0]
+        args = [self._operand(arg, dot, scope) for arg in command[1:]]
+        if piped is not _NOTHING:
+            args.append(piped)
+        if isinstance(head, str) and _IDENTIFIER_RE.match(head) and head not in ("true", "false", "nil"):
+            if head not in self.functions:
+                raise TemplateError(f'function "{head}" is not supported')
+            try:
+                return self.functions[head](*args)
+            except TemplateError:
+                raise
+            except (TypeError, ValueError, AttributeError) as e:
+                raise TemplateError(f"{head}: {str(e)}")
+        value = self._operand(head, dot, scope)
+        if callable(value):
+            # Methods such as .Capabilities.APIVersions.Has
+            return value(*args)
+        if args:
+            raise TemplateError(f"{head} is not a function")
+        return value
+
+    def _operand(self, token: Any, dot: Any, scope: _Scope) -> Any:
+        if isinstance(token, list):
+            return self._run(token, dot, scope)
+        if token.startswith(('"', "`")):
+            return _string_literal(token)
+        if token in ("true", "false"):
+            return token == "true"
+        if token == "nil":
+            return None
+        if _NUMBER_RE.match(token):
+            return float(token) if "." in token else int(token)
+        if token == ".":
+            return dot
+        if token.startswith("."):
+            return self._lookup(dot, token[1:].split("."))
+        if token.startswith("$"):
+            variable, _, fields = token.partition(".")
+            value = scope.find(variable)[variable]
+            return self._lookup(value, fields.split(".")) if fields else value
+        if _IDENTIFIER_RE.match(token) and token in self.functions:
+            return self.functions[token]()
+        raise TemplateError(f"unsupported operand {token!r}")
+
+    @staticmethod
+    def _lookup(value: Any, parts: List[str]) -> Any:
+        for part in parts:
+            if isinstance(value, dict):
+                value = value.get(part)
+            elif value is not None and not isinstance(value, (str, int, float, list)) and hasattr(value, part):
+                value = getattr(value, part)
+            else:
+                return None
+        return value
+
+
+def _merge_values(base: Any, override: Any) -> Any:
+    """Helm's value coalescing: maps merge recursively, anything else is replaced."""
+    if isinstance(base, dict) and isinstance(override, dict):
+        merged = dict(base)
+        for key, value in override.items():
+            merged[key] = _merge_values(base.get(key), value) if key in base else value
+        return merged
+    return base if override is None else override
+
+
+def _load_yaml(path: Path) -> Any:
+    if not path.is_file():
+        return None
+    with open(path, 'r') as f:
+        return yaml_backend.safe_load(f)
+
+
+def _chart_object(metadata: Dict) -> Dict:
+    # Chart.yaml fields are exposed capitalized: name -> .Chart.Name, appVersion -> .Chart.AppVersion
+    return {key[:1].upper() + key[1:]: value for key, value in metadata.items() if isinstance(key, str)}
+
+
+def _charts(chart_dir: Path, values: Dict, template_prefix: str):
+    """Yield (chart dir, its values, template name prefix) for the chart and its enabled unpacked subcharts."""
+    yield chart_dir, values, template_prefix
+    metadata = _load_yaml(chart_dir / "Chart.yaml") or {}
+    conditions = {dependency.get("alias") or dependency.get("name"): dependency.get("condition")
+                  for dependency in metadata.get("dependencies") or [] if isinstance(dependency, dict)}
+    subcharts_dir = chart_dir / "charts"
+    if not subcharts_dir.is_dir():
+        return
+    for subchart in sorted(subcharts_dir.iterdir()):
+        if not (subchart / "Chart.yaml").is_file():
+            continue
+        sub_metadata = _load_yaml(subchart / "Chart.yaml") or {}
+        name = sub_metadata.get("name", subchart.name)
+        condition = conditions.get(name)
+        if condition and _index(values, *condition.split(",")[0].strip().split(".")) is False:
+            continue
+        sub_values = _merge_values(_load_yaml(subchart / "values.yaml") or {}, values.get(name) or {})
+        if "global" in values:
+            sub_values["global"] = _merge_values(sub_values.get("global") or {}, values["global"])
+        yield from _charts(subchart, sub_values, f"{template_prefix}/charts/{subchart.name}")
+
+
+def render_chart(chart_dir, release_name: Optional[str] = None, namespace: str = "default",
+                 kube_version: Optional[str] = None) -> Tuple[List[Tuple[Path, str]], List[str]]:
+    """
+    Render a chart directory like `helm template --include-crds` would. Returns the
+    rendered (template path, manifest text) pairs and one error per template that could
+    not be rendered. Packaged (.tgz) subcharts are not rendered.
+    """
+    chart_dir = Path(chart_dir)
+    metadata = _load_yaml(chart_dir / "Chart.yaml") or {}
+    kube_version = kube_version or DEFAULT_KUBE_VERSION
+    major, minor, _ = _semver(kube_version)
+    capabilities = {
+        "KubeVersion": {"Version": kube_version, "GitVersion": kube_version, "Major": str(major), "Minor": str(minor)},
+        "APIVersions": _APIVersions(kube_version),
+    }
+    release = {"Name": release_name or metadata.get("name", chart_dir.name), "Namespace": namespace,
+               "Service": "Helm", "IsInstall": True, "IsUpgrade": False, "Revision": 1}
+
+    manifests: List[Tuple[Path, str]] = []
+    errors: List[str] = []
+    defines: Dict[str, list] = {}
+    templates = []
+    charts = list(_charts(chart_dir, _load_yaml(chart_dir / "values.yaml") or {}, metadata.get("name", chart_dir.name)))
+    for directory, values, prefix in charts:
+        for packaged in sorted((directory / "charts").glob("*.tgz")):
+            errors.append(f"{packaged}: packaged subcharts are not rendered without helm")
+        for crd in sorted((directory / "crds").glob("*.y*ml")):
+            manifests.append((crd, crd.read_text()))
+        context = {"Values": values, "Release": release, "Capabilities": capabilities,
+                   "Chart": _chart_object(_load_yaml(directory / "Chart.yaml") or {})}
+        # All templates are parsed first: defines are global to the chart and its subcharts
+        for path in sorted((directory / "templates").rglob("*")):
+            if not path.is_file():
+                continue
+            name = f"{prefix}/{path.relative_to(directory).as_posix()}"
+            try:
+                nodes = parse(path.read_text(), defines)
+            except (TemplateError, UnicodeDecodeError) as e:
+                errors.append(f"{path}: {str(e)}")
+                continue
+            defines[name] = nodes
+            if not path.name.startswith("_") and path.suffix in (".yaml", ".yml", ".tpl", ".json"):
+                templates.append((path, nodes, dict(context, Template={"Name": name, "BasePath": f"{prefix}/templates"})))
+
+    renderer = TemplateRenderer(defines)
+    for path, nodes, context in templates:
+        try:
+            text = renderer.render(nodes, context)
+        except TemplateError as e:
+            errors.append(f"{path}: {str(e)}")
+            continue
+        except RecursionError:
+            errors.append(f"{path}: template nested too deeply")
+            continue
+        if text.strip():
+            manifests.append((path, text))
+    return manifests, errors
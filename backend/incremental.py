@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+STATE_FILE_NAME = ".migration-state.json"
+STATE_FORMAT = 1
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class MigrationState:
+    """
+    Per-output-directory record of processed inputs, used to skip unchanged files.
+
+    Each entry stores the input's mtime, size and content hash together with a
+    fingerprint of everything else that affects the result (rule table version,
+    model, prompt version, mode). An entry is reused only if the fingerprint
+    matches, the content is unchanged and the recorded outputs still exist.
+    mtime/size are a fast path: the file is only hashed when they differ.
+    """
+
+    def __init__(self, output_dir: str, save_every: int = 200):
+        self.path = Path(output_dir) / STATE_FILE_NAME
+        self.save_every = save_every
+        self._pending = 0
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data.get("format") == STATE_FORMAT:
+                self.entries = data.get("entries", {})
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def _key(input_file: str) -> str:
+        return str(Path(input_file).resolve())
+
+    def lookup(self, input_file: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Return the stored result for an unchanged input, or None if it must be redone."""
+        entry = self.entries.get(self._key(input_file))
+        if not entry or entry["fingerprint"] != fingerprint:
+            return None
+        if not all(Path(output).exists() for output in entry["result"].get("outputs", [])):
+            return None
+
+        try:
+            stat = os.stat(input_file)
+        except OSError:
+            return None
+        if entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            if entry["sha256"] != file_digest(Path(input_file)):
+                return None
+            # Touched but identical: remember the new mtime so the next run skips hashing
+            entry["mtime_ns"], entry["size"] = stat.st_mtime_ns, stat.st_size
+            self._mark_dirty()
+        return entry["result"]
+
+    def record(self, input_file: str, fingerprint: str, success: bool, message: str,
+               outputs: Iterable[str] = ()) -> None:
+        """Remember the result for an input. Failures are not stored so they are retried."""
+        key = self._key(input_file)
+        if not success:
+            self.entries.pop(key, None)
+            return
+        stat = os.stat(input_file)
+        self.entries[key] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": file_digest(Path(input_file)),
+            "fingerprint": fingerprint,
+            "result": {"success": success, "message": message, "outputs": [str(o) for o in outputs if o]}
+        }
+        self._mark_dirty()
+
+    def _mark_dirty(self) -> None:
+        # Save periodically so an interrupted run over a large tree keeps its progress
+        self._pending += 1
+        if self._pending >= self.save_every:
+            self.save()
+
+    def save(self) -> None:
+        if not self._pending and self.path.exists():
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"format": STATE_FORMAT, "entries": self.entries}, f)
+        os.replace(tmp_path, self.path)
+        self._pending = 0
@@ -0,0 +1,265 @@
+import ipaddress
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+from ai_module import analyze_deprecated_apis, prompt_tokens
+from pluto_analysis import detect_deprecated_apis, relativize_paths
+
+logger = logging.getLogger(__name__)
+
+JOB_DB = os.getenv("JOB_DB", str(Path(tempfile.gettempdir()) / "k8s-jobs" / "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Queued + running jobs accepted before new submissions are refused
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "100"))
+# A running job not finished after this long is assumed lost (worker crashed) and retried
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "900"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "86400"))
+JOB_MAX_ATTEMPTS = 3
+# Hosts allowed for callbacks besides loopback addresses, comma separated
+JOB_CALLBACK_HOSTS = {host.strip() for host in os.getenv("JOB_CALLBACK_HOSTS", "").split(",") if host.strip()}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    version TEXT NOT NULL,
+    workspace TEXT NOT NULL,
+    callback_url TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    lease_expires REAL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+
+
+class QueueFull(Exception):
+    """Raised when the queue already holds JOB_QUEUE_MAX pending jobs."""
+
+
+def validate_callback_url(url: str) -> str:
+    """
+    Only allow callbacks to this machine (or hosts listed in JOB_CALLBACK_HOSTS), so a
+    submitted URL cannot make the server call into the internal network. Raises ValueError.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("Callback URL must be an http(s) URL")
+    if parsed.hostname in JOB_CALLBACK_HOSTS:
+        return url
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parsed.hostname, parsed.port or 80)}
+    except socket.gaierror:
+        raise ValueError(f"Cannot resolve callback host: {parsed.hostname}")
+    if not all(ipaddress.ip_address(address.split("%")[0]).is_loopback for address in addresses):
+        raise ValueError("Callback URL must point to a loopback address")
+    return url
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        # A redirect could lead away from the validated host
+        return None
+
+
+def notify(url: str, payload: Dict[str, Any], timeout: float = 10) -> None:
+    """POST the job status to its callback URL; failures are logged, never raised."""
+    try:
+        # Checked again at send time in case the name now resolves elsewhere
+        validate_callback_url(url)
+        request = urllib.request.Request(url, data=json.dumps(payload).encode(), method="POST",
+                                         headers={"Content-Type": "application/json"})
+        urllib.request.build_opener(_NoRedirect).open(request, timeout=timeout).close()
+    except Exception as e:
+        logger.warning("Job callback to %s failed: %s", url, e)
+
+
+class JobStore:
+    """
+    SQLite-backed job queue shared by the API process and the worker processes.
+    Uploaded manifests are kept next to the database until their job finishes.
+    """
+
+    def __init__(self, db_path: str = JOB_DB):
+        self.db_path = Path(db_path)
+        self.uploads_dir = self.db_path.parent / "uploads"
+        self.uploads_dir.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            # WAL lets workers write while the API process reads
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def _transaction(self, statements):
+        """Run `statements(conn)` in a write transaction and return its result."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def submit(self, content: bytes, filename: str, version: str, callback_url: Optional[str] = None,
+               max_pending: int = JOB_QUEUE_MAX) -> str:
+        """Store an upload and queue its analysis; raises QueueFull when the queue is at capacity."""
+        job_id = uuid.uuid4().hex
+        workspace = self.uploads_dir / job_id
+        workspace.mkdir()
+        with open(workspace / filename, "wb") as f:
+            f.write(content)
+
+        def insert(conn):
+            pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+            if pending >= max_pending:
+                raise QueueFull(f"{pending} jobs pending")
+            conn.execute(
+                "INSERT INTO jobs (id, status, version, workspace, callback_url, created_at) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, version, str(workspace), callback_url, time.time())
+            )
+
+        try:
+            self._transaction(insert)
+        except BaseException:
+            shutil.rmtree(workspace, ignore_errors=True)
+            raise
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Take the oldest queued job (or one whose worker died) and mark it running."""
+        now = time.time()
+
+        def take(conn):
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?) "
+                "ORDER BY created_at LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row["attempts"] >= JOB_MAX_ATTEMPTS:
+                conn.execute("UPDATE jobs SET status = 'failed', finished_at = ?, error = ? WHERE id = ?",
+                             (now, "Job did not finish (worker lost)", row["id"]))
+                return dict(row, status="failed")
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, lease_expires = ? WHERE id = ?",
+                (now, now + JOB_TIMEOUT, row["id"])
+            )
+            return dict(row, status="running")
+
+        return self._transaction(take)
+
+    def finish(self, job_id: str, result: Any = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? WHERE id = ?",
+                ("failed" if error else "done", time.time(), json.dumps(result) if result is not None else None,
+                 error, job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Public view of a job: status, timestamps and, once done, its result."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {key: row[key] for key in ("id", "status", "created_at", "started_at", "finished_at", "attempts")}
+        if row["status"] == "queued":
+            with self._lock:
+                job["position"] = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (row["created_at"],)
+                ).fetchone()[0]
+        if row["error"]:
+            job["error"] = row["error"]
+        if row["result"]:
+            job["result"] = json.loads(row["result"])
+        return job
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def purge(self, older_than: float = JOB_RETENTION) -> int:
+        """Delete finished jobs older than `older_than` seconds."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (time.time() - older_than,)
+            )
+        return cursor.rowcount
+
+
+def run_job(store: JobStore, job: Dict[str, Any]) -> None:
+    """Run detection and AI analysis for one claimed job, then fire its callback."""
+    if job["status"] == "running":
+        try:
+            deprecated = detect_deprecated_apis(job["workspace"], job["version"])
+            relativize_paths(deprecated, job["workspace"])
+            ai_response = analyze_deprecated_apis(deprecated)
+            store.finish(job["id"], result={
+                "ai_response": ai_response, "pluto_output": deprecated, "prompt_tokens": prompt_tokens(deprecated)
+            })
+        except Exception as e:
+            store.finish(job["id"], error=f"Internal server error: {str(e)}")
+    shutil.rmtree(job["workspace"], ignore_errors=True)
+
+    if job["callback_url"]:
+        notify(job["callback_url"], store.get(job["id"]))
+
+
+def worker_main(db_path: str, stop, poll_interval: float = 0.5) -> None:
+    """Worker process loop: claim and run jobs until `stop` is set."""
+    store = JobStore(db_path)
+    while not stop.is_set():
+        job = store.claim()
+        if job is None:
+            stop.wait(poll_interval)
+            continue
+        run_job(store, job)
+
+
+class JobWorkers:
+    """Pool of worker processes draining a JobStore."""
+
+    def __init__(self, db_path: str = JOB_DB, workers: int = JOB_WORKERS):
+        # Spawned rather than forked so workers don't inherit the server's event loop and sockets
+        context = multiprocessing.get_context("spawn")
+        self._stop = context.Event()
+        self._processes: List = [
+            context.Process(target=worker_main, args=(db_path, self._stop), name=f"job-worker-{number}", daemon=True)
+            for number in range(workers)
+        ]
+
+    def __len__(self) -> int:
+        return len(self._processes)
+
+    def start(self) -> None:
+        for process in self._processes:
+            process.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        """Let workers finish their current job, then terminate any that don't exit in time."""
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
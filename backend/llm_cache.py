@@ -0,0 +1,193 @@
+import asyncio
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from result_cache import ResultCache, content_key
+
+# Placeholders look like __NAME_0__, __IMAGE_3__ ...
+PLACEHOLDER_RE = re.compile(r"__[A-Z]+_\d+__")
+# A placeholder cut off at the end of a streamed chunk (`_`, `__NAME`, `__NAME_1_` ...)
+_PARTIAL_PLACEHOLDER_RE = re.compile(r"_(?:_(?:[A-Z]+(?:_(?:\d+_?)?)?)?)?$")
+
+# Label maps are masked key by key; selector is only a label map on Services
+_LABEL_KEYS = ("labels", "matchLabels")
+
+
+class Masker:
+    """
+    Replaces the values that differ between otherwise identical resources (names,
+    namespaces, labels, images, replica counts) with stable placeholders, so that
+    LLM responses can be cached on the normalized content and replayed for any
+    resource with the same shape. The same original value always maps to the same
+    placeholder, which keeps selectors and pod template labels consistent.
+    """
+
+    def __init__(self):
+        self.originals: Dict[str, Any] = {}
+        self._placeholders: Dict[tuple, str] = {}
+        self._counters: Dict[str, int] = {}
+
+    def placeholder(self, category: str, value: Any) -> str:
+        key = (category, type(value).__name__, value)
+        if key not in self._placeholders:
+            number = self._counters.get(category, 0)
+            self._counters[category] = number + 1
+            placeholder = f"__{category}_{number}__"
+            self._placeholders[key] = placeholder
+            self.originals[placeholder] = value
+        return self._placeholders[key]
+
+    def _mask_labels(self, labels: Dict) -> Dict:
+        return {
+            self.placeholder("LABEL", key) if isinstance(key, str) else key:
+                self.placeholder("LABEL", value) if isinstance(value, str) else value
+            for key, value in labels.items()
+        }
+
+    def mask_manifest(self, node: Any, parent: Optional[str] = None) -> Any:
+        """Return a masked copy of a parsed Kubernetes document."""
+        if isinstance(node, list):
+            return [self.mask_manifest(item, parent) for item in node]
+        if not isinstance(node, dict):
+            return node
+
+        masked = {}
+        for key, value in node.items():
+            if key == "name" and parent == "metadata" and isinstance(value, str):
+                masked[key] = self.placeholder("NAME", value)
+            elif key == "namespace" and isinstance(value, str):
+                masked[key] = self.placeholder("NAMESPACE", value)
+            elif key == "image" and isinstance(value, str):
+                masked[key] = self.placeholder("IMAGE", value)
+            elif key == "replicas" and isinstance(value, int) and not isinstance(value, bool):
+                masked[key] = self.placeholder("REPLICAS", value)
+            elif isinstance(value, dict) and (key in _LABEL_KEYS or (
+                    key == "selector" and parent == "spec"
+                    and all(isinstance(v, str) for v in value.values()))):
+                masked[key] = self._mask_labels(value)
+            else:
+                masked[key] = self.mask_manifest(value, key)
+        return masked
+
+    def mask_findings(self, items: List) -> List:
+        """Return a masked copy of detection findings (pluto-style items)."""
+        masked = []
+        for item in items:
+            if isinstance(item, dict):
+                item = dict(item)
+                for key, category in (("name", "NAME"), ("namespace", "NAMESPACE"), ("filePath", "FILE")):
+                    if isinstance(item.get(key), str) and item[key]:
+                        item[key] = self.placeholder(category, item[key])
+            masked.append(item)
+        return masked
+
+    def _unmask_string(self, value: str) -> Any:
+        if value in self.originals:
+            # Whole-value placeholders get the original back with its type (replicas stay ints)
+            return self.originals[value]
+        return PLACEHOLDER_RE.sub(lambda match: str(self.originals.get(match.group(0), match.group(0))), value)
+
+    def unmask(self, node: Any) -> Any:
+        """Put the original values back into a parsed (masked) structure."""
+        if isinstance(node, list):
+            return [self.unmask(item) for item in node]
+        if isinstance(node, dict):
+            return {self.unmask(key): self.unmask(value) for key, value in node.items()}
+        if isinstance(node, str):
+            return self._unmask_string(node)
+        return node
+
+    def unmask_text(self, text: str) -> str:
+        """Put the original values back into free text such as a migration plan."""
+        return PLACEHOLDER_RE.sub(lambda match: str(self.originals.get(match.group(0), match.group(0))), text)
+
+    async def unmask_stream(self, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Unmask streamed text, holding back a trailing partial placeholder until it is complete."""
+        pending = ""
+        async for chunk in chunks:
+            pending += chunk
+            complete = [match.end() for match in PLACEHOLDER_RE.finditer(pending)]
+            start = complete[-1] if complete else 0
+            partial = _PARTIAL_PLACEHOLDER_RE.search(pending, start)
+            cut = partial.start() if partial else len(pending)
+            if cut:
+                yield self.unmask_text(pending[:cut])
+                pending = pending[cut:]
+        if pending:
+            yield self.unmask_text(pending)
+
+    @staticmethod
+    def has_placeholders(node: Any) -> bool:
+        """Whether a structure still contains placeholders, i.e. the LLM invented or altered one."""
+        if isinstance(node, list):
+            return any(Masker.has_placeholders(item) for item in node)
+        if isinstance(node, dict):
+            return any(Masker.has_placeholders(key) or Masker.has_placeholders(value) for key, value in node.items())
+        return isinstance(node, str) and PLACEHOLDER_RE.search(node) is not None
+
+
+def normalized_key(masked: Any, *parts: str) -> str:
+    """Cache key for masked content plus the model, prompt version and other key parts."""
+    try:
+        serialized = json.dumps(masked, sort_keys=True, default=str)
+    except TypeError:
+        # Mixed key types (e.g. int and str keys) can't be sorted
+        serialized = json.dumps(masked, default=str)
+    return content_key(serialized.encode(), *parts)
+
+
+class LLMResponseCache(ResultCache):
+    """ResultCache for LLM responses that also coalesces concurrent requests for the same key."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+
+    async def fetch(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        """
+        Return the cached response for `key`, or await `compute()` and cache its result.
+        Callers waiting on the same key share one call; exceptions are not cached.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        inflight_key = (id(asyncio.get_running_loop()), key)
+        if inflight_key in self._inflight:
+            return await asyncio.shield(self._inflight[inflight_key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[inflight_key] = future
+        try:
+            value = await compute()
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved when nobody else was waiting for it
+            future.exception()
+            raise
+        finally:
+            del self._inflight[inflight_key]
+
+
+def llm_cache_from_env(disk_dir: Optional[str] = None) -> LLMResponseCache:
+    """Build an LLM response cache configured from the LLM_CACHE_* environment variables."""
+    return LLMResponseCache(
+        max_entries=int(os.getenv("LLM_CACHE_SIZE", "1024")),
+        ttl_seconds=float(os.getenv("LLM_CACHE_TTL", "604800")),
+        disk_dir=disk_dir or os.getenv("LLM_CACHE_DIR"),
+        max_disk_entries=int(os.getenv("LLM_CACHE_DISK_ENTRIES", "10000"))
+    )
+
+
+@lru_cache(maxsize=None)
+def default_llm_cache() -> LLMResponseCache:
+    """LLM response cache shared by the migrators and the analysis endpoint."""
+    return llm_cache_from_env()
@@ -0,0 +1,145 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+import openai
+
+T = TypeVar("T")
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Count tokens with tiktoken when installed, otherwise estimate ~4 characters per token."""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    """
+    Async token-bucket limiter for requests per minute and tokens per minute.
+    A limit of 0/None disables that dimension. Waiters are served in order.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.requests_per_minute = requests_per_minute or 0
+        self.tokens_per_minute = tokens_per_minute or 0
+        self._requests = float(self.requests_per_minute)
+        self._tokens = float(self.tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    async def acquire(self, tokens: int = 0) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        if self.tokens_per_minute:
+            # A single request larger than the whole budget can still go through once the bucket is full
+            tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.requests_per_minute and self._requests < 1:
+                    wait = (1 - self._requests) * 60 / self.requests_per_minute
+                if self.tokens_per_minute and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+                if wait <= 0:
+                    if self.requests_per_minute:
+                        self._requests -= 1
+                    if self.tokens_per_minute:
+                        self._tokens -= tokens
+                    return
+                await asyncio.sleep(wait)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and connection failures are worth retrying."""
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def retry_delay(error: Exception, attempt: int, base_delay: float, max_delay: float) -> float:
+    """Exponential backoff with full jitter, never shorter than a server supplied Retry-After."""
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            delay = max(delay, float(response.headers.get("retry-after", 0)))
+        except (TypeError, ValueError):
+            pass
+    return delay
+
+
+class LLMExecutor:
+    """Runs chat completions with bounded concurrency, rate limiting and retries."""
+
+    def __init__(self, client: openai.AsyncOpenAI, concurrency: int = 4,
+                 requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.client = client
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore = None
+
+    async def complete(self, **request):
+        """Create a chat completion, waiting for a slot and for rate-limit budget first."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        # Providers count max_tokens against the TPM budget up front
+        tokens = sum(estimate_tokens(message["content"]) for message in request["messages"])
+        tokens += request.get("max_tokens") or 0
+
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.limiter.acquire(tokens)
+                try:
+                    return await self.client.chat.completions.create(**request)
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        raise
+                    await asyncio.sleep(retry_delay(e, attempt, self.base_delay, self.max_delay))
+
+    async def map(self, func: Callable[..., Awaitable[T]], items) -> List[T]:
+        """
+        Run `func` over `items` and return results in input order. At most `concurrency`
+        calls are in flight: workers take the next item only when they are free, so the
+        per-item work before a completion (reading files, building prompts) doesn't pile
+        up for every item while the requests wait for a slot.
+        """
+        pending = enumerate(items)
+        results: Dict[int, T] = {}
+
+        async def worker() -> None:
+            # Workers share one iterator; the event loop never switches inside next()
+            for index, item in pending:
+                results[index] = await func(item)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+        return [results[index] for index in range(len(results))]
@@ -1,10 +1,18 @@
-import yaml
 import os
+import asyncio
+import yaml_backend
+import yaml_patch
 import argparse
 from pathlib import Path
-from typing import Dict, List, Tuple
-from openai import OpenAI
+from typing import Dict, List, Optional, Tuple
+from openai import AsyncOpenAI
 import json
+from api_rules import RuleIndex, UnsupportedShape, default_rules
+from incremental import MigrationState
+from manifest_renderer import is_chart_template
+from llm_cache import LLMResponseCache, Masker, default_llm_cache, llm_cache_from_env, normalized_key
+from llm_executor import LLMExecutor, estimate_tokens
+from manifest_scanner import ScannedDocument, scan_documents
 
 # Load environment variables from .env file
 try:
@@ -13,13 +21,76 @@ try:
 except ImportError:
     print("Warning: python-dotenv not installed. Using system environment variables.")
 
+def format_migration_rules(rules: RuleIndex) -> str:
+    """Render the rule table as the numbered MIGRATION RULES list used in prompts."""
+    groups = {}
+    for rule in rules:
+        key = (rule.api_version, rule.replacement, rule.notes)
+        groups.setdefault(key, []).append(rule.kind)
+    
+    lines = []
+    for number, ((api_version, replacement, notes), kinds) in enumerate(groups.items(), 1):
+        lines.append(f"{number}. **{', '.join(kinds)}**: `{api_version}` → `{replacement}`")
+        lines.extend(f"   - {note}" for note in notes)
+    return "\n".join(lines)
+
+# Bump when the migration prompts change so incremental runs redo earlier results
+PROMPT_VERSION = "2"
+MODEL = "gpt-4"  # Use GPT-4 for better YAML understanding
+
+# Context window (prompt + completion tokens) per model
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-3.5-turbo": 16385
+}
+MAX_OUTPUT_TOKENS = 4000
+# Migrated YAML is about the size of its input plus a few added fields
+OUTPUT_RATIO = 1.25
+
+def chunk_documents(documents: List[ScannedDocument], budget: int) -> List[List[ScannedDocument]]:
+    """
+    Group consecutive documents into chunks of at most `budget` tokens, keeping their order.
+    A document larger than the budget on its own becomes a chunk by itself.
+    """
+    chunks, current, current_tokens = [], [], 0
+    for document in documents:
+        tokens = estimate_tokens(document.text)
+        if current and current_tokens + tokens > budget:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(document)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
 class LLMYAMLMigrator:
     """Use LLM to intelligently migrate deprecated Kubernetes API versions in YAML files."""
     
-    def __init__(self, output_dir: str = "output", api_key: str = None):
+    def __init__(self, output_dir: str = "output", api_key: str = None, rules: Optional[RuleIndex] = None,
+                 incremental: bool = False, concurrency: int = 4, requests_per_minute: float = 0,
+                 tokens_per_minute: float = 0, max_retries: int = 5, base_url: Optional[str] = None,
+                 hybrid: bool = False, cache: Optional[LLMResponseCache] = None, use_cache: bool = True,
+                 context_tokens: Optional[int] = None):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
+        self.rules = rules if rules is not None else default_rules()
+        # Hybrid mode applies the rule engine locally and only sends documents it can't resolve to the LLM
+        self.hybrid = hybrid
         self.migration_log = []
+        # With incremental mode, inputs unchanged since the last run reuse their previous
+        # result instead of paying for another completion
+        self.state = MigrationState(output_dir) if incremental else None
+        # Inputs whose completion failed or returned invalid YAML in this run
+        self.failed_inputs = set()
+        # Responses are cached on the masked content, so resources that differ only in
+        # names, labels, images or replicas share one completion
+        self.cache = (cache or default_llm_cache()) if use_cache else None
+        # Files whose prompt would not fit the model's context are migrated in chunks
+        self.context_tokens = context_tokens or MODEL_CONTEXT_TOKENS.get(MODEL, 8192)
         
         # Initialize OpenAI client
         if not api_key:
@@ -27,10 +98,115 @@ class LLMYAMLMigrator:
         if not api_key:
             raise ValueError("OpenAI API key not found. Set OPENAI_API_KEY environment variable.")
         
-        self.client = OpenAI(api_key=api_key)
+        # Retries are handled by the executor (with rate limiting), not by the client.
+        # base_url (or OPENAI_BASE_URL) allows pointing at any OpenAI-compatible server.
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.executor = LLMExecutor(self.client, concurrency, requests_per_minute, tokens_per_minute, max_retries)
+        # All async work runs on one loop so the client's connection pool can be reused
+        self._loop = asyncio.new_event_loop()
+    
+    def _run(self, coroutine):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return self._loop.run_until_complete(coroutine)
+        coroutine.close()
+        raise RuntimeError("LLMYAMLMigrator's synchronous methods can't be called from a running event loop; "
+                           "await the a* coroutines (amigrate_yaml_file, amigrate_directory, aclose, ...) instead")
+    
+    def close(self) -> None:
+        """Close the OpenAI client and the event loop used by the synchronous methods."""
+        if self._loop.is_closed():
+            return
+        try:
+            self._run(self.client.close())
+        finally:
+            self._loop.close()
+    
+    async def aclose(self) -> None:
+        """Like close(), for callers that drove the migrator through the a* coroutines on their own loop."""
+        try:
+            await self.client.close()
+        finally:
+            self._loop.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+    
+    async def _complete(self, prompt: str) -> str:
+        # Leave the rest of the context window for the completion
+        max_tokens = min(MAX_OUTPUT_TOKENS, self.context_tokens - estimate_tokens(prompt))
+        if max_tokens <= 0:
+            raise ValueError(f"Prompt of ~{estimate_tokens(prompt)} tokens does not fit the "
+                             f"{self.context_tokens}-token context of {MODEL}")
+        response = await self.executor.complete(
+            model=MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.1,  # Low temperature for consistent output
+            max_tokens=max_tokens
+        )
+        choice = response.choices[0]
+        if choice.finish_reason == "length":
+            # Truncated YAML may still parse, so never accept it
+            raise ValueError(f"LLM output was truncated at {max_tokens} tokens")
+        return choice.message.content
+    
+    def _chunk_budget(self, prompt_overhead: int) -> int:
+        """Max input tokens per prompt so that the prompt and its migrated output fit the context."""
+        available = self.context_tokens - prompt_overhead
+        return max(0, min(int(available / (1 + OUTPUT_RATIO)), int(MAX_OUTPUT_TOKENS / OUTPUT_RATIO)))
+    
+    def _cache_key(self, mode: str, masked) -> str:
+        return normalized_key(masked, mode, MODEL, PROMPT_VERSION, self.rules.version)
+    
+    async def _cached_completion(self, key: Optional[str], compute) -> str:
+        """Run `compute` (which validates the response) through the response cache when enabled."""
+        if self.cache is None or key is None:
+            return await compute()
+        return await self.cache.fetch(key, compute)
+    
+    def _fingerprint(self, mode: str) -> str:
+        return f"llm-migrator;mode={mode};model={MODEL};prompt={PROMPT_VERSION};rules={self.rules.version}"
+    
+    def _previous_result(self, input_file: str, mode: str) -> Optional[Dict]:
+        if self.state is None:
+            return None
+        previous = self.state.lookup(input_file, self._fingerprint(mode))
+        if previous:
+            self.migration_log.append(f"⏭️ Unchanged since last run: {input_file}")
+        return previous
+    
+    def _record_result(self, input_file: str, mode: str, success: bool, message: str, outputs: List[str]) -> None:
+        if self.state is not None:
+            self.state.record(input_file, self._fingerprint(mode), success, message, outputs)
+    
+    def save_state(self) -> None:
+        """Persist the incremental state file (no-op unless incremental mode is on)."""
+        if self.state is not None:
+            self.state.save()
     
     def migrate_yaml_file(self, input_file: str) -> Tuple[bool, str]:
         """Migrate a single YAML file using LLM and return success status and output path."""
+        return self._run(self.amigrate_yaml_file(input_file))
+    
+    async def amigrate_yaml_file(self, input_file: str) -> Tuple[bool, str]:
+        """Async variant of migrate_yaml_file."""
+        mode = "hybrid" if self.hybrid else "migrate"
+        previous = self._previous_result(input_file, mode)
+        if previous:
+            return previous["success"], previous["message"]
+        
+        success, message = await self._migrate_file(input_file)
+        outputs = [message] if success and not message.startswith("No migrations needed") else []
+        # A failed completion falls back to the original content; never remember that as a result
+        reusable = success and input_file not in self.failed_inputs
+        self._record_result(input_file, mode, reusable, message, outputs)
+        return success, message
+    
+    async def _migrate_file(self, input_file: str) -> Tuple[bool, str]:
         try:
             input_path = Path(input_file)
             if not input_path.exists():
@@ -41,7 +217,10 @@ class LLMYAMLMigrator:
                 content = f.read()
             
             # Use LLM to migrate the YAML
-            migrated_content = self._migrate_with_llm(content)
+            if self.hybrid:
+                migrated_content = await self._migrate_hybrid(content, input_file)
+            else:
+                migrated_content = await self._migrate_with_llm(content, input_file)
             
             if migrated_content == content:
                 return True, f"No migrations needed for {input_file}"
@@ -59,10 +238,8 @@ class LLMYAMLMigrator:
             self.migration_log.append(f"❌ {error_msg}")
             return False, error_msg
     
-    def _migrate_with_llm(self, yaml_content: str) -> str:
-        """Use LLM to migrate YAML content."""
-        
-        prompt = f"""
+    def _migration_prompt(self, yaml_content: str) -> str:
+        return f"""
 You are a Kubernetes expert specializing in API migrations. Your task is to migrate deprecated Kubernetes API versions to their current equivalents.
 
 **INPUT YAML:**
@@ -71,14 +248,7 @@ You are a Kubernetes expert specializing in API migrations. Your task is to migr
 ```
 
 **MIGRATION RULES:**
-1. **Deployments, DaemonSets, ReplicaSets, StatefulSets**: `extensions/v1beta1` → `apps/v1`
-2. **Ingress**: `extensions/v1beta1` → `networking.k8s.io/v1`
-   - Add required `pathType: Prefix` to each path
-   - Convert backend from `serviceName/servicePort` to `service.name/service.port.number`
-3. **NetworkPolicy**: `networking.k8s.io/v1beta1` → `networking.k8s.io/v1`
-4. **RBAC resources**: `rbac.authorization.k8s.io/v1beta1` → `rbac.authorization.k8s.io/v1`
-5. **Storage resources**: `storage.k8s.io/v1beta1` → `storage.k8s.io/v1`
-6. **Admission resources**: `admissionregistration.k8s.io/v1beta1` → `admissionregistration.k8s.io/v1`
+{format_migration_rules(self.rules)}
 
 **REQUIREMENTS:**
 - Only change the `apiVersion` field and any required structural changes
@@ -87,6 +257,7 @@ You are a Kubernetes expert specializing in API migrations. Your task is to migr
 - Handle multi-document YAML files (separated by `---`)
 - Ensure the output is valid YAML
 - Add any required fields that are mandatory in the new API version
+- Keep placeholder values such as `__NAME_0__` or `__IMAGE_0__` exactly as they are
 
 **OUTPUT FORMAT:**
 Return ONLY the migrated YAML content, no explanations or markdown formatting.
@@ -96,16 +267,72 @@ If input has `apiVersion: extensions/v1beta1` and `kind: Deployment`, output sho
 
 Migrate the YAML now:
 """
+    
+    async def _migrate_with_llm(self, yaml_content: str, source: str = "") -> str:
+        """
+        Use LLM to migrate YAML content. Content too large for one prompt is split at
+        document boundaries into chunks that are migrated concurrently and reassembled in order.
+        """
+        budget = self._chunk_budget(estimate_tokens(self._migration_prompt("")))
+        if estimate_tokens(yaml_content) <= budget:
+            return await self._migrate_chunk(yaml_content, source)
         
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",  # Use GPT-4 for better YAML understanding
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1,  # Low temperature for consistent output
-                max_tokens=4000
-            )
-            
-            migrated_yaml = response.choices[0].message.content.strip()
+        chunks = chunk_documents(list(scan_documents(yaml_content.splitlines(keepends=True))), budget)
+        self.migration_log.append(f"✂️ {source}: split into {len(chunks)} chunk(s) of up to {budget} tokens")
+        
+        async def migrate(chunk: List[ScannedDocument]) -> str:
+            text = "".join(document.text for document in chunk)
+            if not any(self._may_need_llm(document) for document in chunk):
+                return text
+            tokens = estimate_tokens(text)
+            if tokens > budget:
+                # Only possible for a single document (see chunk_documents)
+                self.migration_log.append(
+                    f"❌ {source}: {chunk[0].kind or 'document'} of ~{tokens} tokens exceeds the {budget}-token "
+                    f"budget of {MODEL} ({self.context_tokens}-token context); left unchanged, migrate it manually"
+                )
+                self.failed_inputs.add(source)
+                return text
+            return await self._migrate_chunk(text, source)
+        
+        chunks_text = ["".join(document.text for document in chunk) for chunk in chunks]
+        outputs = await self.executor.map(migrate, chunks)
+        if outputs == chunks_text:
+            return yaml_content
+        
+        # Chunks after the first start at a `---` separator; LLM output does not
+        parts = []
+        for position, output in enumerate(outputs):
+            output = output.strip("\n")
+            if position and not output.startswith("---"):
+                output = "---\n" + output
+            parts.append(output)
+        return "\n".join(parts) + "\n"
+    
+    def _may_need_llm(self, document: ScannedDocument) -> bool:
+        # Headers the scanner couldn't read, or an API group with deprecated versions
+        return not document.plain or document.api_version in self.rules.deprecated_api_versions
+    
+    async def _migrate_chunk(self, yaml_content: str, source: str = "") -> str:
+        """Migrate YAML content that fits in one prompt."""
+        
+        masker = key = documents = None
+        prompt_content = yaml_content
+        if self.cache is not None:
+            try:
+                documents = [doc for doc in yaml_backend.safe_load_all(yaml_content) if doc is not None]
+            except yaml_backend.YAMLError:
+                documents = None
+            if documents:
+                masker = Masker()
+                masked = [masker.mask_manifest(doc) for doc in documents]
+                key = self._cache_key("file", masked)
+                prompt_content = yaml_backend.dump_all(masked)
+        
+        prompt = self._migration_prompt(prompt_content)
+        
+        async def complete() -> str:
+            migrated_yaml = (await self._complete(prompt)).strip()
             
             # Clean up the response (remove markdown if present)
             if migrated_yaml.startswith("```yaml"):
@@ -117,21 +344,168 @@ Migrate the YAML now:
             
             migrated_yaml = migrated_yaml.strip()
             
-            # Validate that the output is valid YAML
-            try:
-                yaml.safe_load_all(migrated_yaml)
-                return migrated_yaml
-            except yaml.YAMLError as e:
-                self.migration_log.append(f"⚠️ LLM output validation failed: {str(e)}")
-                # Fall back to original content if LLM output is invalid
-                return yaml_content
-                
+            # Validate before the response is cached (load_all is lazy, so consume it)
+            migrated = list(yaml_backend.safe_load_all(migrated_yaml))
+            if masker is not None and Masker.has_placeholders(masker.unmask(migrated)):
+                raise ValueError("LLM output altered masked values")
+            return migrated_yaml
+        
+        try:
+            migrated_yaml = await self._cached_completion(key, complete)
+        except yaml_backend.YAMLError as e:
+            self.migration_log.append(f"⚠️ LLM output validation failed for {source}: {str(e)}")
+            self.failed_inputs.add(source)
+            # Fall back to original content if LLM output is invalid
+            return yaml_content
         except Exception as e:
-            self.migration_log.append(f"⚠️ LLM migration failed: {str(e)}")
+            self.migration_log.append(f"⚠️ LLM migration failed for {source}: {str(e)}")
+            self.failed_inputs.add(source)
+            return yaml_content
+        
+        if masker is None:
+            return migrated_yaml
+        migrated = [doc for doc in masker.unmask(list(yaml_backend.safe_load_all(migrated_yaml))) if doc is not None]
+        if migrated == documents:
+            return yaml_content
+        return self._patch_migrated(yaml_content, documents, migrated)
+    
+    @staticmethod
+    def _patch_migrated(yaml_content: str, documents: List, migrated: List) -> str:
+        """
+        Apply the unmasked LLM result onto the original text, so comments, quoting and key
+        order survive the masked round trip. Only when the LLM split or merged documents
+        (no one-to-one match) is the result serialized as a whole.
+        """
+        if len(migrated) != len(documents):
+            return yaml_backend.dump_all(migrated)
+        pending = iter(zip(documents, migrated))
+        
+        def migrate_document(doc):
+            for original, new in pending:
+                if original == doc:
+                    return new, new != original
+            return doc, False
+        
+        # Every document is parsed, not only those with a deprecated header
+        headers = {(document.api_version, document.kind)
+                   for document in scan_documents(yaml_content.splitlines(keepends=True))}
+        edits = yaml_patch.patch_text(yaml_content, headers, migrate_document)
+        return yaml_patch.apply_edits(yaml_content, edits)
+    
+    def _apply_rules(self, doc) -> str:
+        """
+        First hybrid pass on one document. Returns "resolved" if the rule engine migrated it
+        in place, "unchanged" if it needs nothing, or "unresolved" if it needs the LLM.
+        """
+        if not isinstance(doc, dict) or not doc.get('apiVersion') or not doc.get('kind'):
+            return "unchanged"
+        api_version, kind = doc['apiVersion'], doc['kind']
+        rule = self.rules.lookup(api_version, kind)
+        if rule is None:
+            # Unknown kind in a deprecated API group
+            return "unresolved" if api_version in self.rules.deprecated_api_versions else "unchanged"
+        if rule.complex:
+            return "unresolved"
+        try:
+            rule.apply(doc)
+        except UnsupportedShape:
+            return "unresolved"
+        self.migration_log.append(f"  🔄 {kind}: {api_version} -> {rule.replacement}")
+        return "resolved"
+    
+    async def _migrate_hybrid(self, yaml_content: str, source: str = "") -> str:
+        """Migrate with the rule engine first and send only the unresolved documents to the LLM."""
+        documents = [doc for doc in yaml_backend.safe_load_all(yaml_content) if doc is not None]
+        statuses = [self._apply_rules(doc) for doc in documents]
+        unresolved = [position for position, status in enumerate(statuses) if status == "unresolved"]
+        changed = "resolved" in statuses
+        
+        if unresolved:
+            self.migration_log.append(f"🤖 {source}: {len(unresolved)} of {len(documents)} document(s) sent to the LLM")
+            migrated = await self.executor.map(
+                lambda position: self._migrate_document_with_llm(documents[position], source), unresolved
+            )
+            # Splice the LLM results back in at their original positions
+            for position, doc in zip(unresolved, migrated):
+                if doc is not None and doc != documents[position]:
+                    documents[position] = doc
+                    changed = True
+        
+        if not changed:
             return yaml_content
+        return yaml_backend.dump_all(documents)
+    
+    async def _migrate_document_with_llm(self, doc: Dict, source: str = "") -> Optional[Dict]:
+        """Migrate a single parsed document with the LLM; returns None if the LLM output is unusable."""
+        masker = Masker()
+        masked = masker.mask_manifest(doc)
+        document_yaml = yaml_backend.dump(masked)
+        prompt = f"""
+You are a Kubernetes expert specializing in API migrations. Migrate this single Kubernetes resource from its deprecated API version to the current equivalent.
+
+**INPUT YAML:**
+```yaml
+{document_yaml}
+```
+
+**MIGRATION RULES:**
+{format_migration_rules(self.rules)}
+
+**REQUIREMENTS:**
+- Change the `apiVersion` and make every structural change the new API version requires
+- Add any fields that are mandatory in the new API version
+- Preserve all other fields exactly as they are
+- Keep placeholder values such as `__NAME_0__` or `__IMAGE_0__` exactly as they are
+- If the resource has no newer API version, return it unchanged
+
+**OUTPUT FORMAT:**
+Return ONLY the migrated YAML for this one resource, no explanations or markdown formatting.
+"""
+        
+        async def complete() -> str:
+            migrated_yaml = (await self._complete(prompt)).strip()
+            if migrated_yaml.startswith("```"):
+                migrated_yaml = migrated_yaml.split("\n", 1)[1] if "\n" in migrated_yaml else ""
+            if migrated_yaml.endswith("```"):
+                migrated_yaml = migrated_yaml.rsplit("```", 1)[0]
+            
+            migrated = yaml_backend.safe_load(migrated_yaml)
+            if not isinstance(migrated, dict) or migrated.get('kind') != doc.get('kind'):
+                raise ValueError("LLM did not return a single resource of the same kind")
+            if Masker.has_placeholders(masker.unmask(migrated)):
+                raise ValueError("LLM output altered masked values")
+            return migrated_yaml
+        
+        try:
+            migrated = masker.unmask(yaml_backend.safe_load(
+                await self._cached_completion(self._cache_key("document", masked), complete)
+            ))
+            self.migration_log.append(f"  🤖 {doc.get('kind')}: {doc.get('apiVersion')} -> {migrated.get('apiVersion')}")
+            return migrated
+        except Exception as e:
+            name = (doc.get('metadata') or {}).get('name', '')
+            self.migration_log.append(f"⚠️ LLM migration failed for {doc.get('kind')} {name} in {source}: {str(e)}")
+            self.failed_inputs.add(source)
+            return None
     
     def migrate_with_analysis(self, input_file: str) -> Tuple[bool, str, str]:
         """Migrate YAML and provide detailed analysis of changes."""
+        return self._run(self.amigrate_with_analysis(input_file))
+    
+    async def amigrate_with_analysis(self, input_file: str) -> Tuple[bool, str, str]:
+        """Async variant of migrate_with_analysis."""
+        previous = self._previous_result(input_file, "analysis")
+        if previous:
+            outputs = previous["outputs"]
+            return previous["success"], outputs[0], outputs[1]
+        
+        success, output_file, analysis_file = await self._migrate_with_analysis(input_file)
+        # Only the full analysis result is reusable; the fallback path is recorded as "migrate"
+        if analysis_file:
+            self._record_result(input_file, "analysis", success, output_file, [output_file, analysis_file])
+        return success, output_file, analysis_file
+    
+    async def _migrate_with_analysis(self, input_file: str) -> Tuple[bool, str, str]:
         try:
             input_path = Path(input_file)
             if not input_path.exists():
@@ -173,15 +547,10 @@ Return a JSON object with the following structure:
 }}
 """
             
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": analysis_prompt}],
-                temperature=0.1,
-                max_tokens=4000
-            )
+            response = await self._complete(analysis_prompt)
             
             try:
-                result = json.loads(response.choices[0].message.content.strip())
+                result = json.loads(response.strip())
                 
                 # Write migrated content
                 output_file = self.output_dir / f"{input_path.stem}.analyzed-migrated{input_path.suffix}"
@@ -207,7 +576,8 @@ Return a JSON object with the following structure:
                 
             except json.JSONDecodeError:
                 # Fall back to simple migration if JSON parsing fails
-                return self.migrate_yaml_file(input_file), "", ""
+                success, message = await self.amigrate_yaml_file(input_file)
+                return success, message, ""
                 
         except Exception as e:
             error_msg = f"Error in analysis migration {input_file}: {str(e)}"
@@ -215,27 +585,40 @@ Return a JSON object with the following structure:
             return False, error_msg, ""
     
     def migrate_directory(self, input_dir: str, with_analysis: bool = False) -> List[str]:
-        """Migrate all YAML files in a directory."""
+        """Migrate all YAML files in a directory, running up to `concurrency` LLM calls at once."""
+        return self._run(self.amigrate_directory(input_dir, with_analysis))
+    
+    async def amigrate_directory(self, input_dir: str, with_analysis: bool = False) -> List[str]:
+        """Async variant of migrate_directory."""
         input_path = Path(input_dir)
         if not input_path.exists():
             return [f"Directory not found: {input_dir}"]
         
-        yaml_files = list(input_path.glob("*.yaml")) + list(input_path.glob("*.yml"))
-        results = []
+        yaml_files = sorted(input_path.glob("*.yaml")) + sorted(input_path.glob("*.yml"))
+        # Helm templates aren't YAML until rendered; their deprecated APIs are reported by detection
+        templates = [yaml_file for yaml_file in yaml_files if is_chart_template(yaml_file)]
+        if templates:
+            yaml_files = [yaml_file for yaml_file in yaml_files if yaml_file not in templates]
+            self.migration_log.append(f"⏭️ Skipped {len(templates)} Helm chart template(s), they are not plain YAML")
         
-        for yaml_file in yaml_files:
+        async def migrate_one(yaml_file: Path) -> List[str]:
             if with_analysis:
-                success, output_file, analysis_file = self.migrate_with_analysis(str(yaml_file))
-                if success:
-                    results.append(f"✅ {yaml_file.name} -> {output_file}")
-                    if analysis_file:
-                        results.append(f"📊 Analysis: {analysis_file}")
-                else:
-                    results.append(f"❌ {yaml_file.name}: {output_file}")
-            else:
-                success, message = self.migrate_yaml_file(str(yaml_file))
-                results.append(message)
+                success, output_file, analysis_file = await self.amigrate_with_analysis(str(yaml_file))
+                if not success:
+                    return [f"❌ {yaml_file.name}: {output_file}"]
+                messages = [f"✅ {yaml_file.name} -> {output_file}"]
+                if analysis_file:
+                    messages.append(f"📊 Analysis: {analysis_file}")
+                return messages
+            success, message = await self.amigrate_yaml_file(str(yaml_file))
+            return [message]
         
+        # Files run concurrently; results come back in file order
+        results = []
+        for messages in await self.executor.map(migrate_one, yaml_files):
+            results.extend(messages)
+        
+        self.save_state()
         return results
     
     def get_migration_summary(self) -> str:
@@ -244,6 +627,14 @@ Return a JSON object with the following structure:
             return "No migrations performed."
         
         return "\n".join(self.migration_log)
+    
+    def get_cache_summary(self) -> str:
+        """One-line LLM response cache report."""
+        if self.cache is None:
+            return "LLM cache: disabled"
+        stats = self.cache.stats()
+        return (f"LLM cache: {stats['hits']} hit(s), {stats['misses']} miss(es), "
+                f"hit ratio {stats['hit_ratio']:.0%}, {stats['entries']} entries")
 
 def main():
     parser = argparse.ArgumentParser(description="Use LLM to migrate deprecated Kubernetes API versions in YAML files")
@@ -252,44 +643,65 @@ def main():
     parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
     parser.add_argument("--analysis", "-a", action="store_true", help="Generate detailed analysis report")
     parser.add_argument("--api-key", help="OpenAI API key (or set OPENAI_API_KEY env var)")
+    parser.add_argument("--incremental", "-i", action="store_true", help="Skip inputs unchanged since the last run into the same output directory")
+    parser.add_argument("--concurrency", "-c", type=int, default=4, help="Max concurrent LLM requests (default: 4)")
+    parser.add_argument("--rpm", type=float, default=0, help="Max LLM requests per minute (default: unlimited)")
+    parser.add_argument("--tpm", type=float, default=0, help="Max LLM tokens per minute (default: unlimited)")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries on 429/5xx/connection errors (default: 5)")
+    parser.add_argument("--base-url", help="OpenAI-compatible API base URL (or set OPENAI_BASE_URL env var)")
+    parser.add_argument("--hybrid", action="store_true", help="Apply the rule engine first and only send unresolved documents to the LLM")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the LLM response cache")
+    parser.add_argument("--cache-dir", help="Directory for a persistent LLM response cache (or set LLM_CACHE_DIR env var)")
+    parser.add_argument("--context-tokens", type=int, help=f"Model context window used to size prompt chunks (default: {MODEL_CONTEXT_TOKENS.get(MODEL)} for {MODEL})")
     
     args = parser.parse_args()
     
+    cache = llm_cache_from_env(args.cache_dir) if args.cache_dir else None
+    
     try:
-        migrator = LLMYAMLMigrator(args.output_dir, args.api_key)
+        migrator = LLMYAMLMigrator(
+            args.output_dir, args.api_key, incremental=args.incremental, concurrency=args.concurrency,
+            requests_per_minute=args.rpm, tokens_per_minute=args.tpm, max_retries=args.max_retries,
+            base_url=args.base_url, hybrid=args.hybrid, cache=cache, use_cache=not args.no_cache,
+            context_tokens=args.context_tokens
+        )
     except ValueError as e:
         print(f"Error: {e}")
         return 1
     
-    input_path = Path(args.input)
-    
-    if input_path.is_file():
-        # Migrate single file
-        if args.analysis:
-            success, output_file, analysis_file = migrator.migrate_with_analysis(args.input)
-            if success:
-                print(f"✅ Migrated: {output_file}")
-                if analysis_file:
-                    print(f"📊 Analysis: {analysis_file}")
+    with migrator:
+        input_path = Path(args.input)
+        
+        if input_path.is_file():
+            # Migrate single file
+            if args.analysis:
+                success, output_file, analysis_file = migrator.migrate_with_analysis(args.input)
+                if success:
+                    print(f"✅ Migrated: {output_file}")
+                    if analysis_file:
+                        print(f"📊 Analysis: {analysis_file}")
+                else:
+                    print(f"❌ Failed: {output_file}")
             else:
-                print(f"❌ Failed: {output_file}")
+                success, message = migrator.migrate_yaml_file(args.input)
+                print(message)
+            migrator.save_state()
+        elif input_path.is_dir():
+            # Migrate all YAML files in directory
+            results = migrator.migrate_directory(args.input, args.analysis)
+            for result in results:
+                print(result)
         else:
-            success, message = migrator.migrate_yaml_file(args.input)
-            print(message)
-    elif input_path.is_dir():
-        # Migrate all YAML files in directory
-        results = migrator.migrate_directory(args.input, args.analysis)
-        for result in results:
-            print(result)
-    else:
-        print(f"Error: {args.input} is not a valid file or directory")
-        return 1
-    
-    if args.verbose:
-        print("\n" + "="*50)
-        print("MIGRATION SUMMARY:")
-        print("="*50)
-        print(migrator.get_migration_summary())
+            print(f"Error: {args.input} is not a valid file or directory")
+            return 1
+        
+        if args.verbose:
+            print("\n" + "="*50)
+            print("MIGRATION SUMMARY:")
+            print("="*50)
+            print(f"YAML backend: {yaml_backend.BACKEND}")
+            print(migrator.get_cache_summary())
+            print(migrator.get_migration_summary())
     
     return 0
 
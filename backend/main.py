@@ -1,27 +1,368 @@
-from fastapi import FastAPI, UploadFile, Form
-from pluto_analysis import run_pluto
-from ai_module import analyze_deprecated_apis
+import asyncio
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+from fastapi import FastAPI, UploadFile, Form, Header, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pluto_analysis import detect_deprecated_apis_async, relativize_paths, DETECTION_BACKEND
+from ai_module import analyze_deprecated_apis_async, prompt_tokens, stream_deprecated_apis
+from api_detector import YAML_SUFFIXES
+from batch_upload import BATCH_MAX_BYTES, BATCH_MAX_FILES, ManifestWorkspace, UnsafeUpload
+from result_cache import ResultCache, content_key
+from llm_cache import default_llm_cache
+from job_queue import JOB_DB, JOB_WORKERS, JobStore, JobWorkers, QueueFull, validate_callback_url
+from cluster_scanner import (NAMESPACE_RE, ClusterConfig, ClusterError, KubeConfigError, cache_keys,
+                             load_default_config, scan_cluster, scan_key, validate_server_url)
+import metrics
+import json
+import logging
 import os
+import secrets
+import tempfile
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
 
 # Try to load environment variables from .env file
 try:
     from dotenv import load_dotenv
     load_dotenv()
 except ImportError:
-    print("Warning: python-dotenv not installed. Using system environment variables.")
+    logger.warning("python-dotenv not installed. Using system environment variables.")
+
+# Native detection is CPU-bound, so it runs in worker processes instead of the event loop
+detection_pool = None
+# Async analyses (/analyze/ with async_mode) are queued in SQLite and run by job worker processes
+job_store = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global detection_pool, job_store
+    detection_pool = ProcessPoolExecutor(max_workers=int(os.getenv("DETECTION_WORKERS", os.cpu_count() or 1)))
+    job_store = JobStore(JOB_DB)
+    job_store.purge()
+    job_workers = JobWorkers(JOB_DB, JOB_WORKERS)
+    job_workers.start()
+    yield
+    job_workers.stop()
+    detection_pool.shutdown(cancel_futures=True)
+
+app = FastAPI(lifespan=lifespan)
+# Request durations, in-flight requests, Server-Timing (SERVER_TIMING=1) and profiling (PROFILING=1)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Identical uploads (CI retries, several engineers scanning the same manifest)
+# are answered from this cache without re-running detection or the AI call
+analysis_cache = ResultCache(
+    max_entries=int(os.getenv("ANALYSIS_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.getenv("ANALYSIS_CACHE_TTL", "3600")),
+    disk_dir=os.getenv("ANALYSIS_CACHE_DIR")
+)
+
+# Live cluster scans are slow (hundreds of list calls) and the UI rescans often, so
+# results are reused for a short while per cluster, namespace and target version
+cluster_cache = ResultCache(
+    max_entries=int(os.getenv("CLUSTER_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.getenv("CLUSTER_CACHE_TTL", "300"))
+)
+# Clusters uploaded through /api/pluto/kubeconfig, by the opaque ID returned to the uploader. Kept in
+# this process's memory only, so behind several workers an ID is only known to the one that issued it
+uploaded_clusters = ResultCache(
+    max_entries=int(os.getenv("CLUSTER_UPLOAD_MAX", "256")),
+    ttl_seconds=float(os.getenv("CLUSTER_UPLOAD_TTL", "3600"))
+)
+# Scanning with the server's own KUBECONFIG or service account must be switched on explicitly,
+# otherwise any caller could scan the cluster the server has credentials for
+CLUSTER_USE_SERVER_CONFIG = os.getenv("CLUSTER_USE_SERVER_CONFIG", "0") == "1"
+
+metrics.watch_cache("analysis", analysis_cache)
+metrics.watch_cache("cluster", cluster_cache)
+metrics.watch_cache("llm", default_llm_cache())
+metrics.REGISTRY.callback("k8s_helper_jobs", "Async analysis jobs, by status", ("status",),
+                          lambda: {(status,): count for status, count in job_store.counts().items()} if job_store else {})
+
+def _upload_name(filename: str) -> str:
+    """Reduce a client supplied filename to a safe basename with a YAML suffix."""
+    name = Path(filename or "").name or "manifest.yaml"
+    if Path(name).suffix not in YAML_SUFFIXES:
+        name += ".yaml"
+    return name
+
+async def _detect_upload(content: bytes, filename: str, version: str):
+    # Each request gets its own workspace so concurrent uploads never mix
+    with tempfile.TemporaryDirectory(prefix="k8s-analyze-") as workspace:
+        upload_path = Path(workspace) / _upload_name(filename)
+        with open(upload_path, "wb") as f:
+            f.write(content)
+
+        with metrics.stage("detect"):
+            deprecated = await detect_deprecated_apis_async(workspace, version, executor=detection_pool)
+        relativize_paths(deprecated, workspace)
+    return deprecated
 
-app = FastAPI()
+def _sse(event: str, data) -> str:
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _submit_job(content: bytes, filename: str, version: str, callback_url: Optional[str]):
+    if not JOB_WORKERS:
+        return JSONResponse({"error": "Async analysis is disabled (JOB_WORKERS=0)"}, status_code=400)
+    try:
+        if callback_url:
+            validate_callback_url(callback_url)
+        job_id = job_store.submit(content, _upload_name(filename), version, callback_url)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except QueueFull:
+        # Backpressure: tell clients to come back later instead of growing the queue without bound
+        return JSONResponse({"error": "Too many pending analyses, retry later"}, status_code=429,
+                            headers={"Retry-After": "30"})
+    return JSONResponse({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}, status_code=202)
 
 @app.post("/analyze/")
-async def analyze(file: UploadFile, version: str = Form(...)):
+async def analyze(file: UploadFile, version: str = Form(...), async_mode: bool = Form(False),
+                  callback_url: Optional[str] = Form(None)):
+    """
+    Detect deprecated APIs in an uploaded manifest and generate an AI migration plan.
+    With async_mode the analysis is queued instead: the response is a job ID to poll at
+    /jobs/{job_id}, and callback_url (a local URL) receives the finished job.
+    """
+    # Receiving and parsing the form happens before the handler runs
+    metrics.record_since_request_start("upload")
     try:
         content = await file.read()
-        with open("kubeconfig.yaml", "wb") as f:
-            f.write(content)
-        
-        deprecated = run_pluto(".")
-        ai_response = analyze_deprecated_apis(deprecated)
-        return {"ai_response": ai_response, "pluto_output": deprecated}
+        if async_mode:
+            return _submit_job(content, file.filename, version, callback_url)
+
+        cache_key = content_key(content, version, DETECTION_BACKEND)
+        cached = analysis_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        deprecated = await _detect_upload(content, file.filename, version)
+        ai_response = await analyze_deprecated_apis_async(deprecated)
+        # Estimated size of the AI request, for tracking cost per analysis
+        result = {"ai_response": ai_response, "pluto_output": deprecated, "prompt_tokens": prompt_tokens(deprecated)}
+        # Don't cache warnings such as a missing API key or a failed OpenAI call
+        if not ai_response.startswith("⚠️"):
+            analysis_cache.set(cache_key, result)
+        return result
+    except Exception as e:
+        logger.exception("Analysis of %s failed", file.filename)
+        return {"error": f"Internal server error: {str(e)}"}
+
+def _findings_by_file(deprecated) -> dict:
+    files = {}
+    items = deprecated.get("items", []) if isinstance(deprecated, dict) else deprecated
+    for item in items or []:
+        files.setdefault(item.get("filePath", ""), []).append(item)
+    return files
+
+async def _collect_batch(request: Request, workspace: ManifestWorkspace) -> Optional[str]:
+    """Unpack a batch request into the workspace and return the target version from the form, if any."""
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        # Any number of manifests and/or archives, spooled to disk by the form parser
+        form = await request.form(max_files=BATCH_MAX_FILES, max_fields=BATCH_MAX_FILES + 10)
+        for _, value in form.multi_items():
+            if not isinstance(value, str):
+                await asyncio.to_thread(workspace.add_stream, value.file, value.filename)
+        version = form.get("version")
+        await form.close()
+        return version if isinstance(version, str) else None
+
+    # Raw tar/zip body, streamed to disk as it arrives
+    archive_path = workspace.root.parent / "upload.archive"
+    size = 0
+    with open(archive_path, "wb") as f:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > BATCH_MAX_BYTES:
+                raise UnsafeUpload(f"Upload exceeds {BATCH_MAX_BYTES} bytes")
+            f.write(chunk)
+    with open(archive_path, "rb") as f:
+        await asyncio.to_thread(workspace.add_archive, f)
+    return None
+
+@app.post("/analyze/batch")
+async def analyze_batch(request: Request, version: Optional[str] = None):
+    """
+    Analyze many manifests in one request: either a raw tar/zip body (target version in
+    the `version` query parameter) or a multipart form with any number of manifest and
+    archive files plus a `version` field. Detection runs once over the whole set and a
+    single AI plan covers all findings.
+    """
+    try:
+        with tempfile.TemporaryDirectory(prefix="k8s-batch-") as tmp:
+            workspace = ManifestWorkspace(Path(tmp) / "manifests")
+            with metrics.stage("upload"):
+                version = await _collect_batch(request, workspace) or version
+            if not version:
+                return {"error": "Missing target version"}
+            if not workspace.files:
+                return {"error": "No YAML manifests found in the upload"}
+
+            with metrics.stage("detect"):
+                deprecated = await detect_deprecated_apis_async(str(workspace.root), version, executor=detection_pool)
+            relativize_paths(deprecated, str(workspace.root))
+            files_scanned = workspace.files
+
+        ai_response = await analyze_deprecated_apis_async(deprecated)
+        return {
+            "ai_response": ai_response,
+            "files_scanned": files_scanned,
+            "files": _findings_by_file(deprecated),
+            "target-versions": deprecated.get("target-versions", {}) if isinstance(deprecated, dict) else {},
+            # Charts and overlays found in the upload, and templates that could not be rendered
+            "rendered": deprecated.get("rendered") if isinstance(deprecated, dict) else None,
+            "prompt_tokens": prompt_tokens(deprecated)
+        }
+    except UnsafeUpload as e:
+        return {"error": str(e)}
     except Exception as e:
+        logger.exception("Batch analysis failed")
         return {"error": f"Internal server error: {str(e)}"}
 
+@app.post("/analyze/stream")
+async def analyze_stream(file: UploadFile, version: str = Form(...)):
+    """
+    Same analysis as /analyze/, streamed as Server-Sent Events: a `pluto` event with the
+    detection results as soon as they are ready, `token` events with pieces of the AI
+    plan as they are generated, then `done` with the prompt token count (or `error`).
+    """
+    metrics.record_since_request_start("upload")
+    content = await file.read()
+    filename = file.filename
+
+    async def events():
+        try:
+            cache_key = content_key(content, version, DETECTION_BACKEND)
+            cached = analysis_cache.get(cache_key)
+            if cached is not None:
+                yield _sse("pluto", cached["pluto_output"])
+                yield _sse("token", cached["ai_response"])
+                yield _sse("done", {"prompt_tokens": cached.get("prompt_tokens", 0)})
+                return
+
+            deprecated = await _detect_upload(content, filename, version)
+            yield _sse("pluto", deprecated)
+
+            pieces = []
+            async for piece in stream_deprecated_apis(deprecated):
+                pieces.append(piece)
+                yield _sse("token", piece)
+            tokens = prompt_tokens(deprecated)
+            yield _sse("done", {"prompt_tokens": tokens})
+
+            # Don't cache warnings such as a missing API key or a failed OpenAI call
+            if not any(piece.lstrip().startswith("⚠️") for piece in pieces):
+                analysis_cache.set(cache_key, {"ai_response": "".join(pieces), "pluto_output": deprecated,
+                                               "prompt_tokens": tokens})
+        except Exception as e:
+            logger.exception("Streamed analysis of %s failed", filename)
+            yield _sse("error", {"error": f"Internal server error: {str(e)}"})
+
+    # Disable proxy buffering so events reach the client as they are produced
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/api/pluto/kubeconfig")
+async def upload_kubeconfig(file: UploadFile, context: Optional[str] = Form(None)):
+    """
+    Register a cluster for /api/pluto/* and return its `cluster_id`, to be sent by the
+    same caller as the X-Cluster-Id header of scan requests. The kubeconfig is kept in memory
+    for CLUSTER_UPLOAD_TTL seconds; credentials must be embedded (token or *-data fields),
+    credential plugins are refused and the server must pass validate_server_url.
+    """
+    try:
+        # Validating the server resolves its name, which blocks
+        config = await asyncio.to_thread(ClusterConfig.from_kubeconfig, (await file.read()).decode(), context)
+        config.ssl_context()
+    except (KubeConfigError, UnicodeDecodeError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    cluster_id = secrets.token_urlsafe(32)
+    uploaded_clusters.set(cluster_id, config)
+    return {"cluster_id": cluster_id, "cluster": config.name, "server": config.server,
+            "expires_in": uploaded_clusters.ttl_seconds}
+
+async def _cluster_config(cluster_id: Optional[str]):
+    """The caller's uploaded cluster, or the server's own one when CLUSTER_USE_SERVER_CONFIG is on."""
+    if cluster_id:
+        config = uploaded_clusters.get(cluster_id)
+        if config is None:
+            return JSONResponse({"error": "Unknown or expired cluster ID: upload the kubeconfig again"},
+                                status_code=404)
+        # Checked again at scan time in case the name now resolves elsewhere
+        await asyncio.to_thread(validate_server_url, config.server)
+        return config
+    if not CLUSTER_USE_SERVER_CONFIG:
+        return JSONResponse({"error": "No cluster selected: upload a kubeconfig to /api/pluto/kubeconfig and send "
+                                      "the returned cluster_id as the X-Cluster-Id header"}, status_code=400)
+    config = load_default_config()
+    if config is None:
+        return JSONResponse({"error": "No cluster configured: set KUBECONFIG or run in a pod"}, status_code=400)
+    return config
+
+async def _scan(namespace: Optional[str], version: Optional[str], refresh: bool, cluster_id: Optional[str]):
+    try:
+        config = await _cluster_config(cluster_id)
+    except KubeConfigError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    if isinstance(config, JSONResponse):
+        return config
+
+    key = scan_key(config, namespace, version)
+    cached = None if refresh else cluster_cache.get(key)
+    if cached is not None:
+        return {**cached, "cached": True}
+    try:
+        scan = await scan_cluster(config, [namespace] if namespace else None, version)
+    except KubeConfigError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except ClusterError as e:
+        return JSONResponse({"error": str(e)}, status_code=502)
+
+    for scope_key, scopes in cache_keys(config, scan, cluster_wide=namespace is None):
+        cluster_cache.set(scope_key, {**scan.report(scopes), "cluster": config.name})
+    return {**scan.report(), "cluster": config.name, "cached": False}
+
+@app.get("/api/pluto/cluster")
+async def scan_cluster_apis(version: Optional[str] = None, refresh: bool = False,
+                            cluster_id: Optional[str] = Header(None, alias="X-Cluster-Id")):
+    """
+    Deprecated APIs in use in the live cluster, from the last-applied configuration of
+    objects and from deployed Helm releases. The cluster is the one registered under the
+    X-Cluster-Id header (see /api/pluto/kubeconfig). Results are cached for CLUSTER_CACHE_TTL
+    seconds; `refresh=true` forces a new scan.
+    """
+    return await _scan(None, version, refresh, cluster_id)
+
+@app.get("/api/pluto/namespace/{namespace}")
+async def scan_namespace_apis(namespace: str, version: Optional[str] = None, refresh: bool = False,
+                              cluster_id: Optional[str] = Header(None, alias="X-Cluster-Id")):
+    """Same as /api/pluto/cluster for a single namespace (cluster-scoped objects are left out)."""
+    if not NAMESPACE_RE.match(namespace):
+        return JSONResponse({"error": f"Invalid namespace: {namespace}"}, status_code=400)
+    return await _scan(namespace, version, refresh, cluster_id)
+
+@app.get("/jobs")
+async def job_stats():
+    return {"workers": JOB_WORKERS, "jobs": job_store.counts()}
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Status of a queued analysis; includes `result` (same shape as /analyze/) once done."""
+    job = job_store.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return job
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text format: request and stage latency histograms, in-flight requests, cache and token counters."""
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {**analysis_cache.stats(), "llm": default_llm_cache().stats(), "cluster": cluster_cache.stats()}
@@ -0,0 +1,480 @@
+"""
+Render stage: expands Helm charts and Kustomize overlays into plain manifests before detection.
+
+Charts are rendered with `helm template` and kustomizations with `kustomize build` (or
+`kubectl kustomize`) when those binaries are installed, otherwise with the pure-Python
+fallbacks (helm_template for simple charts, a resource/patch/prefix subset of Kustomize).
+Renders are cached by chart name and version plus a hash of the values (and of the
+chart's files, since local charts are often edited without a version bump); independent
+charts and overlays are rendered in parallel.
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+import yaml_backend
+import manifest_scanner
+import helm_template
+from result_cache import ResultCache, content_key
+
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "4"))
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "120"))
+HELM_BIN = os.getenv("HELM_BIN", "helm")
+KUSTOMIZE_BIN = os.getenv("KUSTOMIZE_BIN", "kustomize")
+KUSTOMIZATION_FILES = ("kustomization.yaml", "kustomization.yml", "Kustomization")
+# Bump when the fallback renderers' output changes, so cached renders are not reused
+FALLBACK_VERSION = "1"
+
+# Kinds the Kustomize `namespace` field leaves alone
+_CLUSTER_SCOPED_KINDS = frozenset({
+    "Namespace", "ClusterRole", "ClusterRoleBinding", "CustomResourceDefinition", "StorageClass",
+    "PersistentVolume", "PriorityClass", "PodSecurityPolicy", "ValidatingWebhookConfiguration",
+    "MutatingWebhookConfiguration", "APIService", "CSIDriver", "RuntimeClass", "IngressClass",
+})
+
+
+class RenderError(Exception):
+    """helm or kustomize failed on a source (the fallback renderer is tried next)."""
+
+
+class RenderedManifest(NamedTuple):
+    """Rendered documents and the file they came from (template, or resource of a kustomization)."""
+    path: Path
+    text: str
+
+
+@dataclass
+class RenderResult:
+    manifests: List[RenderedManifest] = field(default_factory=list)
+    # Sources replaced by their rendered output; detection skips them
+    chart_dirs: List[Path] = field(default_factory=list)
+    input_files: Set[Path] = field(default_factory=set)
+    errors: List[str] = field(default_factory=list)
+    sources: int = 0
+    cache_hits: int = 0
+
+    def replaces(self, path: Path) -> bool:
+        """Whether a raw file is covered by a rendered chart or kustomization."""
+        path = Path(os.path.abspath(path))
+        return path in self.input_files or any(chart_dir in path.parents for chart_dir in self.chart_dirs)
+
+    def summary(self) -> Dict:
+        return {"sources": self.sources, "cache_hits": self.cache_hits, "errors": self.errors}
+
+
+def _kustomization_file(directory: Path) -> Optional[Path]:
+    return next((directory / name for name in KUSTOMIZATION_FILES if (directory / name).is_file()), None)
+
+
+def is_chart_template(path) -> bool:
+    """Whether a file is a Helm template (under a chart's templates/ directory) rather than a manifest."""
+    path = Path(os.path.abspath(path))
+    return any(parent.name == "templates" and (parent.parent / "Chart.yaml").is_file() for parent in path.parents)
+
+
+def chart_templates(paths: Iterable[str]) -> Set[str]:
+    """
+    The Helm templates among repository-relative, '/'-separated paths (e.g. a git tree),
+    by the same rule as is_chart_template with the Chart.yaml looked up in `paths`.
+    """
+    paths = set(paths)
+    return {path for path in paths if any(parent.name == "templates" and str(parent.parent / "Chart.yaml") in paths
+                                          for parent in PurePosixPath(path).parents)}
+
+
+def find_sources(root) -> Tuple[List[Path], List[Path]]:
+    """
+    Chart directories and top-level kustomization directories under `root`. Subcharts
+    are rendered with their parent chart, and kustomizations used as a resource of
+    another one (bases) only through the overlays that use them.
+    """
+    charts, kustomizations = [], []
+    for directory, subdirectories, files in os.walk(os.path.abspath(root)):
+        subdirectories.sort()
+        if "Chart.yaml" in files:
+            charts.append(Path(directory))
+            subdirectories[:] = []
+        elif any(name in files for name in KUSTOMIZATION_FILES):
+            kustomizations.append(Path(directory))
+
+    referenced = set()
+    for directory in kustomizations:
+        try:
+            spec = _kustomization_spec(directory)
+        except (yaml_backend.YAMLError, OSError, UnicodeDecodeError):
+            continue
+        for entry in _resource_entries(spec):
+            referenced.add(Path(os.path.normpath(directory / entry)))
+    return charts, [directory for directory in kustomizations if directory not in referenced]
+
+
+def _kustomization_spec(directory: Path) -> Dict:
+    with open(_kustomization_file(directory), 'r') as f:
+        spec = yaml_backend.safe_load(f)
+    return spec if isinstance(spec, dict) else {}
+
+
+def _resource_entries(spec: Dict) -> List[str]:
+    entries = []
+    for key in ("resources", "bases", "components"):
+        entries.extend(entry for entry in spec.get(key) or [] if isinstance(entry, str))
+    return entries
+
+
+def _is_remote(entry: str) -> bool:
+    return "://" in entry or entry.startswith(("github.com/", "git@", "gitlab.com/"))
+
+
+def _files_digest(paths: Iterable[Path], base: Path) -> str:
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(os.path.relpath(path, base).encode() + b"\0")
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _tool_version(binary: str, *version_args: str) -> Optional[str]:
+    """Version string of an installed tool (part of the cache key), or None if it isn't installed."""
+    if not shutil.which(binary):
+        return None
+    try:
+        result = subprocess.run([binary, *version_args], capture_output=True, text=True, timeout=RENDER_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return (result.stdout.strip() or result.stderr.strip() or "unknown") if result.returncode == 0 else None
+
+
+def _kustomize_command(directory: Path) -> Tuple[Optional[List[str]], Optional[str]]:
+    """Build command for a kustomization and the tool's version, (None, None) without kustomize/kubectl."""
+    version = _tool_version(KUSTOMIZE_BIN, "version")
+    if version:
+        return [KUSTOMIZE_BIN, "build", str(directory)], version
+    version = _tool_version("kubectl", "version", "--client")
+    if version:
+        return ["kubectl", "kustomize", str(directory)], version
+    return None, None
+
+
+def _run(command: List[str]) -> str:
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=RENDER_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        raise RenderError(f"{command[0]} timed out after {RENDER_TIMEOUT:g}s")
+    except OSError as e:
+        raise RenderError(str(e))
+    if result.returncode != 0:
+        lines = [line for line in result.stderr.strip().splitlines() if line.strip()]
+        raise RenderError(lines[-1] if lines else f"{command[0]} exited with {result.returncode}")
+    return result.stdout
+
+
+def _documents(text: str) -> List[str]:
+    return [document.text for document in manifest_scanner.scan_documents(text.splitlines(keepends=True))]
+
+
+def _dump_documents(documents: List[Dict]) -> str:
+    return yaml_backend.dump_all(documents, explicit_start=True)
+
+
+class _Kustomization:
+    """
+    Pure-Python subset of `kustomize build`: local resources and bases, strategic merge
+    patches, namespace, name prefix/suffix and common labels/annotations. It also lists
+    the local files a kustomization reads, which the real build needs for the cache key
+    and to attribute rendered objects to the file they came from.
+    """
+
+    def __init__(self, directory: Path):
+        self.inputs: Set[Path] = set()
+        self.errors: List[str] = []
+        # [origin file, name in the origin file, object]
+        self.objects = self._build(directory, ())
+
+    def _load(self, path: Path) -> List[Dict]:
+        self.inputs.add(path)
+        with open(path, 'r') as f:
+            return [document for document in yaml_backend.safe_load_all(f) if isinstance(document, dict)]
+
+    def _build(self, directory: Path, stack: Tuple[Path, ...]) -> List[list]:
+        kustomization = _kustomization_file(directory)
+        self.inputs.add(kustomization)
+        spec = _kustomization_spec(directory)
+        objects = []
+        for entry in _resource_entries(spec):
+            if _is_remote(entry):
+                self.errors.append(f"{kustomization}: remote resource {entry} is not rendered")
+                continue
+            path = Path(os.path.normpath(directory / entry))
+            if path.is_dir() and _kustomization_file(path):
+                if path in stack:
+                    self.errors.append(f"{kustomization}: cycle through {entry}")
+                    continue
+                objects.extend(self._build(path, stack + (directory,)))
+            elif path.is_file():
+                objects.extend([path, (doc.get("metadata") or {}).get("name"), doc] for doc in self._load(path))
+            else:
+                self.errors.append(f"{kustomization}: resource {entry} not found")
+
+        for patch in self._patches(directory, spec, kustomization):
+            self._apply_patch(objects, patch)
+        self._transform(objects, spec)
+        return objects
+
+    def _patches(self, directory: Path, spec: Dict, kustomization: Path) -> List[Dict]:
+        entries = list(spec.get("patchesStrategicMerge") or [])
+        for patch in spec.get("patches") or []:
+            if isinstance(patch, dict) and not patch.get("target"):
+                entries.append(patch.get("path") or patch.get("patch") or "")
+        if spec.get("patchesJson6902") or any(isinstance(patch, dict) and patch.get("target")
+                                              for patch in spec.get("patches") or []):
+            self.errors.append(f"{kustomization}: targeted/JSON 6902 patches are ignored without kustomize")
+        patches = []
+        for entry in entries:
+            if not isinstance(entry, str) or not entry.strip():
+                continue
+            if "\n" in entry or entry.lstrip().startswith(("{", "apiVersion")):
+                patches.extend(doc for doc in yaml_backend.safe_load_all(entry) if isinstance(doc, dict))
+                continue
+            path = Path(os.path.normpath(directory / entry))
+            if path.is_file():
+                patches.extend(self._load(path))
+            else:
+                self.errors.append(f"{kustomization}: patch {entry} not found")
+        return patches
+
+    def _apply_patch(self, objects: List[list], patch: Dict) -> None:
+        name = (patch.get("metadata") or {}).get("name")
+        for entry in objects:
+            origin, original_name, obj = entry
+            if obj.get("kind") != patch.get("kind") or name not in (original_name, (obj.get("metadata") or {}).get("name")):
+                continue
+            if patch.get("$patch") == "delete":
+                objects.remove(entry)
+            else:
+                entry[2] = _strategic_merge(obj, patch)
+            return
+
+    @staticmethod
+    def _transform(objects: List[list], spec: Dict) -> None:
+        labels = dict(spec.get("commonLabels") or {})
+        for group in spec.get("labels") or []:
+            if isinstance(group, dict):
+                labels.update(group.get("pairs") or {})
+        annotations = spec.get("commonAnnotations") or {}
+        for _, _, obj in objects:
+            metadata = obj.setdefault("metadata", {})
+            if spec.get("namespace") and obj.get("kind") not in _CLUSTER_SCOPED_KINDS:
+                metadata["namespace"] = spec["namespace"]
+            if metadata.get("name") and obj.get("kind") != "Namespace":
+                metadata["name"] = f"{spec.get('namePrefix') or ''}{metadata['name']}{spec.get('nameSuffix') or ''}"
+            if labels:
+                metadata["labels"] = {**(metadata.get("labels") or {}), **labels}
+            if annotations:
+                metadata["annotations"] = {**(metadata.get("annotations") or {}), **annotations}
+
+
+def _strategic_merge(target, patch):
+    """Strategic merge without list merge keys: maps merge recursively, lists and scalars are replaced."""
+    if isinstance(target, dict) and isinstance(patch, dict):
+        merged = dict(target)
+        for key, value in patch.items():
+            if key == "$patch":
+                continue
+            if value is None:
+                merged.pop(key, None)
+            else:
+                merged[key] = _strategic_merge(target.get(key), value)
+        return merged
+    return patch
+
+
+def _object_key(obj: Dict) -> Tuple[str, str, str]:
+    metadata = obj.get("metadata") or {}
+    return obj.get("kind") or "", metadata.get("namespace") or "", metadata.get("name") or ""
+
+
+class Renderer:
+    """Renders charts and kustomizations under a directory, with a shared render cache."""
+
+    def __init__(self, cache: Optional[ResultCache] = None, workers: int = RENDER_WORKERS):
+        self.cache = cache if cache is not None else default_render_cache()
+        self.workers = max(1, workers)
+
+    def render_tree(self, root, kube_version: Optional[str] = None) -> RenderResult:
+        result = RenderResult()
+        charts, kustomizations = find_sources(root)
+        result.chart_dirs = charts
+        jobs = [(self._render_chart, chart) for chart in charts] + \
+               [(self._render_kustomization, directory) for directory in kustomizations]
+        result.sources = len(jobs)
+        if not jobs:
+            return result
+
+        def run(job):
+            render, directory = job
+            try:
+                return render(directory, kube_version)
+            except (yaml_backend.YAMLError, OSError, UnicodeDecodeError, ValueError) as e:
+                return directory, {"manifests": [], "errors": [f"{directory}: {str(e)}"], "inputs": []}, False
+
+        # helm/kustomize run as subprocesses, so threads render independent sources in parallel
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(jobs)), thread_name_prefix="render") as executor:
+            for directory, rendered, cached in executor.map(run, jobs):
+                result.cache_hits += cached
+                result.errors.extend(rendered["errors"])
+                result.input_files.update(Path(os.path.normpath(directory / path)) for path in rendered["inputs"])
+                result.manifests.extend(RenderedManifest(Path(os.path.normpath(directory / path)), text)
+                                        for path, text in rendered["manifests"])
+        return result
+
+    def _cached(self, key: str, directory: Path, render) -> Tuple[Path, Dict, bool]:
+        cached = self.cache.get(key)
+        if cached is not None:
+            return directory, cached, True
+        rendered = render()
+        self.cache.set(key, rendered)
+        return directory, rendered, False
+
+    def _render_chart(self, chart_dir: Path, kube_version: Optional[str]) -> Tuple[Path, Dict, bool]:
+        with open(chart_dir / "Chart.yaml", 'r') as f:
+            metadata = yaml_backend.safe_load(f) or {}
+        values_file = chart_dir / "values.yaml"
+        values = values_file.read_bytes() if values_file.is_file() else b""
+        chart_files = [path for path in chart_dir.rglob("*") if path.is_file() and path != values_file]
+        helm = _tool_version(HELM_BIN, "version", "--short")
+        key = content_key(values, "helm", str(metadata.get("name")), str(metadata.get("version")),
+                          _files_digest(chart_files, chart_dir), kube_version or "",
+                          helm or f"fallback-{helm_template.DEFAULT_KUBE_VERSION}-{FALLBACK_VERSION}")
+        return self._cached(key, chart_dir, lambda: self._template_chart(chart_dir, metadata, kube_version, helm))
+
+    def _template_chart(self, chart_dir: Path, metadata: Dict, kube_version: Optional[str],
+                        helm: Optional[str]) -> Dict:
+        errors = []
+        release = str(metadata.get("name") or chart_dir.name)
+        if helm:
+            command = [HELM_BIN, "template", release, str(chart_dir), "--include-crds"]
+            if kube_version:
+                command += ["--kube-version", kube_version]
+            try:
+                return {"manifests": self._helm_manifests(_run(command), chart_dir, release), "errors": [],
+                        "inputs": []}
+            except RenderError as e:
+                errors.append(f"{chart_dir}: helm template failed ({str(e)}), using the built-in renderer")
+        manifests, template_errors = helm_template.render_chart(chart_dir, release, kube_version=kube_version)
+        return {"manifests": [[os.path.relpath(path, chart_dir), text] for path, text in manifests],
+                "errors": errors + template_errors, "inputs": []}
+
+    @staticmethod
+    def _helm_manifests(output: str, chart_dir: Path, release: str) -> List[List[str]]:
+        """Split `helm template` output by its `# Source: <chart>/<path>` comments."""
+        manifests: Dict[str, List[str]] = {}
+        for document in _documents(output):
+            source = next((line[len("# Source: "):].strip() for line in document.splitlines()
+                           if line.startswith("# Source: ")), f"{release}/rendered.yaml")
+            # The first component is the chart name, the rest is relative to the chart directory
+            relative = source.split("/", 1)[1] if "/" in source else source
+            manifests.setdefault(relative, []).append(document)
+        return [[path, "".join(documents)] for path, documents in manifests.items()]
+
+    def _render_kustomization(self, directory: Path, kube_version: Optional[str]) -> Tuple[Path, Dict, bool]:
+        # The fallback walk is cheap and gives the input files for the key either way
+        kustomization = _Kustomization(directory)
+        command, tool = _kustomize_command(directory)
+        key = content_key(b"", "kustomize", _files_digest(kustomization.inputs, directory),
+                          tool or f"fallback-{FALLBACK_VERSION}")
+        return self._cached(key, directory, lambda: self._build_kustomization(directory, kustomization, command))
+
+    def _build_kustomization(self, directory: Path, kustomization: _Kustomization,
+                             command: Optional[List[str]]) -> Dict:
+        inputs = [os.path.relpath(path, directory) for path in sorted(kustomization.inputs)]
+        by_origin: Dict[str, List[str]] = {}
+        if command:
+            try:
+                output = _run(command)
+            except RenderError as e:
+                kustomization.errors.append(f"{directory}: kustomize build failed ({str(e)}), using the "
+                                            f"built-in renderer")
+            else:
+                # Objects are attributed to the resource file they came from when the fallback found it too
+                origins = {_object_key(obj): origin for origin, _, obj in kustomization.objects}
+                default_origin = _kustomization_file(directory)
+                for document in _documents(output):
+                    try:
+                        obj = yaml_backend.safe_load(document)
+                    except yaml_backend.YAMLError:
+                        obj = None
+                    origin = origins.get(_object_key(obj)) if isinstance(obj, dict) else None
+                    by_origin.setdefault(os.path.relpath(origin or default_origin, directory), []).append(document)
+                return {"manifests": [[path, "".join(documents)] for path, documents in by_origin.items()],
+                        "errors": [], "inputs": inputs}
+
+        grouped: Dict[str, List[Dict]] = {}
+        for origin, _, obj in kustomization.objects:
+            grouped.setdefault(os.path.relpath(origin, directory), []).append(obj)
+        return {"manifests": [[path, _dump_documents(objects)] for path, objects in grouped.items()],
+                "errors": kustomization.errors, "inputs": inputs}
+
+
+def render_cache_from_env() -> ResultCache:
+    """Build a render cache configured from the RENDER_CACHE_* environment variables."""
+    return ResultCache(
+        max_entries=int(os.getenv("RENDER_CACHE_SIZE", "256")),
+        ttl_seconds=float(os.getenv("RENDER_CACHE_TTL", "86400")),
+        disk_dir=os.getenv("RENDER_CACHE_DIR"),
+        max_disk_entries=int(os.getenv("RENDER_CACHE_DISK_ENTRIES", "2000"))
+    )
+
+
+@lru_cache(maxsize=None)
+def default_render_cache() -> ResultCache:
+    """Render cache shared by every detection in this process."""
+    return render_cache_from_env()
+
+
+def render_tree(root, kube_version: Optional[str] = None) -> RenderResult:
+    """Render every chart and kustomization under `root` with the default cache."""
+    return Renderer().render_tree(root, kube_version)
+
+
+def stage_rendered_tree(root, kube_version: Optional[str], staging_dir) -> Tuple[str, RenderResult]:
+    """
+    For tools that only read plain manifests (pluto): copy the raw manifests that are
+    not chart or kustomization inputs to `staging_dir`, next to the rendered output at
+    the same relative paths. Returns the directory to scan (`root` itself when there is
+    nothing to render) and the render result.
+    """
+    original, root = str(root), Path(os.path.abspath(root))
+    if not root.is_dir():
+        return original, RenderResult()
+    rendered = render_tree(root, kube_version)
+    if not rendered.sources:
+        return original, rendered
+
+    staging = Path(staging_dir)
+    for path in root.rglob("*"):
+        if path.suffix in (".yaml", ".yml") and path.is_file() and not rendered.replaces(path):
+            target = staging / path.relative_to(root)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(path, target)
+    for manifest in rendered.manifests:
+        try:
+            relative = manifest.path.relative_to(root)
+        except ValueError:
+            # Resource outside the scanned tree (a base referenced with ../..)
+            relative = Path("_external") / manifest.path.name
+        target = staging / relative.with_suffix(".yaml")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(target, 'a') as f:
+            # Several manifests may land in one file, keep their documents apart
+            separator = "" if manifest.text.startswith("---") else "---\n"
+            f.write(separator + manifest.text + ("" if manifest.text.endswith("\n") else "\n"))
+    return str(staging), rendered
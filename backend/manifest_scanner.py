@@ -0,0 +1,137 @@
+import io
+import re
+from typing import AbstractSet, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+# Top-level (unindented) `apiVersion:` / `kind:` keys, optionally quoted
+_HEADER_RE = re.compile(r"""^(["']?)(apiVersion|kind)\1\s*:\s*(.*)$""")
+_DOCUMENT_START_RE = re.compile(r"^---(\s|$)")
+_DOCUMENT_END_RE = re.compile(r"^\.\.\.(\s|$)")
+
+
+class ScannedDocument(NamedTuple):
+    """One document of a YAML stream with the headers found by the line scanner."""
+    text: str
+    api_version: Optional[str]
+    kind: Optional[str]
+    # False if the scanner could not read the headers reliably (flow style,
+    # tags, anchors, lists...), such documents always need a full parse
+    plain: bool
+
+    def needs_parse(self, index: AbstractSet[Tuple[str, str]]) -> bool:
+        """Whether this document may contain a deprecated API and must be parsed."""
+        if not self.plain:
+            return True
+        if self.api_version is None and self.kind is None:
+            # Empty, comment-only document
+            return False
+        return (self.api_version, self.kind) in index
+
+
+def _scalar_value(raw: str) -> Optional[str]:
+    """Return a plain or quoted scalar value, or None if it is not a simple scalar."""
+    value = raw.strip()
+    if value.startswith(('"', "'")):
+        quote = value[0]
+        end = value.find(quote, 1)
+        return value[1:end] if end > 0 else None
+    value = value.split(" #", 1)[0].strip()
+    if not value or value[0] in "&*!|>{[":
+        return None
+    return value
+
+
+def _finish(lines: list, api_version: Optional[str], kind: Optional[str], plain: bool) -> ScannedDocument:
+    if (api_version is None or kind is None or kind.endswith("List")):
+        # Content without both headers, or a List wrapping nested objects
+        plain = False
+    return ScannedDocument("".join(lines), api_version, kind, plain)
+
+
+def scan_documents(lines: Iterable[str], lossless: bool = False) -> Iterator[ScannedDocument]:
+    """
+    Split a YAML stream into documents and read their top-level apiVersion/kind
+    headers without parsing. Only one document is held in memory at a time.
+
+    With `lossless`, `...` end markers stay with their document and trailing comment-only
+    text is yielded as a header-less document that needs no parse, so joining the texts
+    gives back the stream.
+    """
+    lines_buffer = []
+    api_version = kind = None
+    has_content = False
+    plain = True
+
+    for line in lines:
+        if _DOCUMENT_START_RE.match(line) or _DOCUMENT_END_RE.match(line):
+            if lossless and not line.startswith("---"):
+                lines_buffer.append(line)
+            # Comments/directives before a document stay attached to it
+            if lines_buffer and has_content:
+                yield _finish(lines_buffer, api_version, kind, plain)
+                lines_buffer = []
+            api_version = kind = None
+            has_content = False
+            plain = True
+            if line.startswith("---"):
+                inline = line[3:].split("#", 1)[0].strip()
+                if inline:
+                    # Content on the separator line (`--- !tag`, `--- {...}`)
+                    has_content = True
+                    plain = False
+                lines_buffer.append(line)
+            continue
+
+        lines_buffer.append(line)
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#") or (line.startswith("%") and not has_content):
+            continue
+        has_content = True
+
+        match = _HEADER_RE.match(line)
+        if not match:
+            if not line[0].isspace() and stripped.startswith(("<<", "- ", "{", "[", "&", "!")):
+                plain = False
+            continue
+
+        value = _scalar_value(match.group(3))
+        if value is None:
+            plain = False
+        elif match.group(2) == "apiVersion":
+            api_version = value
+        else:
+            kind = value
+
+    if lines_buffer and has_content:
+        yield _finish(lines_buffer, api_version, kind, plain)
+    elif lines_buffer and lossless:
+        yield ScannedDocument("".join(lines_buffer), None, None, True)
+
+
+def document_frame(text: str) -> Tuple[str, str]:
+    """
+    Leading comments, directives and `---` line, and trailing `...` line of a document's
+    text: kept around its re-serialized content so the stream layout doesn't change.
+    """
+    # Split on \n only, like the scanner (splitlines also breaks on \x0c, \u2028...)
+    lines = io.StringIO(text).readlines()
+    head = 0
+    separator = False
+    for line in lines:
+        if not separator and _DOCUMENT_START_RE.match(line) and not line[3:].split("#", 1)[0].strip():
+            separator = True
+        elif line.strip() and not line.strip().startswith(("#", "%")):
+            break
+        head += 1
+    tail = 1 if len(lines) > head and _DOCUMENT_END_RE.match(lines[-1]) else 0
+    return "".join(lines[:head]), "".join(lines[len(lines) - tail:])
+
+
+def scan_file(path, lossless: bool = False) -> Iterator[ScannedDocument]:
+    """Stream the documents of a YAML file, see scan_documents."""
+    with open(path, 'r') as f:
+        yield from scan_documents(f, lossless)
+
+
+def file_needs_parse(path, index: AbstractSet[Tuple[str, str]]) -> bool:
+    """Whether any document in the file may contain an API from `index`."""
+    return any(document.needs_parse(index) for document in scan_file(path))
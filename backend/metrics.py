@@ -0,0 +1,364 @@
+"""
+Prometheus-style metrics, per-request timing spans and on-demand profiling for the API.
+
+Metrics live in this process and are rendered in the Prometheus text format (served at
+/metrics by main.py), using the standard library only. Code on the request path times
+its stages with `stage("detect")`: each stage feeds the stage histogram and, inside a
+request, that request's spans, which MetricsMiddleware returns as a Server-Timing header.
+"""
+import cProfile
+import itertools
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; covers cache hits (sub-millisecond) up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Server-Timing header on every response (it reveals internal timings, so it is opt-in)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+# Requests sent with `X-Profile: 1` are run under cProfile when this is on
+PROFILING = os.getenv("PROFILING", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", str(Path(tempfile.gettempdir()) / "k8s-profiles"))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels ({', '.join(self.labelnames)}), got ({', '.join(labels)})")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines) + "\n"
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # [count per bucket (not cumulative)..., sum, count]
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            state[next(index for index, bound in enumerate(self.buckets) if value <= bound)] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        names = self.labelnames + ("le",)
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(names, key + (_number(bound),))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(state[-2])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {state[-1]}"
+
+
+class CallbackMetric(_Metric):
+    """Values read at scrape time: `callback()` returns {label values: value}."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], Dict[Tuple[str, ...], float]], type: str = "gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.type = type
+
+    def samples(self) -> Iterator[str]:
+        try:
+            values = self.callback()
+        except Exception:
+            logger.exception("Collecting %s failed", self.name)
+            return
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], Dict[Tuple[str, ...], float]], type: str = "gauge") -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, labelnames, callback, type))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "".join(metric.render() for metric in metrics)
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram("k8s_helper_request_duration_seconds",
+                                     "Time until the response is complete, by route", ("method", "route", "status"))
+REQUESTS_IN_FLIGHT = REGISTRY.gauge("k8s_helper_requests_in_flight", "Requests being handled, by route", ("route",))
+STAGE_SECONDS = REGISTRY.histogram("k8s_helper_stage_duration_seconds",
+                                   "Time spent in each stage of an analysis (upload, detect, pluto, llm...)", ("stage",))
+LLM_REQUESTS = REGISTRY.counter("k8s_helper_llm_requests_total", "OpenAI calls, by outcome", ("outcome",))
+LLM_TOKENS = REGISTRY.counter("k8s_helper_llm_tokens_total",
+                              "Tokens sent to (prompt) and received from (completion) OpenAI", ("type",))
+
+_caches: Dict[str, object] = {}
+
+
+def _cache_values(field: str, *labels: str) -> Dict[Tuple[str, ...], float]:
+    return {(name,) + labels: cache.stats()[field] for name, cache in list(_caches.items())}
+
+
+def _cache_lookups() -> Dict[Tuple[str, ...], float]:
+    return {**_cache_values("hits", "hit"), **_cache_values("misses", "miss")}
+
+
+REGISTRY.callback("k8s_helper_cache_lookups_total", "Cache lookups, by cache and result", ("cache", "result"),
+                  _cache_lookups, type="counter")
+REGISTRY.callback("k8s_helper_cache_disk_hits_total", "Cache hits served from the disk tier", ("cache",),
+                  lambda: _cache_values("disk_hits"), type="counter")
+REGISTRY.callback("k8s_helper_cache_evictions_total", "Entries evicted from the memory tier", ("cache",),
+                  lambda: _cache_values("evictions"), type="counter")
+REGISTRY.callback("k8s_helper_cache_entries", "Entries in the memory tier", ("cache",),
+                  lambda: _cache_values("entries"))
+
+
+def watch_cache(name: str, cache) -> None:
+    """Export the hit/miss/eviction counters of a ResultCache under `name`."""
+    _caches[name] = cache
+
+
+def record_tokens(prompt: int, completion: int) -> None:
+    LLM_TOKENS.inc(prompt, type="prompt")
+    LLM_TOKENS.inc(completion, type="completion")
+
+
+class RequestTiming:
+    """Spans of one request, in the order their stages finished."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+
+    def server_timing(self) -> str:
+        spans = self.spans + [("total", time.perf_counter() - self.started)]
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in spans)
+
+
+_current: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timing = _current.get()
+    if timing is not None:
+        timing.spans.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the block as stage `name` (also when it raises)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def record_since_request_start(name: str) -> None:
+    """Record the time from the start of the current request until now, e.g. receiving the upload."""
+    timing = _current.get()
+    if timing is not None:
+        record_stage(name, time.perf_counter() - timing.started)
+
+
+_profile_lock = threading.Lock()
+_profile_ids = itertools.count(1)
+
+
+@contextmanager
+def profile(label: str) -> Iterator[Optional[Path]]:
+    """
+    Run the block under cProfile and dump the stats to PROFILE_DIR. Yields the .prof path,
+    or None when another profile is running (only one profiler can be active at a time).
+    On the event loop thread this also profiles whatever other requests run meanwhile.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        yield None
+        return
+    try:
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", label).strip("-") or "root"
+        path = Path(PROFILE_DIR) / f"{time.strftime('%Y%m%d-%H%M%S')}-{next(_profile_ids)}-{slug}.prof"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield path
+        finally:
+            profiler.disable()
+            profiler.dump_stats(str(path))
+            logger.info("Profile of %s written to %s", label, path)
+    finally:
+        _profile_lock.release()
+
+
+def _route(scope) -> str:
+    # Route templates (/jobs/{job_id}) rather than raw paths keep the label set small
+    from starlette.routing import Match
+    for route in getattr(scope.get("app"), "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request duration (until the last body chunk, so streamed
+    responses count in full) and in-flight requests per route. Adds the request's spans as
+    a Server-Timing header and profiles requests sent with `X-Profile: 1` when enabled.
+    """
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING, profiling: bool = PROFILING):
+        self.app = app
+        self.server_timing = server_timing
+        self.profiling = profiling
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = _route(scope)
+        timing = RequestTiming()
+        token = _current.set(timing)
+        status = "500"
+        profile_path = None
+
+        async def send_with_headers(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                headers = list(message.get("headers", []))
+                if self.server_timing:
+                    headers.append((b"server-timing", timing.server_timing().encode()))
+                if profile_path:
+                    headers.append((b"x-profile-file", str(profile_path).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        wants_profile = self.profiling and (b"x-profile", b"1") in scope.get("headers", [])
+        REQUESTS_IN_FLIGHT.inc(route=route)
+        try:
+            if wants_profile:
+                with profile(f"{scope['method']} {route}") as profile_path:
+                    await self.app(scope, receive, send_with_headers)
+            else:
+                await self.app(scope, receive, send_with_headers)
+        finally:
+            REQUESTS_IN_FLIGHT.dec(route=route)
+            elapsed = time.perf_counter() - timing.started
+            REQUEST_SECONDS.observe(elapsed, method=scope["method"], route=route, status=status)
+            _current.reset(token)
+            logger.debug("%s %s %s in %.1f ms (%s)", scope["method"], scope["path"], status, elapsed * 1000,
+                         timing.server_timing())
@@ -1,18 +1,129 @@
+import asyncio
 import subprocess
 import json
+import logging
+import os
+import tempfile
+from concurrent.futures import Executor
+from typing import Optional
+from api_detector import detect_files, normalize_version
+from manifest_renderer import stage_rendered_tree
+from metrics import stage
 
-def run_pluto(path: str) -> list:
+logger = logging.getLogger(__name__)
+
+# "native" (default) scans in-process, "pluto" shells out to the pluto binary,
+# "both" runs native detection and cross-checks it against pluto
+DETECTION_BACKEND = os.getenv("DETECTION_BACKEND", "native")
+
+def _pluto_command(path: str, target_version: Optional[str]) -> list:
     cmd = ["pluto", "detect-files", "-o", "json", "-d", path]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    
+    if target_version:
+        cmd += ["--target-versions", f"k8s={normalize_version(target_version)}"]
+    return cmd
+
+def _parse_pluto_output(returncode: int, stdout: str, stderr: str):
     # Pluto returns exit code 3 when it finds deprecated APIs (this is normal)
-    if result.returncode in [0, 3]:
+    if returncode in [0, 3]:
         try:
-            return json.loads(result.stdout)
+            with stage("pluto_parse"):
+                return json.loads(stdout)
         except json.JSONDecodeError:
+            logger.debug("Pluto output is not JSON: %s", stdout[:200])
             return []
     else:
         # If there's a real error, return empty list
-        print(f"Pluto error: {result.stderr}")
+        logger.warning("Pluto error: %s", stderr)
         return []
 
+def _relocate_paths(result, staged: str, root: str) -> None:
+    """Point findings in a staged (rendered) copy of `root` back at the original files."""
+    if staged == root:
+        return
+    items = result.get("items", []) if isinstance(result, dict) else result
+    for item in items or []:
+        if item.get("filePath", "").startswith(staged):
+            item["filePath"] = os.path.join(root, os.path.relpath(item["filePath"], staged))
+
+def run_pluto(path: str, target_version: Optional[str] = None) -> list:
+    # pluto reads plain manifests only: charts and overlays are rendered into a staging copy first
+    with tempfile.TemporaryDirectory(prefix="k8s-render-") as staging:
+        with stage("render"):
+            scan_path, _ = stage_rendered_tree(path, normalize_version(target_version), staging)
+        with stage("pluto"):
+            result = subprocess.run(_pluto_command(scan_path, target_version), capture_output=True, text=True)
+        output = _parse_pluto_output(result.returncode, result.stdout, result.stderr)
+        _relocate_paths(output, scan_path, path)
+    return output
+
+async def run_pluto_async(path: str, target_version: Optional[str] = None) -> list:
+    """Run pluto as an asyncio subprocess so the event loop is never blocked."""
+    with tempfile.TemporaryDirectory(prefix="k8s-render-") as staging:
+        with stage("render"):
+            scan_path, _ = await asyncio.to_thread(stage_rendered_tree, path, normalize_version(target_version),
+                                                   staging)
+        with stage("pluto"):
+            process = await asyncio.create_subprocess_exec(
+                *_pluto_command(scan_path, target_version),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            stdout, stderr = await process.communicate()
+        output = _parse_pluto_output(process.returncode, stdout.decode(), stderr.decode())
+        _relocate_paths(output, scan_path, path)
+    return output
+
+def _finding_keys(result) -> set:
+    items = result.get("items", []) if isinstance(result, dict) else result
+    return {
+        (item.get("filePath"), item.get("name"), item["api"]["version"], item["api"]["kind"])
+        for item in items or []
+    }
+
+def cross_check(native_result: dict, pluto_result) -> None:
+    """Report findings where the native detector and pluto disagree."""
+    native_keys = _finding_keys(native_result)
+    pluto_keys = _finding_keys(pluto_result)
+    for key in sorted(pluto_keys - native_keys, key=str):
+        logger.warning("Detection mismatch, only pluto found: %s", key)
+    for key in sorted(native_keys - pluto_keys, key=str):
+        logger.warning("Detection mismatch, only native detector found: %s", key)
+
+def relativize_paths(result, workspace: str) -> None:
+    """Report file paths relative to the workspace instead of the temp directory."""
+    items = result.get("items", []) if isinstance(result, dict) else result
+    for item in items or []:
+        if item.get("filePath"):
+            item["filePath"] = os.path.relpath(item["filePath"], workspace)
+    rendered = result.get("rendered") if isinstance(result, dict) else None
+    if rendered:
+        rendered["errors"] = [error.replace(os.path.join(workspace, ""), "") for error in rendered["errors"]]
+
+def detect_deprecated_apis(path: str, target_version: Optional[str] = None, backend: Optional[str] = None):
+    """Detect deprecated APIs under `path` using the configured backend."""
+    backend = backend or DETECTION_BACKEND
+    if backend == "pluto":
+        return run_pluto(path, target_version)
+
+    result = detect_files(path, target_version)
+    if backend == "both":
+        cross_check(result, run_pluto(path, target_version))
+    return result
+
+async def detect_deprecated_apis_async(path: str, target_version: Optional[str] = None,
+                                       backend: Optional[str] = None, executor: Optional[Executor] = None):
+    """
+    Non-blocking detect_deprecated_apis: native scans run on `executor`
+    (the loop's default executor if None) and pluto runs as an asyncio subprocess.
+    """
+    backend = backend or DETECTION_BACKEND
+    if backend == "pluto":
+        return await run_pluto_async(path, target_version)
+
+    loop = asyncio.get_running_loop()
+    native = loop.run_in_executor(executor, detect_files, path, target_version)
+    if backend == "both":
+        result, pluto_result = await asyncio.gather(native, run_pluto_async(path, target_version))
+        cross_check(result, pluto_result)
+        return result
+    return await native
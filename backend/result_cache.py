@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+def content_key(content: bytes, *parts: str) -> str:
+    """Build a cache key from the SHA-256 of the content plus extra key parts."""
+    digest = hashlib.sha256(content)
+    for part in parts:
+        digest.update(b"\0")
+        digest.update((part or "").encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    LRU cache with TTL and an optional on-disk tier that survives restarts.
+    The disk tier keeps at most `max_disk_entries` files (0 = unbounded), oldest removed first.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600, disk_dir: Optional[str] = None,
+                 max_disk_entries: int = 0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._disk_writes = 0
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - stored_at > self.ttl_seconds
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.json"
+
+    def _remember(self, key: str, stored_at: float, value: Any) -> None:
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _load_from_disk(self, key: str):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(record["stored_at"]):
+            path.unlink(missing_ok=True)
+            return None
+        return record["stored_at"], record["value"]
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and not self._expired(entry[0]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+
+            entry = self._load_from_disk(key)
+            if entry:
+                self._remember(key, *entry)
+                self.hits += 1
+                self.disk_hits += 1
+                return entry[1]
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, stored_at, value)
+        if self.disk_dir:
+            # Write to a temp file first so readers never see a partial entry
+            path = self._disk_path(key)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'w') as f:
+                json.dump({"stored_at": stored_at, "value": value}, f)
+            os.replace(tmp_path, path)
+            self._disk_writes += 1
+            # Listing the directory is O(n), so only prune once per 10% of the limit
+            if self.max_disk_entries and self._disk_writes >= max(1, self.max_disk_entries // 10):
+                self._disk_writes = 0
+                self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        entries = []
+        for path in self.disk_dir.glob("*.json"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except OSError:
+                pass
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_disk_entries)]:
+            path.unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self.disk_dir:
+            for path in self.disk_dir.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_dir": str(self.disk_dir) if self.disk_dir else None,
+                "max_disk_entries": self.max_disk_entries
+            }
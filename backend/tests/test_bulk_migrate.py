@@ -0,0 +1,74 @@
+import subprocess
+import pytest
+from bulk_migrate import PLANNED, FanoutState, RepoSpec, fan_out, migrate_repository
+from git_ops import WorkspacePool
+from yaml_migrator import KubernetesAPIMigrator
+
+DEPLOYMENT = """apiVersion: extensions/v1beta1
+kind: Deployment
+metadata:
+  name: web
+spec:
+  template:
+    spec:
+      containers: []
+"""
+CHART_TEMPLATE = """apiVersion: extensions/v1beta1
+kind: Ingress
+metadata:
+  name: {{ .Release.Name }}
+spec:
+  rules:
+  {{- range .Values.hosts }}
+  - host: {{ . }}
+  {{- end }}
+"""
+BROKEN = """apiVersion: extensions/v1beta1
+kind: Deployment
+metadata: {name: [broken
+"""
+
+
+@pytest.fixture
+def repo_url(tmp_path, monkeypatch):
+    for name in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{name}_NAME", "test")
+        monkeypatch.setenv(f"GIT_{name}_EMAIL", "test@example.com")
+    source = tmp_path / "source"
+    files = {
+        "apps/web.yaml": DEPLOYMENT,
+        "apps/broken.yaml": BROKEN,
+        "chart/Chart.yaml": "apiVersion: v2\nname: chart\nversion: 0.1.0\n",
+        "chart/templates/ing.yaml": CHART_TEMPLATE,
+    }
+    for path, content in files.items():
+        (source / path).parent.mkdir(parents=True, exist_ok=True)
+        (source / path).write_text(content)
+    subprocess.run(["git", "init", "-q", "-b", "main", str(source)], check=True)
+    subprocess.run(["git", "-C", str(source), "add", "."], check=True)
+    subprocess.run(["git", "-C", str(source), "commit", "-q", "-m", "init"], check=True)
+    bare = tmp_path / "repo.git"
+    subprocess.run(["git", "clone", "-q", "--bare", str(source), str(bare)], check=True)
+    return str(bare)
+
+
+def test_migrate_repository_skips_templates_and_broken_files(tmp_path, repo_url):
+    pool = WorkspacePool(str(tmp_path / "workspace"))
+    migrator = KubernetesAPIMigrator(output_dir=str(tmp_path / "output"), mode="in-place")
+
+    changes, skipped = migrate_repository(RepoSpec(repo_url), migrator, pool)
+
+    assert sorted(changes) == ["apps/web.yaml"]
+    assert "apiVersion: apps/v1" in changes["apps/web.yaml"]
+    assert sorted(skipped) == ["apps/broken.yaml"]
+
+
+def test_fan_out_records_skipped_files(tmp_path, repo_url):
+    state = FanoutState(str(tmp_path / "state.json"))
+
+    fan_out([RepoSpec(repo_url)], state, dry_run=True, pool=WorkspacePool(str(tmp_path / "workspace")))
+
+    entry = state.repos[repo_url]
+    assert entry["status"] == PLANNED
+    assert entry["files"] == ["apps/web.yaml"]
+    assert list(entry["skipped"]) == ["apps/broken.yaml"]
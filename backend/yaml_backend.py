@@ -0,0 +1,46 @@
+import logging
+import os
+import yaml
+
+# Use the LibYAML C bindings when PyYAML was built with them, they are several
+# times faster than the pure-Python loader/dumper. Set K8S_YAML_BACKEND=python
+# to force the pure-Python implementation.
+_requested = os.getenv("K8S_YAML_BACKEND", "auto").lower()
+
+if _requested != "python" and getattr(yaml, "__with_libyaml__", False):
+    Loader = yaml.CSafeLoader
+    Dumper = yaml.CSafeDumper
+    BACKEND = "libyaml"
+else:
+    if _requested == "libyaml":
+        logging.getLogger(__name__).warning(
+            "LibYAML bindings not available, falling back to the pure-Python YAML backend.")
+    Loader = yaml.SafeLoader
+    Dumper = yaml.SafeDumper
+    BACKEND = "python"
+
+YAMLError = yaml.YAMLError
+
+
+def safe_load(stream):
+    """Parse a single YAML document with the active backend."""
+    return yaml.load(stream, Loader=Loader)
+
+
+def safe_load_all(stream):
+    """Lazily parse all documents in a YAML stream with the active backend."""
+    return yaml.load_all(stream, Loader=Loader)
+
+
+def dump(data, stream=None, **kwargs):
+    """Serialize a single document with the active backend."""
+    kwargs.setdefault("default_flow_style", False)
+    kwargs.setdefault("sort_keys", False)
+    return yaml.dump(data, stream, Dumper=Dumper, **kwargs)
+
+
+def dump_all(documents, stream=None, **kwargs):
+    """Serialize several documents with the active backend."""
+    kwargs.setdefault("default_flow_style", False)
+    kwargs.setdefault("sort_keys", False)
+    return yaml.dump_all(documents, stream, Dumper=Dumper, **kwargs)
@@ -1,92 +1,212 @@
-import yaml
+import io
 import os
 import argparse
+import shutil
+import yaml_backend
+import manifest_scanner
+import yaml_patch
+from api_rules import RuleIndex, UnsupportedShape, default_rules, load_rules, migrate_ingress_v1
+from incremental import MigrationState
+from manifest_renderer import is_chart_template
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# rewrite: write re-serialized *.migrated copies; in-place: patch the inputs, changing only
+# the migrated nodes; diff: write unified diffs of those patches (*.patch) to the output dir
+MODES = ("rewrite", "in-place", "diff")
 
 class KubernetesAPIMigrator:
     """Migrate deprecated Kubernetes API versions to their current equivalents."""
     
-    # Mapping of deprecated API versions to their current equivalents
-    API_MIGRATIONS = {
-        # Deployments and other apps resources
-        "extensions/v1beta1": {
-            "Deployment": "apps/v1",
-            "DaemonSet": "apps/v1", 
-            "ReplicaSet": "apps/v1",
-            "StatefulSet": "apps/v1",
-            "Ingress": "networking.k8s.io/v1"
-        },
-        # Network Policies
-        "networking.k8s.io/v1beta1": {
-            "NetworkPolicy": "networking.k8s.io/v1"
-        },
-        # RBAC
-        "rbac.authorization.k8s.io/v1beta1": {
-            "ClusterRole": "rbac.authorization.k8s.io/v1",
-            "ClusterRoleBinding": "rbac.authorization.k8s.io/v1",
-            "Role": "rbac.authorization.k8s.io/v1",
-            "RoleBinding": "rbac.authorization.k8s.io/v1"
-        },
-        # Storage
-        "storage.k8s.io/v1beta1": {
-            "StorageClass": "storage.k8s.io/v1",
-            "CSIDriver": "storage.k8s.io/v1",
-            "CSINode": "storage.k8s.io/v1"
-        },
-        # Admission
-        "admissionregistration.k8s.io/v1beta1": {
-            "MutatingWebhookConfiguration": "admissionregistration.k8s.io/v1",
-            "ValidatingWebhookConfiguration": "admissionregistration.k8s.io/v1"
-        }
-    }
-    
-    def __init__(self, output_dir: str = "output"):
+    # Mapping of deprecated API versions to their current equivalents and their
+    # lifecycle (deprecated-in, removed-in, replacement-available-in), compiled
+    # from api_rules.yaml. Kept for callers that used the original tables.
+    API_MIGRATIONS = default_rules().migration_table()
+    API_LIFECYCLE = default_rules().lifecycle_table()
+    
+    def __init__(self, output_dir: str = "output", rules: Optional[RuleIndex] = None, incremental: bool = False,
+                 mode: str = "rewrite"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}', expected one of {', '.join(MODES)}")
+        self.mode = mode
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
+        self.rules = rules if rules is not None else default_rules()
         self.migration_log = []
+        # With incremental mode, inputs unchanged since the last run reuse their previous result
+        self.state = MigrationState(output_dir) if incremental else None
+        self.fingerprint = f"yaml-migrator;rules={self.rules.version}" + (f";mode={mode}" if mode != "rewrite" else "")
     
-    def migrate_yaml_file(self, input_file: str) -> Tuple[bool, str]:
+    def migrate_yaml_file(self, input_file: str, output_file: Optional[str] = None) -> Tuple[bool, str]:
         """Migrate a single YAML file and return success status and output path."""
+        previous = self._previous_result(input_file, output_file)
+        if previous:
+            return previous["success"], previous["message"]
+        
+        success, message, output = self._migrate_file(input_file, output_file)
+        self._record_result(input_file, output_file, success, message, output)
+        return success, message
+    
+    def output_name(self, input_path: Path) -> str:
+        """File name of the output written for an input in the current mode."""
+        if self.mode == "diff":
+            return f"{input_path.name}.patch"
+        return f"{input_path.stem}.migrated{input_path.suffix}"
+    
+    def _output_path(self, input_path: Path, output_file: Optional[str]) -> Path:
+        if self.mode == "in-place":
+            return input_path
+        if output_file is None:
+            return self.output_dir / self.output_name(input_path)
+        return Path(output_file)
+    
+    def _result_fingerprint(self, input_file: str, output_file: Optional[str]) -> str:
+        # The same input migrated to a different output path is a different result
+        return f"{self.fingerprint};output={self._output_path(Path(input_file), output_file)}"
+    
+    def _previous_result(self, input_file: str, output_file: Optional[str]) -> Optional[Dict]:
+        if self.state is None:
+            return None
+        previous = self.state.lookup(input_file, self._result_fingerprint(input_file, output_file))
+        if previous:
+            self.migration_log.append(f"⏭️ Unchanged since last run: {input_file}")
+        return previous
+    
+    def _record_result(self, input_file: str, output_file: Optional[str], success: bool, message: str,
+                       output: Optional[str]) -> None:
+        if self.state is not None:
+            self.state.record(input_file, self._result_fingerprint(input_file, output_file),
+                              success, message, [output] if output else [])
+    
+    def save_state(self) -> None:
+        """Persist the incremental state file (no-op unless incremental mode is on)."""
+        if self.state is not None:
+            self.state.save()
+    
+    def _migrate_file(self, input_file: str, output_file: Optional[str] = None) -> Tuple[bool, str, Optional[str]]:
+        """Migrate one file and return success, message and the output path if one was written."""
         try:
             input_path = Path(input_file)
             if not input_path.exists():
-                return False, f"Input file not found: {input_file}"
+                return False, f"Input file not found: {input_file}", None
             
-            # Read the YAML file
-            with open(input_path, 'r') as f:
-                content = f.read()
+            # Cheap line scan first: files without deprecated apiVersions are not parsed at all
+            if not manifest_scanner.file_needs_parse(input_path, self.rules.keys):
+                return True, f"No migrations needed for {input_file}", None
             
-            # Split into multiple documents if it's a multi-doc YAML
-            documents = list(yaml.safe_load_all(content))
+            if self.mode != "rewrite":
+                return self._patch_file(input_path, self._output_path(input_path, output_file))
             
-            migrated_docs = []
-            changes_made = False
+            output_file = self._output_path(input_path, output_file)
+            output_file.parent.mkdir(parents=True, exist_ok=True)
             
-            for doc in documents:
-                if doc is None:
-                    continue
-                    
-                migrated_doc, doc_changed = self._migrate_document(doc)
-                migrated_docs.append(migrated_doc)
-                if doc_changed:
-                    changes_made = True
-            
-            if not changes_made:
-                return True, f"No migrations needed for {input_file}"
-            
-            # Write migrated content to output directory
-            output_file = self.output_dir / f"{input_path.stem}.migrated{input_path.suffix}"
-            with open(output_file, 'w') as f:
-                yaml.dump_all(migrated_docs, f, default_flow_style=False, sort_keys=False)
+            # Stream documents from the input to a temp file one at a time, so memory
+            # is bounded by the largest document rather than the whole file
+            tmp_file = output_file.with_name(f".{output_file.name}.{os.getpid()}.tmp")
+            try:
+                with open(input_path, 'r') as src, open(tmp_file, 'w') as dst:
+                    changes_made = self._migrate_stream(src, dst)
+                
+                if not changes_made:
+                    return True, f"No migrations needed for {input_file}", None
+                
+                os.replace(tmp_file, output_file)
+            finally:
+                tmp_file.unlink(missing_ok=True)
             
             self.migration_log.append(f"✅ Migrated: {input_file} -> {output_file}")
-            return True, str(output_file)
+            return True, str(output_file), str(output_file)
             
         except Exception as e:
             error_msg = f"Error migrating {input_file}: {str(e)}"
             self.migration_log.append(f"❌ {error_msg}")
-            return False, error_msg
+            return False, error_msg, None
+    
+    def _patch_file(self, input_path: Path, output_path: Path) -> Tuple[bool, str, Optional[str]]:
+        """Patch mode: edit only the migrated nodes, in place or as a unified diff."""
+        # newline='' keeps CRLF line endings, so untouched bytes really stay untouched
+        with open(input_path, 'r', newline='') as f:
+            text = f.read()
+        edits = yaml_patch.patch_text(text, self.rules.keys, self._migrate_document)
+        if not edits:
+            return True, f"No migrations needed for {input_path}", None
+        
+        if self.mode == "in-place":
+            content = yaml_patch.apply_edits(text, edits)
+        else:
+            # Paths relative to the working directory, so `git apply` works from there
+            display = Path(os.path.relpath(input_path.resolve())).as_posix()
+            if display.startswith("../"):
+                display = input_path.resolve().as_posix().lstrip("/")
+            content = yaml_patch.unified_diff(text, edits, display)
+        
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = output_path.with_name(f".{output_path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_file, 'w', newline='') as f:
+                f.write(content)
+            if self.mode == "in-place":
+                shutil.copymode(input_path, tmp_file)
+            os.replace(tmp_file, output_path)
+        finally:
+            tmp_file.unlink(missing_ok=True)
+        
+        action = "Patched in place" if self.mode == "in-place" else "Diff written"
+        self.migration_log.append(f"✅ {action}: {input_path} -> {output_path} ({len(edits)} edits)")
+        return True, str(output_path), str(output_path)
+    
+    def migrate_text(self, text: str) -> Optional[str]:
+        """Migrate YAML held in memory; returns the migrated text, or None if nothing changed."""
+        if self.mode != "rewrite":
+            # Only the migrated nodes change, the rest of the text is kept as is
+            edits = yaml_patch.patch_text(text, self.rules.keys, self._migrate_document)
+            return yaml_patch.apply_edits(text, edits) if edits else None
+        if not any(document.needs_parse(self.rules.keys)
+                   for document in manifest_scanner.scan_documents(text.splitlines(keepends=True))):
+            return None
+        migrated = io.StringIO()
+        return migrated.getvalue() if self._migrate_stream(io.StringIO(text), migrated) else None
+    
+    def iter_migrated_documents(self, stream) -> Iterator[Tuple[Dict, bool]]:
+        """Lazily parse and migrate documents from a YAML stream, yielding (doc, changed)."""
+        for doc in yaml_backend.safe_load_all(stream):
+            if doc is None:
+                continue
+            yield self._migrate_document(doc)
+    
+    def _migrate_stream(self, src, dst) -> bool:
+        """
+        Migrate documents from `src` to `dst` one at a time and return whether anything changed.
+        Only the documents flagged by the line scanner are parsed, and only the migrated ones are
+        re-serialized; every other document is copied through verbatim.
+        """
+        changes_made = False
+        after_content = False
+        for document in manifest_scanner.scan_documents(src, lossless=True):
+            migrated = self._migrate_scanned(document.text) if document.needs_parse(self.rules.keys) else None
+            if migrated is None:
+                dst.write(document.text)
+            else:
+                head, tail = manifest_scanner.document_frame(document.text)
+                if after_content and not any(line.startswith("---") for line in head.splitlines()):
+                    # The separator was on a line that is re-serialized (`--- !tag ...`)
+                    dst.write("---\n")
+                dst.write(head + migrated + tail)
+                changes_made = True
+            after_content = after_content or document.api_version is not None or document.kind is not None \
+                or not document.plain
+        return changes_made
+    
+    def _migrate_scanned(self, text: str) -> Optional[str]:
+        """Re-serialized text of one scanned document, or None if nothing in it changed."""
+        results = list(self.iter_migrated_documents(text))
+        if not any(changed for _, changed in results):
+            return None
+        migrated = io.StringIO()
+        for position, (doc, _) in enumerate(results):
+            yaml_backend.dump(doc, migrated, explicit_start=position > 0, default_flow_style=False, sort_keys=False)
+        return migrated.getvalue()
     
     def _migrate_document(self, doc: Dict) -> Tuple[Dict, bool]:
         """Migrate a single YAML document and return the migrated doc and whether changes were made."""
@@ -100,59 +220,93 @@ class KubernetesAPIMigrator:
         if not api_version or not kind:
             return doc, False
         
-        # Check if this API version needs migration
-        for deprecated_version, migrations in self.API_MIGRATIONS.items():
-            if api_version == deprecated_version and kind in migrations:
-                new_api_version = migrations[kind]
-                doc['apiVersion'] = new_api_version
-                
-                # Handle special cases for different resource types
-                if kind == "Ingress" and new_api_version == "networking.k8s.io/v1":
-                    doc = self._migrate_ingress_v1(doc)
-                
-                self.migration_log.append(f"  🔄 {kind}: {api_version} -> {new_api_version}")
-                return doc, True
+        # O(1) lookup in the compiled rule index
+        rule = self.rules.lookup(api_version, kind)
+        if rule is None:
+            return doc, False
         
-        return doc, False
+        try:
+            doc = rule.apply(doc)
+        except UnsupportedShape as e:
+            name = (doc.get('metadata') or {}).get('name', '')
+            self.migration_log.append(f"  ⚠️ {kind} {name}: left unchanged, needs manual migration ({str(e)})")
+            return doc, False
+        self.migration_log.append(f"  🔄 {kind}: {api_version} -> {rule.replacement}")
+        return doc, True
     
     def _migrate_ingress_v1(self, ingress: Dict) -> Dict:
         """Handle special migration for Ingress v1 (adds required pathType)."""
-        if 'spec' in ingress and 'rules' in ingress['spec']:
-            for rule in ingress['spec']['rules']:
-                if 'http' in rule and 'paths' in rule['http']:
-                    for path in rule['http']['paths']:
-                        # Add pathType if not present (required in v1)
-                        if 'pathType' not in path:
-                            path['pathType'] = 'Prefix'
-                        
-                        # Update backend structure
-                        if 'backend' in path and 'serviceName' in path['backend']:
-                            # Convert old backend format to new
-                            old_backend = path['backend']
-                            path['backend'] = {
-                                'service': {
-                                    'name': old_backend['serviceName'],
-                                    'port': {
-                                        'number': old_backend.get('servicePort', 80)
-                                    }
-                                }
-                            }
-        
-        return ingress
+        return migrate_ingress_v1(ingress)
     
-    def migrate_directory(self, input_dir: str) -> List[str]:
-        """Migrate all YAML files in a directory."""
+    def migrate_directory(self, input_dir: str, recursive: bool = False, workers: int = 1) -> List[str]:
+        """
+        Migrate all YAML files in a directory.
+
+        With `recursive` nested directories are included and outputs mirror the
+        input tree under the output directory. With `workers` > 1 files are
+        migrated in a process pool; results and log entries are still merged
+        in sorted file order.
+        """
         input_path = Path(input_dir)
         if not input_path.exists():
             return [f"Directory not found: {input_dir}"]
         
-        yaml_files = list(input_path.glob("*.yaml")) + list(input_path.glob("*.yml"))
-        results = []
+        if recursive:
+            # Don't pick up our own outputs when the output dir is inside the input tree
+            output_root = self.output_dir.resolve()
+            yaml_files = [
+                yaml_file for yaml_file in sorted(input_path.rglob("*.yaml")) + sorted(input_path.rglob("*.yml"))
+                if output_root not in yaml_file.resolve().parents
+            ]
+        else:
+            yaml_files = sorted(input_path.glob("*.yaml")) + sorted(input_path.glob("*.yml"))
+        # Helm templates aren't YAML until rendered; their deprecated APIs are reported by detection
+        templates = [yaml_file for yaml_file in yaml_files if is_chart_template(yaml_file)]
+        if templates:
+            yaml_files = [yaml_file for yaml_file in yaml_files if yaml_file not in templates]
+            self.migration_log.append(f"⏭️ Skipped {len(templates)} Helm chart template(s), they are not plain YAML")
         
+        tasks = []
         for yaml_file in yaml_files:
-            success, message = self.migrate_yaml_file(str(yaml_file))
+            output_file = None
+            if recursive:
+                relative = yaml_file.relative_to(input_path)
+                output_file = str(self.output_dir / relative.parent / self.output_name(yaml_file))
+            tasks.append((str(self.output_dir), str(yaml_file), output_file, self.rules, self.mode))
+        
+        # Unchanged files are resolved from the state file before anything is dispatched
+        outcomes = {}
+        pending = []
+        for task in tasks:
+            previous = self._previous_result(task[1], task[2])
+            if previous:
+                outcomes[task[1]] = (previous["message"], [])
+            else:
+                pending.append(task)
+        
+        if workers > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # map() yields in submission order, which keeps the merge deterministic
+                chunksize = max(1, len(pending) // (workers * 8))
+                for task, (success, message, output, log_entries) in zip(
+                        pending, executor.map(_migrate_file_task, pending, chunksize=chunksize)):
+                    self._record_result(task[1], task[2], success, message, output)
+                    outcomes[task[1]] = (message, log_entries)
+        else:
+            for task in pending:
+                log_start = len(self.migration_log)
+                success, message, output = self._migrate_file(task[1], task[2])
+                self._record_result(task[1], task[2], success, message, output)
+                outcomes[task[1]] = (message, self.migration_log[log_start:])
+                del self.migration_log[log_start:]
+        
+        results = []
+        for task in tasks:
+            message, log_entries = outcomes[task[1]]
             results.append(message)
+            self.migration_log.extend(log_entries)
         
+        self.save_state()
         return results
     
     def get_migration_summary(self) -> str:
@@ -162,25 +316,46 @@ class KubernetesAPIMigrator:
         
         return "\n".join(self.migration_log)
 
+def _migrate_file_task(task: Tuple[str, str, Optional[str], RuleIndex, str]) -> Tuple[bool, str, Optional[str], List[str]]:
+    """Process pool entry point: migrate one file with a fresh migrator and return its log."""
+    output_dir, input_file, output_file, rules, mode = task
+    migrator = KubernetesAPIMigrator(output_dir, rules, mode=mode)
+    success, message, output = migrator._migrate_file(input_file, output_file)
+    return success, message, output, migrator.migration_log
+
 def main():
     parser = argparse.ArgumentParser(description="Migrate deprecated Kubernetes API versions in YAML files")
     parser.add_argument("input", help="Input YAML file or directory")
     parser.add_argument("--output-dir", "-o", default="output", help="Output directory (default: output)")
     parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+    parser.add_argument("--recursive", "-r", action="store_true", help="Include nested directories")
+    parser.add_argument("--rules", help="Rules file (default: bundled api_rules.yaml or K8S_API_RULES_FILE)")
+    parser.add_argument("--workers", "-j", type=int, default=1, help="Worker processes for directory migration (default: 1)")
+    parser.add_argument("--incremental", "-i", action="store_true", help="Skip inputs unchanged since the last run into the same output directory")
+    parser.add_argument("--mode", "-m", choices=MODES, default="rewrite",
+                        help="rewrite: write re-serialized *.migrated copies (default); in-place: edit only the "
+                             "migrated lines of the inputs, keeping comments and formatting; diff: write those "
+                             "edits as *.patch files")
     
     args = parser.parse_args()
     
-    migrator = KubernetesAPIMigrator(args.output_dir)
+    try:
+        rules = load_rules(args.rules) if args.rules else None
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 1
+    migrator = KubernetesAPIMigrator(args.output_dir, rules, args.incremental, args.mode)
     
     input_path = Path(args.input)
     
     if input_path.is_file():
         # Migrate single file
         success, message = migrator.migrate_yaml_file(args.input)
+        migrator.save_state()
         print(message)
     elif input_path.is_dir():
         # Migrate all YAML files in directory
-        results = migrator.migrate_directory(args.input)
+        results = migrator.migrate_directory(args.input, args.recursive, args.workers)
         for result in results:
             print(result)
     else:
@@ -191,6 +366,7 @@ def main():
         print("\n" + "="*50)
         print("MIGRATION SUMMARY:")
         print("="*50)
+        print(f"YAML backend: {yaml_backend.BACKEND}, rules version: {migrator.rules.version}")
         print(migrator.get_migration_summary())
     
     return 0
@@ -0,0 +1,290 @@
+"""
+Round-trip preserving YAML patching.
+
+Instead of re-serializing migrated documents, the changes are computed against the
+composed node tree, whose marks give the character offsets of every node, and turned
+into minimal text edits: a changed `apiVersion` scalar is replaced in place, added keys
+are inserted after their siblings, removed keys lose their lines. Comments, anchors,
+quoting and key order of everything else stay byte-for-byte identical, and documents
+without deprecated APIs are not even parsed.
+"""
+import copy
+import difflib
+import re
+from typing import AbstractSet, Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+import yaml
+import yaml_backend
+import manifest_scanner
+
+# Long lines must not be folded when a value is serialized
+_DUMP_WIDTH = 4096
+_HUNK_RE = re.compile(r"^@@ -(\d+)(,\d+)? \+(\d+)(,\d+)? @@")
+
+
+class Edit(NamedTuple):
+    """Replace text[start:end] with `text` (start == end inserts)."""
+    start: int
+    end: int
+    text: str
+
+
+class _Unpatchable(Exception):
+    """A change can't be expressed as an edit of this node; the parent node is replaced instead."""
+
+
+def _scalar_text(value: Any, style: Optional[str] = None) -> str:
+    if isinstance(value, str) and style == '"':
+        return '"' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+    if isinstance(value, str) and style == "'" and "\n" not in value:
+        return "'" + value.replace("'", "''") + "'"
+    # A one-element flow sequence gives the scalar with whatever quoting it needs
+    return yaml_backend.dump([value], default_flow_style=True, width=_DUMP_WIDTH).strip()[1:-1]
+
+
+def _flow_text(value: Any) -> str:
+    return yaml_backend.dump(value, default_flow_style=True, width=_DUMP_WIDTH).strip()
+
+
+def _block_lines(value: Any) -> List[str]:
+    return yaml_backend.dump(value, width=_DUMP_WIDTH).rstrip("\n").split("\n")
+
+
+class _DocumentPatcher:
+    """Computes the edits turning one composed document into its migrated value."""
+
+    def __init__(self, text: str, offset: int, newline: str = "\n"):
+        self.text = text
+        self.offset = offset
+        # Inserted lines use the file's own line endings, so CRLF files stay CRLF
+        self.newline = newline
+        self.edits: List[Edit] = []
+        self._aliased: Set[int] = set()
+
+    def _count_nodes(self, node, seen: Dict[int, int]) -> None:
+        seen[id(node)] = seen.get(id(node), 0) + 1
+        if seen[id(node)] > 1:
+            # An alias: the node's marks belong to the anchor, not to this use
+            self._aliased.add(id(node))
+            return
+        if isinstance(node, yaml.MappingNode):
+            for key, value in node.value:
+                self._count_nodes(key, seen)
+                self._count_nodes(value, seen)
+        elif isinstance(node, yaml.SequenceNode):
+            for item in node.value:
+                self._count_nodes(item, seen)
+
+    def _edit(self, start: int, end: int, text: str) -> None:
+        self.edits.append(Edit(self.offset + start, self.offset + end, text))
+
+    def _end(self, node) -> int:
+        """End of the node's own text; block collections end at their last leaf, not at the next token."""
+        if id(node) in self._aliased:
+            raise _Unpatchable("aliased node")
+        if isinstance(node, yaml.ScalarNode) and node.style in ("|", ">"):
+            # Block scalars end after their trailing line breaks
+            end = node.end_mark.index
+            while end > node.start_mark.index and self.text[end - 1] in "\r\n":
+                end -= 1
+            return end
+        if isinstance(node, yaml.ScalarNode) or node.flow_style or not node.value:
+            return node.end_mark.index
+        last = node.value[-1]
+        return self._end(last[1] if isinstance(node, yaml.MappingNode) else last)
+
+    def _line_start(self, index: int) -> int:
+        return self.text.rfind("\n", 0, index) + 1
+
+    def _line_end(self, index: int) -> int:
+        end = self.text.find("\n", index)
+        return len(self.text) if end < 0 else end
+
+    def diff(self, node, old: Any, new: Any) -> None:
+        if type(old) is type(new) and old == new:
+            return
+        if id(node) in self._aliased:
+            # Editing the anchor would also change every other alias of it
+            raise _Unpatchable("aliased node")
+
+        mark = len(self.edits)
+        try:
+            if isinstance(node, yaml.MappingNode) and isinstance(old, dict) and isinstance(new, dict) \
+                    and not node.flow_style:
+                return self._diff_mapping(node, old, new)
+            if isinstance(node, yaml.SequenceNode) and isinstance(old, list) and isinstance(new, list) \
+                    and not node.flow_style and len(old) == len(new):
+                for item, old_item, new_item in zip(node.value, old, new):
+                    self.diff(item, old_item, new_item)
+                return
+        except _Unpatchable:
+            del self.edits[mark:]
+        self._replace(node, new)
+
+    def _diff_mapping(self, node, old: Dict, new: Dict) -> None:
+        # Keys are matched to node pairs by position, which needs plain unique keys (no merge keys)
+        if len(node.value) != len(old) or any(
+                not isinstance(key, yaml.ScalarNode) or key.tag == "tag:yaml.org,2002:merge" for key, _ in node.value):
+            raise _Unpatchable("complex mapping")
+
+        pairs = list(zip(old, node.value))
+        deleted = [(key_node, value_node) for key, (key_node, value_node) in pairs if key not in new]
+        added = {key: value for key, value in new.items() if key not in old}
+        for key, (_, value_node) in pairs:
+            if key in new:
+                self.diff(value_node, old[key], new[key])
+
+        column = node.value[0][0].start_mark.column
+        added_lines = [" " * column + line for line in _block_lines(added)] if added else []
+        for position, (key_node, value_node) in enumerate(deleted):
+            start = self._line_start(key_node.start_mark.index)
+            if self.text[start:key_node.start_mark.index].strip():
+                # First key of a sequence item (`- key: ...`): its line can't be dropped
+                raise _Unpatchable("key shares its line")
+            end = min(self._line_end(self._end(value_node)) + 1, len(self.text))
+            # Added keys take the place of the first removed one (spec.backend -> spec.defaultBackend)
+            replacement = self.newline.join(added_lines) + self.newline if position == 0 and added_lines else ""
+            self._edit(start, end, replacement)
+        if added_lines and not deleted:
+            # New keys go on their own lines after the last value (and after edits ending on its line)
+            end = self._line_end(self._end(node.value[-1][1]))
+            if end < len(self.text):
+                self._edit(end + 1, end + 1, self.newline.join(added_lines) + self.newline)
+            else:
+                self._edit(end, end, self.newline + self.newline.join(added_lines))
+
+    def _replace(self, node, new: Any) -> None:
+        start, end = node.start_mark.index, self._end(node)
+        if isinstance(node, yaml.ScalarNode):
+            text = _scalar_text(new, node.style) if not isinstance(new, (dict, list)) else _flow_text(new)
+        elif node.flow_style or not isinstance(new, (dict, list)) or not new:
+            text = _flow_text(new) if isinstance(new, (dict, list)) else _scalar_text(new)
+        else:
+            # Block collection: continuation lines are indented to the node's own column
+            lines = _block_lines(new)
+            text = self.newline.join(lines[:1] + [" " * node.start_mark.column + line for line in lines[1:]])
+        self._edit(start, end, text)
+
+    def patch(self, node, old: Any, new: Any) -> None:
+        self._count_nodes(node, {})
+        try:
+            self.diff(node, old, new)
+        except _Unpatchable:
+            # Last resort for this document only: re-serialize it in place
+            self.edits = []
+            self._edit(node.start_mark.index, self._end_of_document(node),
+                       self.newline.join(_block_lines(new)))
+
+    def _end_of_document(self, node) -> int:
+        try:
+            return self._end(node)
+        except _Unpatchable:
+            return len(self.text.rstrip())
+
+
+def patch_text(text: str, index: AbstractSet[Tuple[str, str]],
+               migrate_document: Callable[[Any], Tuple[Any, bool]]) -> List[Edit]:
+    """
+    Return the edits that migrate a YAML stream. `migrate_document(doc)` returns the
+    migrated document and whether it changed (it may modify `doc`). Only documents whose
+    headers match `index` are parsed; the others are skipped without parsing.
+    """
+    edits: List[Edit] = []
+    position = 0
+    # Split on \n only, like reading the file would (splitlines also breaks on \x0c, \u2028...)
+    lines = [line + "\n" for line in text.split("\n")]
+    lines[-1] = lines[-1][:-1]
+    newline = "\r\n" if "\r\n" in text else "\n"
+    for document in manifest_scanner.scan_documents(lines):
+        offset = text.find(document.text, position)
+        position = offset + len(document.text)
+        if not document.needs_parse(index):
+            continue
+        nodes = list(yaml.compose_all(document.text, Loader=yaml_backend.Loader))
+        values = list(yaml_backend.safe_load_all(document.text))
+        for node, value in zip(nodes, values):
+            if node is None or not isinstance(value, dict):
+                continue
+            migrated, changed = migrate_document(copy.deepcopy(value))
+            if changed:
+                patcher = _DocumentPatcher(document.text, offset, newline)
+                patcher.patch(node, value, migrated)
+                edits.extend(patcher.edits)
+    return edits
+
+
+def apply_edits(text: str, edits: List[Edit]) -> str:
+    """Apply non-overlapping edits; only the edited ranges are rebuilt."""
+    pieces = []
+    position = 0
+    for edit in sorted(edits):
+        if edit.start < position:
+            raise ValueError(f"Overlapping edits at offset {edit.start}")
+        pieces.append(text[position:edit.start])
+        pieces.append(edit.text)
+        position = edit.end
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+
+def unified_diff(text: str, edits: List[Edit], path: str, context: int = 3) -> str:
+    """
+    Unified diff (git apply compatible) of the edits, built directly from the edited line
+    ranges instead of comparing the whole files, so its cost follows the number of edits.
+    """
+    if not edits:
+        return ""
+    line_starts = [0]
+    search = 0
+    while True:
+        newline = text.find("\n", search)
+        if newline < 0:
+            break
+        line_starts.append(newline + 1)
+        search = newline + 1
+    if line_starts[-1] == len(text):
+        line_starts.pop()
+    total = len(line_starts)
+
+    def line_of(index: int) -> int:
+        low, high = 0, total - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if line_starts[middle] <= index:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def lines_text(first: int, last: int) -> str:
+        end = line_starts[last + 1] if last + 1 < total else len(text)
+        return text[line_starts[first]:end]
+
+    # Group edits whose line ranges (plus context) touch into hunks
+    groups: List[Tuple[int, int, List[Edit]]] = []
+    for edit in sorted(edits):
+        first = line_of(edit.start)
+        last = line_of(max(edit.start, edit.end - 1)) if edit.end > edit.start else first
+        if groups and first - groups[-1][1] <= 2 * context:
+            groups[-1] = (groups[-1][0], max(groups[-1][1], last), groups[-1][2] + [edit])
+        else:
+            groups.append((first, last, [edit]))
+
+    output = [f"--- a/{path}\n", f"+++ b/{path}\n"]
+    shift = 0
+    for first, last, group in groups:
+        first, last = max(0, first - context), min(total - 1, last + context)
+        old_block = lines_text(first, last)
+        base = line_starts[first]
+        new_block = apply_edits(old_block, [Edit(e.start - base, e.end - base, e.text) for e in group])
+        old_lines, new_lines = old_block.splitlines(keepends=True), new_block.splitlines(keepends=True)
+        # difflib only ever sees this small block; its line numbers are shifted to the file's
+        for line in list(difflib.unified_diff(old_lines, new_lines, n=context))[2:]:
+            header = _HUNK_RE.match(line)
+            if header:
+                old_start, old_count, new_start, new_count = header.groups()
+                output.append(f"@@ -{int(old_start) + first}{old_count or ''} "
+                              f"+{int(new_start) + first + shift}{new_count or ''} @@\n")
+            else:
+                output.append(line if line.endswith("\n") else line + "\n\\ No newline at end of file\n")
+        shift += len(new_lines) - len(old_lines)
+    return "".join(output)